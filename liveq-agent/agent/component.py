@@ -55,6 +55,10 @@ class AgentComponent(Component):
 		self.jobIndex = { }
 		self.runtimeConfig = { }
 
+		# Partial job data updates are enabled when the job
+		# manager acknowledges that it supports them
+		self.partialUpdates = False
+
 		# Create a JobManagers class which is going to take care of
 		# the abstraction and the load-balancing of the I/O between
 		# the agent and the job managers.
@@ -64,9 +68,11 @@ class AgentComponent(Component):
 		self.jobmanagers.on('job_start', self.cmdJobStart)
 		self.jobmanagers.on('job_cancel', self.cmdJobCancel)
 		self.jobmanagers.on('agent_control', self.cmdAgentControl)
+		self.jobmanagers.on('job_resync', self.cmdJobResync)
 
 		# Setup tool callbacks for the jobmanagers
 		self.jobmanagers.handshakeFn(self.sendHandshake)
+		self.jobmanagers.handshakeResponseFn(self.onHandshakeResponse)
 
 	def getPublicIP(self):
 		"""
@@ -106,6 +112,20 @@ class AgentComponent(Component):
 			# There was an error, switch to retry state
 			self.logger.warn("Error while sending request: %s" % str(e))
 
+	def onHandshakeResponse(self, message):
+		"""
+		Handshake with the job managers completed
+		"""
+
+		# Check if the job manager accepts partial updates
+		self.partialUpdates = bool(message.get('partial', False))
+
+		# The job manager might have lost track of our data,
+		# so start over with full updates
+		for jobapp in self.jobIndex.values():
+			jobapp.partialUpdates = self.partialUpdates
+			jobapp.requestFullUpdate()
+
 	def _replyError(self, message):
 		"""
 		Shorthand function to reply with an error message
@@ -177,6 +197,8 @@ class AgentComponent(Component):
 				# Save some extra info on the jobapp
 				jobapp.slot = k
 				jobapp.jobid = jid
+				jobapp.sequence = 0
+				jobapp.partialUpdates = self.partialUpdates
 
 				# Reserve slot & store on index
 				self.slots[k] = jobapp
@@ -253,7 +275,29 @@ class AgentComponent(Component):
 		# Kill job
 		job.kill()
 
-	def onAppJobData(self, final, data, app=None):
+	def cmdJobResync(self, message):
+		"""
+		Bus message arrived requesting the full data of a running job
+		"""
+		jid = None
+
+		# Get job ID
+		try:
+			jid = str(message['jid'])
+		except KeyError as e:
+			self.logger.warn("Could not find key %s in job_resync message" % str(e))
+			return
+
+		# Check if we don't have such job
+		if not jid in self.jobIndex:
+			self.logger.warn("Could not find any job with id %s to resync" % jid)
+			return
+
+		# Send the full data on the next update
+		self.logger.info("Resyncing data for job %s" % jid)
+		self.jobIndex[jid].requestFullUpdate()
+
+	def onAppJobData(self, final, data, partial=False, app=None):
 		"""
 		Callback from the application when the data are available
 		"""
@@ -272,12 +316,18 @@ class AgentComponent(Component):
 			# Exit
 			return
 
+		# Sequence number of the data frame, used by the job
+		# manager to detect lost partial updates
+		app.sequence += 1
+
 		# Forward message to the server channel
-		self.logger.info("Sending job data for job %s" % app.jobid)
+		self.logger.info("Sending job data for job %s (seq=%i, partial=%s)" % (app.jobid, app.sequence, str(partial)))
 		self.jobmanagers.send('job_data', {
 				'jid': app.jobid,
 				'final': final,
-				'data': data
+				'data': data,
+				'seq': app.sequence,
+				'partial': partial
 			})
 
 	def onAppJobCompleted(self, app=None):
@@ -23,6 +23,9 @@ from liveq.config import configexceptions
 from liveq.config.core import CoreConfig, StaticConfig
 from liveq.config.externalbus import ExternalBusConfig
 from liveq.config.apps import AppConfig
+from liveq.exceptions import ConfigException
+from liveq.data.histo import compression
+from liveq.data.histo.intermediate import IntermediateHistogramCollection
 
 """
 Local configuration for the agent
@@ -33,12 +36,23 @@ class AgentConfig:
 	AGENT_SLOTS = 1
 	AGENT_GROUP = []
 
+	#: The compression codec for the histograms sent to the job manager
+	PACK_CODEC = "lzma"
+
 	@staticmethod
 	def fromConfig(config, runtimeConfig):
 
 		AgentConfig.SERVER_CHANNEL = config.get("agent", "server")
 		AgentConfig.AGENT_GROUP = config.get("agent", "group")
 		AgentConfig.AGENT_SLOTS = config.get("agent", "slots")
+		if config.has_option("agent", "codec"):
+			AgentConfig.PACK_CODEC = config.get("agent", "codec")
+
+		# Use the configured codec when packing histograms
+		try:
+			IntermediateHistogramCollection.CODEC = compression.getCodec( AgentConfig.PACK_CODEC )
+		except ValueError as e:
+			raise ConfigException(str(e))
 
 """
 Create a configuration for the JOB MANAGER based on the core config
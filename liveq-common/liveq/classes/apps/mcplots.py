@@ -45,7 +45,7 @@ from liveq.config.classes import AppConfigClass
 from liveq.exceptions import JobConfigException, JobInternalException, JobRuntimeException, IntegrityException, ConfigException
 from liveq.reporting.postmortem import PostMortem
 
-from liveq.data.histo.intermediate import IntermediateHistogramCollection
+from liveq.data.histo.intermediate import IntermediateHistogramCollection, IntermediateHistogramCache
 
 def run_and_get(args):
 	"""
@@ -74,6 +74,11 @@ class Config(AppConfigClass):
 		self.TUNE = config["tune"]
 		self.UPDATE_INTERVAL = int(config["update_interval"])
 
+		# Send a full update every that many partial updates
+		self.FULL_UPDATE_INTERVAL = 10
+		if "full_update_interval" in config:
+			self.FULL_UPDATE_INTERVAL = int(config["full_update_interval"])
+
 		# Validate parameters
 		if len(self.WORKDIR) == 0:
 			raise ConfigException("Invalid work dir in the application configuration")
@@ -104,6 +109,10 @@ class MCPlots(JobApplication):
 		self.trackingTime = 0
 		self.lastState = ""
 		self.state = STATE_ABORTED
+		self.histoCache = None
+		self.changedHistograms = set()
+		self.fullUpdate = True
+		self.partialCount = 0
 
 	##################################################################################
 	###
@@ -139,6 +148,12 @@ class MCPlots(JobApplication):
 		# Reset last state
 		self.lastState = ""
 
+		# Reset the cache of the intermediate histograms
+		self.histoCache = IntermediateHistogramCache( "%s/dump" % self.jobdir, state=1 )
+		self.changedHistograms = set()
+		self.fullUpdate = True
+		self.partialCount = 0
+
 		# Prepare post-mortem for the mcplots app
 		self.postmortem = PostMortem()
 
@@ -231,6 +246,12 @@ class MCPlots(JobApplication):
 		self.kill()
 		self.start()
 	
+	def requestFullUpdate(self):
+		"""
+		Send the full collection on the next intermediate update
+		"""
+		self.fullUpdate = True
+
 	def setConfig(self,config):
 		"""
 		Update instance configuration
@@ -420,6 +441,10 @@ class MCPlots(JobApplication):
 		self.trackingFile = None
 		self.trackingTime = 0
 
+		# Drop the cached histograms
+		if self.histoCache:
+			self.histoCache.clear()
+
 	def getState(self):
 		"""
 		Helper function to read the status.flag
@@ -436,13 +461,22 @@ class MCPlots(JobApplication):
 
 		return state
 
-	def readIntermediateHistograms(self):
+	def readIntermediateHistograms(self, partial=False):
 		"""
-		Helper function to read the histograms from the dump folder
+		Helper function to read the histograms from the dump folder.
+
+		Only the files modified since the previous call are parsed again and
+		the names of the histograms that changed are kept in changedHistograms.
+		If partial is True, only the changed histograms are returned.
 		"""
 
-		# Collect intermediate data
-		ih = IntermediateHistogramCollection.fromDirectory( "%s/dump" % self.jobdir, state=1 )
+		# Re-read only the modified files and keep track of the
+		# histograms changed since the previous call
+		self.changedHistograms = self.histoCache.scan()
+		if partial:
+			ih = self.histoCache.collection( self.changedHistograms )
+		else:
+			ih = self.histoCache.collection()
 
 		# If we are empty, return empty string
 		if len(ih) == 0:
@@ -533,11 +567,21 @@ class MCPlots(JobApplication):
 			# Every time the histogram timestamp is changed, send the updates to the server.
 			if ((self.state == STATE_RUNNING) or (self.state == STATE_COMPLETED)) and self.isDatasetModified():
 
+				# Send only the changed histograms if we are allowed to,
+				# unless a full update was requested or is due
+				partial = self.partialUpdates and (not self.fullUpdate) and \
+					(self.partialCount < self.config.FULL_UPDATE_INTERVAL)
+
 				# Fetch itermediate results from the job and send
 				# them to listeners
-				results = self.readIntermediateHistograms()
+				results = self.readIntermediateHistograms( partial )
 				if results:
-					self.trigger("job_data", False, results)
+					if partial:
+						self.partialCount += 1
+					else:
+						self.fullUpdate = False
+						self.partialCount = 0
+					self.trigger("job_data", False, results, partial)
 
 			# Runtime clock and CPU anti-hoging
 			time.sleep(1)
@@ -51,11 +51,12 @@ import threading
 import traceback
 import time
 import json
+import struct
 import cPickle as pickle
 import uuid
 
 from liveq.events import GlobalEvents
-from liveq.io.bus import BusChannelException, NoBusChannelException, BusChannel, Bus
+from liveq.io.bus import BusChannelException, NoBusChannelException, BusChannel, Bus, BinaryPayload
 from liveq.config.classes import BusConfigClass
 
 SYNC_TIMEOUT = 0.01
@@ -424,12 +425,78 @@ class AMQPBusChannel(BusChannel):
 			self.wait_queue[reply_uuid]['event'].set()
 
 
+	def _detachBinary(self, data, attachments):
+		"""
+		Replace every BinaryPayload in the given data with a reference
+		to the attachments list, where the buffer is moved
+		"""
+
+		# Move binary payloads to attachments
+		if isinstance(data, BinaryPayload):
+			attachments.append(data)
+			return { '__binary__': len(attachments)-1 }
+
+		# Walk containers
+		elif isinstance(data, dict):
+			return dict([ (k, self._detachBinary(v, attachments)) for k,v in data.iteritems() ])
+		elif isinstance(data, list) or isinstance(data, tuple):
+			return [ self._detachBinary(v, attachments) for v in data ]
+
+		# Everything else is passed as-is
+		return data
+
+	def _attachBinary(self, data, attachments):
+		"""
+		The reverse of _detachBinary(), placing the attachments back in the data
+		"""
+
+		# Walk containers, restoring attachment references
+		if isinstance(data, dict):
+			if (len(data) == 1) and ('__binary__' in data):
+				return attachments[ data['__binary__'] ]
+			return dict([ (k, self._attachBinary(v, attachments)) for k,v in data.iteritems() ])
+		elif isinstance(data, list):
+			return [ self._attachBinary(v, attachments) for v in data ]
+
+		# Everything else is passed as-is
+		return data
+
 	def _serialize(self, payload):
 		"""
 		Serialize the given payload and return a (payload, content_type) tuple
+
+		When serializing to JSON, the BinaryPayload buffers in the payload are
+		sent as raw attachments next to the JSON envelope:
+
+		+--------+-------------------------------------------+
+		|  uint  | Length of the JSON envelope               |
+		|  uint  | Number of attachments                     |
+		|  char* | The JSON envelope (UTF-8)                 |
+		+--------+-------------------------------------------+
+		/ Attachment (x Number of attachments)
+		+--------+-------------------------------------------+
+		|  uint  | Length of the attachment                  |
+		|  char* | The raw attachment buffer                 |
+		+--------+-------------------------------------------+
 		"""
 		if self.bus.config.SERIALIZER == "json":
-			return (json.dumps(payload, ensure_ascii=False), "application/json")
+
+			# Move binary payloads out of the JSON envelope
+			attachments = [ ]
+			payload = self._detachBinary( payload, attachments )
+			envelope = json.dumps(payload, ensure_ascii=False)
+			if not attachments:
+				return (envelope, "application/json")
+
+			# Build binary frame
+			if isinstance(envelope, unicode):
+				envelope = envelope.encode("utf-8")
+			parts = [ struct.pack("<II", len(envelope), len(attachments)), envelope ]
+			for buf in attachments:
+				parts.append( struct.pack("<I", len(buf)) )
+				parts.append( buf )
+			return ("".join(parts), "application/x-liveq-binary")
+
 		elif self.bus.config.SERIALIZER == "pickle":
 			return (pickle.dumps(payload), "application/python-pickle")
 		else:
@@ -442,6 +509,25 @@ class AMQPBusChannel(BusChannel):
 
 		if contentType == "application/json":
 			return json.loads(payload)
+		elif contentType == "application/x-liveq-binary":
+
+			# Read envelope
+			(lenEnvelope, numAttachments) = struct.unpack_from("<II", payload)
+			p = 8
+			data = json.loads( payload[p:p+lenEnvelope] )
+			p += lenEnvelope
+
+			# Read attachments
+			attachments = [ ]
+			for i in range(numAttachments):
+				(lenAttachment,) = struct.unpack_from("<I", payload, p)
+				p += 4
+				attachments.append( BinaryPayload(payload[p:p+lenAttachment]) )
+				p += lenAttachment
+
+			# Put attachments back in place
+			return self._attachBinary( data, attachments )
+
 		elif contentType == "application/python-pickle":
 			return pickle.loads(payload)
 		else:
@@ -36,7 +36,7 @@ import string
 import socket
 
 from liveq.events import GlobalEvents
-from liveq.io.bus import Bus, BusChannel, NoBusChannelException, BusChannelException
+from liveq.io.bus import Bus, BusChannel, NoBusChannelException, BusChannelException, textPayload
 from liveq.config.classes import BusConfigClass
 
 class Config(BusConfigClass):
@@ -290,7 +290,7 @@ class RabbitMQChannel(BusChannel):
 		data = {
 				'data': json.dumps({
 					'name': name,
-					'data': data
+					'data': textPayload(data)
 				}),
 				'id': mid,
 				'queue': self.qname
@@ -338,7 +338,7 @@ class RabbitMQChannel(BusChannel):
 		# Prepare data to send
 		data = {
 				'data': json.dumps({
-					'data': data
+					'data': textPayload(data)
 				}),
 				'id': self.replyID,
 				'queue': self.replyQueue
@@ -36,7 +36,7 @@ import string
 import socket
 
 from liveq.events import GlobalEvents
-from liveq.io.bus import Bus, BusChannel, NoBusChannelException, BusChannelException
+from liveq.io.bus import Bus, BusChannel, NoBusChannelException, BusChannelException, textPayload
 from liveq.config.classes import BusConfigClass
 
 class Config(BusConfigClass):
@@ -294,7 +294,7 @@ class RabbitMQChannel(BusChannel):
 		data = {
 				'data': json.dumps({
 					'name': name,
-					'data': data
+					'data': textPayload(data)
 				}),
 				'id': mid
 			}
@@ -39,7 +39,7 @@ from sleekxmpp.xmlstream.stanzabase import ElementBase
 from sleekxmpp.xmlstream import register_stanza_plugin
 
 from liveq.events import GlobalEvents
-from liveq.io.bus import Bus, BusChannel, NoBusChannelException, BusChannelException
+from liveq.io.bus import Bus, BusChannel, NoBusChannelException, BusChannelException, textPayload
 from liveq.config.core import StaticConfig
 from liveq.config.classes import BusConfigClass
 
@@ -149,7 +149,7 @@ class XMPPUserChannel(BusChannel):
 
 		# Store response data
 		if data:
-			response['liveq']['body'] = json.dumps(data)
+			response['liveq']['body'] = json.dumps(textPayload(data))
 
 		# Send and marked as replied
 		response.send()
@@ -169,7 +169,7 @@ class XMPPUserChannel(BusChannel):
 		# Populate body
 		msg = LiveQMessage()
 		msg['name'] = message
-		msg['body'] = json.dumps(data)
+		msg['body'] = json.dumps(textPayload(data))
 		iq.setPayload( msg )
 
 		# Send and wait for response
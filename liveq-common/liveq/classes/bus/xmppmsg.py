@@ -44,7 +44,7 @@ from sleekxmpp.xmlstream import register_stanza_plugin
 from sleekxmpp.xmlstream.scheduler import Task
 
 from liveq.events import GlobalEvents
-from liveq.io.bus import Bus, BusChannel, NoBusChannelException, BusChannelException
+from liveq.io.bus import Bus, BusChannel, NoBusChannelException, BusChannelException, textPayload
 from liveq.config.core import StaticConfig
 from liveq.config.classes import BusConfigClass
 
@@ -338,7 +338,7 @@ class XMPPUserChannel(BusChannel):
 		# Send response
 		self.lastMessage.reply(createMsg({
 				'id': self.replyID,
-				'data': data
+				'data': textPayload(data)
 			})).send()
 
 		# Mark conversation as responded
@@ -352,42 +352,83 @@ class XMPPUserChannel(BusChannel):
 		# If we are in shutdown lockdown, exit
 		if self.lockdown:
 			return
-		
-		# Prepare the message
-		mid = self._nextID()
-		message = createMsg({
-				'name': message,
-				'data': data,
-				'id': mid
-			})
 
-		self.logger.debug("[%s] Sending message: (%s) %s" % (self.jid, message, str(data)) )
+		# Just send the message
+		if not waitReply:
+			self._sendMessage(message, data)
+			return
 
-		# Send message
-		self.bus.send_message(mto=self.jid, mbody=message, mtype='headline')
+		# Send and wait for response
+		return self.collectReply( self.sendAsync(message, data), timeout )
 
-		# Check if we should wait for response
-		if waitReply:
-			self.logger.debug("[%s] Waiting for response on #%s" % (self.jid, mid) )
+	def sendAsync(self, message, data):
+		"""
+		Send a message on the bus without waiting for the response and return
+		the record to pass to collectReply()
+		"""
 
-			# Prepare the waiting queue field
-			event = threading.Event()
-			record = { "data": None, "event": event }
-			self.waitQueue[mid] = record
+		# If we are in shutdown lockdown, exit
+		if self.lockdown:
+			return None
 
-			# Lock on the event
-			event.wait(timeout)
+		# Prepare the waiting queue field before sending,
+		# so a fast response is not lost
+		mid = self._nextID()
+		record = { "id": mid, "data": None, "event": threading.Event() }
+		self.waitQueue[mid] = record
 
-			# Cleanup upon completion or timeout
+		# Send message
+		try:
+			self._sendMessage(message, data, mid)
+		except:
 			del self.waitQueue[mid]
+			raise
+
+		# Return the record
+		return record
+
+	def collectReply(self, record, timeout=30):
+		"""
+		Wait for the response to a message sent with sendAsync()
+		"""
+
+		# Nothing was sent
+		if record is None:
+			return None
+
+		# Lock on the event
+		self.logger.debug("[%s] Waiting for response on #%s" % (self.jid, record['id']) )
+		record['event'].wait(timeout)
+
+		# Cleanup upon completion or timeout
+		self.waitQueue.pop(record['id'], None)
+
+		# Check if we just timed out
+		if not record['event'].is_set():
+			self.logger.debug("[%s] Timeout waiting response on #%s" % (self.jid, record['id']) )
+			return None
+
+		# Return data
+		return record['data']
+
+	def _sendMessage(self, message, data, mid=None):
+		"""
+		Send a message stanza with the given ID (or the next one)
+		"""
+
+		# Prepare the message
+		if mid is None:
+			mid = self._nextID()
+		body = createMsg({
+				'name': message,
+				'data': textPayload(data),
+				'id': mid
+			})
 
-			# Check if we just timed out
-			if not event.is_set():
-				self.logger.debug("[%s] Timeout waiting response on #%s" % (self.jid, mid) )
-				return None
+		self.logger.debug("[%s] Sending message: (%s) %s" % (self.jid, body, str(data)) )
 
-			# Return data
-			return record['data']
+		# Send message
+		self.bus.send_message(mto=self.jid, mbody=body, mtype='headline')
 
 class XMPPBus(Bus, ClientXMPP):
 	"""
@@ -31,7 +31,7 @@ import zmq
 import time
 
 from liveq.events import GlobalEvents
-from liveq.io.bus import Bus, BusChannel, NoBusChannelException, BusChannelException
+from liveq.io.bus import Bus, BusChannel, NoBusChannelException, BusChannelException, textPayload
 from liveq.config.classes import BusConfigClass
 
 # Idle loop delay
@@ -317,7 +317,7 @@ class ZeroMQChannel(BusChannel):
 		message = {
 				'message': {
 					'name': name,
-					'data': data
+					'data': textPayload(data)
 				}
 			}
 
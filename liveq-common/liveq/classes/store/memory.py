@@ -0,0 +1,457 @@
+################################################################
+# LiveQ - An interactive volunteering computing batch system
+# Copyright (C) 2013 Ioannis Charalampidis
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+################################################################
+
+import copy
+import time
+import fnmatch
+import threading
+from redis.exceptions import WatchError
+from liveq.config.classes import StoreConfigClass
+
+"""
+In-Memory Store Class
+
+This class provides an in-process implementation of the subset of the REDIS
+interface used by the LiveQ components. It is meant for benchmarks and tests
+that should run without a REDIS server, therefore the data are not shared
+between processes and they are lost on exit.
+"""
+
+class Config(StoreConfigClass):
+	"""
+	Configuration endpoint
+	"""
+
+	def __init__(self,config):
+		"""
+		Nothing to configure
+		"""
+		pass
+
+	def instance(self, runtimeConfig):
+		"""
+		Create an in-memory store instance
+		"""
+		return MemoryStore()
+
+class MemoryPipeline:
+	"""
+	A pipeline that buffers the commands and runs them on execute()
+
+	Like in REDIS, after watch() the commands run immediately until multi()
+	is called, and execute() raises a WatchError if any of the watched keys
+	was changed in the meantime.
+	"""
+
+	def __init__(self, store):
+		"""
+		Initialize an empty pipeline
+		"""
+		self.store = store
+		self.commands = [ ]
+		self.watched = None
+		self.immediate = False
+
+	def __getattr__(self, name):
+		"""
+		Buffer any store command
+		"""
+		func = getattr(self.store, name)
+		if self.immediate:
+			return func
+		def buffer(*args, **kwargs):
+			self.commands.append( (func, args, kwargs) )
+			return self
+		return buffer
+
+	def watch(self, *keys):
+		"""
+		Watch the given keys for changes and run the commands immediately
+		"""
+		with self.store.lock:
+			self.watched = dict([ (k, copy.deepcopy(self.store.data.get(k, None))) for k in keys ])
+		self.immediate = True
+
+	def multi(self):
+		"""
+		Start buffering the commands
+		"""
+		self.immediate = False
+
+	def reset(self):
+		"""
+		Drop the buffered commands and the watched keys
+		"""
+		self.commands = [ ]
+		self.watched = None
+		self.immediate = False
+
+	def execute(self):
+		"""
+		Run the buffered commands and return their results
+		"""
+		try:
+			with self.store.lock:
+				if self.watched is not None:
+					for (k, v) in self.watched.iteritems():
+						if self.store.data.get(k, None) != v:
+							raise WatchError("Watched variable changed.")
+				return [ func(*args, **kwargs) for (func, args, kwargs) in self.commands ]
+		finally:
+			self.reset()
+
+class MemoryStore:
+	"""
+	An in-memory key/value store with REDIS semantics
+	"""
+
+	def __init__(self):
+		"""
+		Initialize an empty store
+		"""
+		self.data = { }
+		self.lock = threading.RLock()
+
+	def _get(self, key, default):
+		"""
+		Return the value of the given key, creating it if missing
+		"""
+		if not key in self.data:
+			self.data[key] = default
+		return self.data[key]
+
+	def pipeline(self, transaction=True):
+		"""
+		Return a command pipeline
+		"""
+		return MemoryPipeline(self)
+
+	def flushdb(self):
+		"""
+		Remove all the keys
+		"""
+		with self.lock:
+			self.data = { }
+
+	# Keys
+
+	def delete(self, *keys):
+		with self.lock:
+			n = 0
+			for k in keys:
+				if k in self.data:
+					del self.data[k]
+					n += 1
+			return n
+
+	def exists(self, key):
+		with self.lock:
+			return key in self.data
+
+	def expire(self, key, seconds):
+		with self.lock:
+			return key in self.data
+
+	def keys(self, pattern="*"):
+		with self.lock:
+			return [ k for k in self.data.keys() if fnmatch.fnmatchcase(k, pattern) ]
+
+	def scan_iter(self, match="*", count=None):
+		return iter(self.keys(match))
+
+	# Strings
+
+	def get(self, key):
+		with self.lock:
+			return self.data.get(key, None)
+
+	def mget(self, keys, *args):
+		with self.lock:
+			return [ self.data.get(k, None) for k in list(keys) + list(args) ]
+
+	def set(self, key, value, ex=None, px=None, nx=False, xx=False):
+		with self.lock:
+			if (nx and (key in self.data)) or (xx and not (key in self.data)):
+				return None
+			self.data[key] = str(value)
+			return True
+
+	def setex(self, key, time, value):
+		return self.set(key, value)
+
+	def setnx(self, key, value):
+		with self.lock:
+			if key in self.data:
+				return False
+			self.data[key] = str(value)
+			return True
+
+	def incr(self, key, amount=1):
+		with self.lock:
+			v = int(self.data.get(key, 0)) + amount
+			self.data[key] = str(v)
+			return v
+
+	def incrby(self, key, amount=1):
+		return self.incr(key, amount)
+
+	def decr(self, key, amount=1):
+		return self.incr(key, -amount)
+
+	# Hashes
+
+	def hget(self, key, field):
+		with self.lock:
+			return self.data.get(key, { }).get(field, None)
+
+	def hset(self, key, field, value):
+		with self.lock:
+			h = self._get(key, { })
+			isNew = not field in h
+			h[field] = str(value)
+			return int(isNew)
+
+	def hsetnx(self, key, field, value):
+		with self.lock:
+			h = self._get(key, { })
+			if field in h:
+				return 0
+			h[field] = str(value)
+			return 1
+
+	def hmset(self, key, mapping):
+		with self.lock:
+			h = self._get(key, { })
+			for (f, v) in mapping.iteritems():
+				h[f] = str(v)
+			return True
+
+	def hmget(self, key, fields, *args):
+		with self.lock:
+			h = self.data.get(key, { })
+			return [ h.get(f, None) for f in list(fields) + list(args) ]
+
+	def hgetall(self, key):
+		with self.lock:
+			return dict(self.data.get(key, { }))
+
+	def hkeys(self, key):
+		with self.lock:
+			return self.data.get(key, { }).keys()
+
+	def hvals(self, key):
+		with self.lock:
+			return self.data.get(key, { }).values()
+
+	def hlen(self, key):
+		with self.lock:
+			return len(self.data.get(key, { }))
+
+	def hexists(self, key, field):
+		with self.lock:
+			return field in self.data.get(key, { })
+
+	def hdel(self, key, *fields):
+		with self.lock:
+			h = self.data.get(key, { })
+			n = 0
+			for f in fields:
+				if f in h:
+					del h[f]
+					n += 1
+			if not h and key in self.data:
+				del self.data[key]
+			return n
+
+	def hincrby(self, key, field, amount=1):
+		with self.lock:
+			h = self._get(key, { })
+			v = int(h.get(field, 0)) + amount
+			h[field] = str(v)
+			return v
+
+	# Lists
+
+	def rpush(self, key, *values):
+		with self.lock:
+			l = self._get(key, [ ])
+			l.extend([ str(v) for v in values ])
+			return len(l)
+
+	def lpush(self, key, *values):
+		with self.lock:
+			l = self._get(key, [ ])
+			for v in values:
+				l.insert(0, str(v))
+			return len(l)
+
+	def lrange(self, key, start, end):
+		with self.lock:
+			l = self.data.get(key, [ ])
+			if end == -1:
+				return l[start:]
+			return l[start:end+1]
+
+	def llen(self, key):
+		with self.lock:
+			return len(self.data.get(key, [ ]))
+
+	def lpop(self, key):
+		with self.lock:
+			l = self.data.get(key, [ ])
+			if not l:
+				return None
+			return l.pop(0)
+
+	def rpop(self, key):
+		with self.lock:
+			l = self.data.get(key, [ ])
+			if not l:
+				return None
+			return l.pop()
+
+	def lrem(self, key, count, value):
+		with self.lock:
+			l = self.data.get(key, [ ])
+			value = str(value)
+			removed = 0
+			while (value in l) and ((count == 0) or (removed < abs(count))):
+				l.remove(value)
+				removed += 1
+			return removed
+
+	def blpop(self, keys, timeout=0):
+		if not isinstance(keys, list):
+			keys = [ keys ]
+		deadline = time.time() + timeout
+		while True:
+			with self.lock:
+				for k in keys:
+					if self.data.get(k, None):
+						return (k, self.data[k].pop(0))
+			if timeout and (time.time() >= deadline):
+				return None
+			time.sleep(0.01)
+
+	# Sets
+
+	def sadd(self, key, *values):
+		with self.lock:
+			s = self._get(key, set())
+			n = len(s)
+			s.update([ str(v) for v in values ])
+			return len(s) - n
+
+	def srem(self, key, *values):
+		with self.lock:
+			s = self.data.get(key, set())
+			n = len(s)
+			s.difference_update([ str(v) for v in values ])
+			return n - len(s)
+
+	def smembers(self, key):
+		with self.lock:
+			return set(self.data.get(key, set()))
+
+	def sismember(self, key, value):
+		with self.lock:
+			return str(value) in self.data.get(key, set())
+
+	def scard(self, key):
+		with self.lock:
+			return len(self.data.get(key, set()))
+
+	# Sorted sets
+
+	def zadd(self, key, *args):
+		with self.lock:
+			z = self._get(key, { })
+			n = 0
+			for i in range(0, len(args), 2):
+				member = str(args[i+1])
+				if not member in z:
+					n += 1
+				z[member] = float(args[i])
+			return n
+
+	def zincrby(self, key, value, amount=1):
+		with self.lock:
+			z = self._get(key, { })
+			v = z.get(str(value), 0.0) + float(amount)
+			z[str(value)] = v
+			return v
+
+	def zrem(self, key, *members):
+		with self.lock:
+			z = self.data.get(key, { })
+			n = 0
+			for m in members:
+				if str(m) in z:
+					del z[str(m)]
+					n += 1
+			return n
+
+	def zscore(self, key, member):
+		with self.lock:
+			return self.data.get(key, { }).get(str(member), None)
+
+	def zcard(self, key):
+		with self.lock:
+			return len(self.data.get(key, { }))
+
+	def zrange(self, key, start, end, withscores=False):
+		with self.lock:
+			z = sorted([ (s, m) for (m, s) in self.data.get(key, { }).items() ])
+			if end == -1:
+				z = z[start:]
+			else:
+				z = z[start:end+1]
+			if withscores:
+				return [ (m, s) for (s, m) in z ]
+			return [ m for (s, m) in z ]
+
+	def zrevrange(self, key, start, end, withscores=False):
+		with self.lock:
+			z = sorted([ (-s, m) for (m, s) in self.data.get(key, { }).items() ])
+			if end == -1:
+				z = z[start:]
+			else:
+				z = z[start:end+1]
+			if withscores:
+				return [ (m, -s) for (s, m) in z ]
+			return [ m for (s, m) in z ]
+
+	def zremrangebyrank(self, key, start, end):
+		with self.lock:
+			z = self.data.get(key, { })
+			members = self.zrange(key, start, end)
+			for m in members:
+				del z[m]
+			return len(members)
+
+	def zunionstore(self, dest, keys, aggregate=None):
+		with self.lock:
+			if not isinstance(keys, dict):
+				keys = dict([ (k, 1.0) for k in keys ])
+			z = { }
+			for (k, w) in keys.iteritems():
+				for (m, s) in self.data.get(k, { }).items():
+					z[m] = z.get(m, 0.0) + s * w
+			self.data[dest] = z
+			return len(z)
@@ -41,6 +41,9 @@ class InternalBusConfig:
 	#: The internal bus instance
 	IBUS = None
 
+	#: The number of interpolator shards on the bus
+	IPOL_SHARDS = 1
+
 	@staticmethod
 	@configexceptions(section="internal-bus")
 	def fromConfig(config, runtimeConfig):
@@ -52,4 +55,8 @@ class InternalBusConfig:
 		# Populate classes
 		InternalBusConfig.IBUS_CLASS = config.get("internal-bus", "class")
 		InternalBusConfig.IBUS_CONFIG = BusConfigClass.fromClass( InternalBusConfig.IBUS_CLASS, config._sections["internal-bus"] )
-		InternalBusConfig.IBUS = InternalBusConfig.IBUS_CONFIG.instance(runtimeConfig)
\ No newline at end of file
+		InternalBusConfig.IBUS = InternalBusConfig.IBUS_CONFIG.instance(runtimeConfig)
+
+		# Get the number of interpolator shards
+		if config.has_option("internal-bus", "interpolator_shards"):
+			InternalBusConfig.IPOL_SHARDS = config.getint("internal-bus", "interpolator_shards")
\ No newline at end of file
@@ -20,11 +20,167 @@
 import warnings
 import logging
 import struct
+import threading
+import collections
 import numpy
 import xml.etree.cElementTree as eTree
 
 from liveq.utils.FLAT import FLATParser
 
+#: The chi2 was calculated
+CHI2_OK = 0
+
+#: Both histograms have an empty bin, therefore chi2 cannot be calculated
+CHI2_EMPTY = 1
+
+#: The errors of a bin were zero
+CHI2_ZERO_DIVISION = 2
+
+#: There were no bins with values on both histograms
+CHI2_NO_BINS = 3
+
+def chi2Stack(y, yErrPlus, yErrMinus, refY, refYErrPlus, refYErrMinus, bins=None, uncertainty=0.05):
+	"""
+	Calculate the chi-squared between a stack of histograms and a stack of
+	reference histograms. Each argument is a (histograms x bins) matrix,
+	and the optional `bins` vector specifies the number of bins in each row,
+	if the rows are padded.
+
+	Returns a tuple with the chi2 values and a status vector with one of
+	the CHI2_* constants for every histogram.
+	"""
+
+	# Prepare matrices
+	y = numpy.atleast_2d(y)
+	yErrPlus = numpy.atleast_2d(yErrPlus)
+	yErrMinus = numpy.atleast_2d(yErrMinus)
+	refY = numpy.atleast_2d(refY)
+	refYErrPlus = numpy.atleast_2d(refYErrPlus)
+	refYErrMinus = numpy.atleast_2d(refYErrMinus)
+	(numHistos, numBins) = y.shape
+
+	# Mask-out padding bins
+	if bins is None:
+		inside = numpy.ones(y.shape, dtype=bool)
+	else:
+		inside = numpy.arange(numBins) < numpy.reshape(bins, (numHistos, 1))
+
+	# Bins that are empty on both histograms invalidate the chi2, while
+	# bins that are empty on only one of them are skipped (we are allowed to
+	# plot theory outside where there is data, we just cannot calculate a
+	# chi2 there).
+	empty = inside & (y == 0) & (refY == 0)
+	valid = inside & (y != 0) & (refY != 0)
+
+	# Use the errors facing the other histogram
+	over = y > refY
+	sigmaTheory = numpy.where(over, yErrMinus, yErrPlus)
+	sigmaData = numpy.where(over, refYErrPlus, refYErrMinus)
+
+	# compute the test statistics:
+	#                     (Theory - Data)^2
+	# X = --------------------------------------------------------
+	#      Sigma_data^2 + Sigma_theory^2 + (uncertainty*Theory)^2
+	nomin = (y - refY) * (y - refY)
+	denom = sigmaData * sigmaData + sigmaTheory * sigmaTheory + (uncertainty*y) * (uncertainty*y)
+	zero = valid & (denom == 0)
+	with numpy.errstate(divide='ignore', invalid='ignore'):
+		X = numpy.where(valid & ~zero, nomin / numpy.where(zero, 1.0, denom), 0.0)
+
+		# Average over the valid bins
+		# TODO: Calculate NDOF properly (decrease by 1) if histograms
+		#       area was normalized to the constant
+		N = numpy.sum(valid, axis=1)
+		chi2 = numpy.sum(X, axis=1) / N
+
+	# The first offending bin (empty or zero-errors) decides the status
+	status = numpy.zeros(numHistos, dtype=numpy.int8)
+	status[ N == 0 ] = CHI2_NO_BINS
+	firstEmpty = numpy.where(numpy.any(empty, axis=1), numpy.argmax(empty, axis=1), numBins)
+	firstZero = numpy.where(numpy.any(zero, axis=1), numpy.argmax(zero, axis=1), numBins)
+	status[ firstZero < firstEmpty ] = CHI2_ZERO_DIVISION
+	status[ firstEmpty < firstZero ] = CHI2_EMPTY
+
+	# Return chi2 and status
+	return (chi2, status)
+
+def fitValues(y, yErrPlus, yErrMinus, logY):
+	"""
+	Return the (y, y+yErrPlus, y-yErrMinus) values to use for fitting a
+	histogram. In log scale the negative values are kept as-is and the
+	errors crossing zero are replaced with zero.
+	"""
+
+	# Linear values
+	vy = y
+	vyErrPlus = y + yErrPlus
+	vyErrMinus = y - yErrMinus
+
+	# Switch to log scale
+	if numpy.any(logY):
+		with numpy.errstate(divide='ignore', invalid='ignore'):
+			vy = numpy.where( logY & (y >= 0), numpy.log(y), vy )
+			vyErrPlus = numpy.where( logY, numpy.where( vyErrPlus <= 0, 0, numpy.log(vyErrPlus) ), vyErrPlus )
+			vyErrMinus = numpy.where( logY, numpy.where( vyErrMinus <= 0, 0, numpy.log(vyErrMinus) ), vyErrMinus )
+
+	# Return values
+	return (vy, vyErrPlus, vyErrMinus)
+
+class VandermondeCache:
+	"""
+	Bounded LRU cache of the vandermonde matrices used for evaluating the
+	fitted polynomials on the bin grid of an observable.
+
+	The bin grid of an observable never changes, therefore the matrices are
+	indexed by (name, bins, number of coefficients) and re-used for every
+	histogram re-constructed through Histogram.fromFit()
+	"""
+
+	#: Maximum number of matrices to keep
+	MAX_SIZE = 4096
+
+	#: The cached matrices, in least-recently-used order
+	CACHE = collections.OrderedDict()
+
+	#: Lock protecting the cache
+	LOCK = threading.Lock()
+
+	@staticmethod
+	def get(name, x, cl):
+		"""
+		Return the (bins x cl) vandermonde matrix of the given x values,
+		with decreasing powers as expected by numpy.polyval
+		"""
+
+		# Lookup cache
+		x = numpy.asarray(x, dtype=numpy.float64)
+		key = (name, len(x), cl)
+		with VandermondeCache.LOCK:
+			entry = VandermondeCache.CACHE.pop(key, None)
+			if (entry is not None) and numpy.array_equal(entry[0], x):
+				VandermondeCache.CACHE[key] = entry
+				return entry[1]
+
+		# Build matrix
+		vander = numpy.vander(x, cl)
+
+		# Store and evict the least recently used entries
+		with VandermondeCache.LOCK:
+			VandermondeCache.CACHE[key] = (x.copy(), vander)
+			while len(VandermondeCache.CACHE) > VandermondeCache.MAX_SIZE:
+				VandermondeCache.CACHE.popitem(last=False)
+
+		# Return matrix
+		return vander
+
+	@staticmethod
+	def clear():
+		"""
+		Drop all the cached matrices
+		"""
+		with VandermondeCache.LOCK:
+			VandermondeCache.CACHE.clear()
+
 class Histogram:
 	"""
 	Simple histogram representation class that assumes
@@ -193,8 +349,6 @@ class Histogram:
 		"""
 		Calculate the chi-squared between the current histogram
 		and the given (reference) histogram in the specifeid uncertainty.
-
-		TODO: Parallellize on numpy
 		"""
 
 		# If me or refHist is empty, do nothing
@@ -205,57 +359,69 @@ class Histogram:
 		if refHisto.bins != self.bins:
 			raise ValueError("The specified reference histogram does not have the same bin size!")
 
-		# Prepare vars
-		Chi2 = 0;
-		N = 0;
-
-		# handle bins
-		for i in range(0, self.bins):
-
-			# Require same bins filled. If data is filled and MC is not filled,
-			# we do not know what the chi2 of that bin is. Return error.
-			# (b.isEmpty() && !r.isEmpty()) return -1;
-			if (self.y[i] == 0) and (refHisto.y[i] == 0):
-				return -11
+		# Calculate on a stack of one histogram
+		(chi2, status) = chi2Stack(
+			self.y, self.yErrPlus, self.yErrMinus,
+			refHisto.y, refHisto.yErrPlus, refHisto.yErrMinus,
+			uncertainty=uncertainty
+			)
 
-			# Skip empty bins (if data is empty but theory is filled, it's ok. We
-			# are allowed to plot theory outside where there is data, we just 
-			# cannot calculate a chi2 there).
-			if (self.y[i] == 0) or (refHisto.y[i] == 0):
-				continue
+		# Translate status
+		if status[0] == CHI2_EMPTY:
+			return -11
+		elif status[0] == CHI2_ZERO_DIVISION:
+			raise ValueError("Unexpected division by zero!")
+		elif status[0] == CHI2_NO_BINS:
+			raise ValueError("No bins to compare!")
 
-			# compute one element of test statistics:
-			#                     (Theory - Data)^2
-			# X = --------------------------------------------------------
-			#      Sigma_data^2 + Sigma_theory^2 + (uncertainty*Theory)^2
+		return chi2[0]
 
-			Theory = self.y[i]
-			Data = refHisto.y[i]
+	@staticmethod
+	def chi2ToReferenceStack(histos, refHistos, uncertainty=0.05):
+		"""
+		Calculate the chi-squared of every histogram in the list against the
+		respective reference histogram, in a single vectorized pass.
 
-			if Theory > Data:
-				Sigma_theory = self.yErrMinus[i]
-				Sigma_data = refHisto.yErrPlus[i]
-			else:
-				Sigma_theory = self.yErrPlus[i]
-				Sigma_data = refHisto.yErrMinus[i]
+		This returns a numpy array with the same values as chi2ToReference()
+		would, except that the histograms where chi2ToReference() would
+		raise a ValueError get a NaN value.
+		"""
 
-			nomin = (Theory - Data) * (Theory - Data)
-			denom = Sigma_data * Sigma_data + Sigma_theory * Sigma_theory + (uncertainty*Theory) * (uncertainty*Theory)
+		# Prepare the stacked matrices, padded to the largest histogram
+		numHistos = len(histos)
+		numBins = max([ h.bins for h in histos ] + [ 0 ])
+		bins = numpy.zeros(numHistos, dtype=numpy.int64)
+		mats = numpy.zeros((6, numHistos, numBins))
 
-			if denom == 0:
-				raise ValueError("Unexpected division by zero!")
+		# Stack histograms
+		for i in range(numHistos):
+			h = histos[i]
+			r = refHistos[i]
 
-			X = nomin/denom
+			# Empty histograms have zero chi2, mismatching ones are errors
+			if (h.bins == 0) or (r.bins == 0):
+				continue
+			if h.bins != r.bins:
+				bins[i] = -1
+				continue
 
-			Chi2 += X
-			N += 1
+			# Collect values
+			bins[i] = b = h.bins
+			mats[0, i, :b] = h.y
+			mats[1, i, :b] = h.yErrPlus
+			mats[2, i, :b] = h.yErrMinus
+			mats[3, i, :b] = r.y
+			mats[4, i, :b] = r.yErrPlus
+			mats[5, i, :b] = r.yErrMinus
 
-		# TODO: Calculate NDOF properly (decrease by 1) if histograms
-		#       area was normalized to the constant
-		if N == 0:
-			raise ValueError("No bins to compare!")
+		# Calculate
+		(chi2, status) = chi2Stack( *mats, bins=numpy.maximum(bins, 0), uncertainty=uncertainty )
 
-		return Chi2/N
+		# Apply the chi2ToReference() special cases
+		chi2[ status == CHI2_EMPTY ] = -11
+		chi2[ (status == CHI2_ZERO_DIVISION) | (status == CHI2_NO_BINS) | (bins < 0) ] = numpy.nan
+		chi2[ bins == 0 ] = 0.0
+		return chi2
 
 	"""
 	Return the polynomial fitting coefficients that can represent this histogram.
@@ -281,85 +447,46 @@ class Histogram:
 			else:
 
 				# Keep only the y values that are non-zero
-				vy = [ ]
-				vyErrPlus = [ ]
-				vyErrMinus = [ ]
-				vx = [ ]
-
-				# Process bins
-				i=0
-				for y in self.y:
-
-					# Skip zero y-bins
-					if y != 0:
-						if logY:
-							if y < 0:
-								vy.append(y)
-							else:
-								vy.append(numpy.log(y))
-
-							# Protect against zero values
-							if (y+self.yErrPlus[i]) <= 0:
-								vyErrPlus.append(0)
-							else:
-								vyErrPlus.append(numpy.log(y+self.yErrPlus[i]))
-
-							# Protect against zero values
-							if (y-self.yErrMinus[i]) <= 0:
-								vyErrMinus.append(0)
-							else:
-								vyErrMinus.append(numpy.log(y-self.yErrMinus[i]))
-						else:
-							vy.append(y)
-							vyErrPlus.append(y+self.yErrPlus[i])
-							vyErrMinus.append(y-self.yErrMinus[i])
-
-						# Collect sample
-						vx.append(self.x[i])
-
-					# Increase index
-					i += 1
+				y = numpy.asarray(self.y, dtype=numpy.float64)
+				nonZero = (y != 0)
 
 				# If we have no y-bins with values, return null
-				if len(vy) == 0:
+				if not numpy.any(nonZero):
 					if meta:
 						return (None, None)
 					else:
 						return None
 
+				# Get the values to fit
+				(vy, vyErrPlus, vyErrMinus) = fitValues(
+					y[nonZero], 
+					numpy.asarray(self.yErrPlus, dtype=numpy.float64)[nonZero], 
+					numpy.asarray(self.yErrMinus, dtype=numpy.float64)[nonZero], 
+					logY
+					)
+				vx = numpy.asarray(self.x, dtype=numpy.float64)[nonZero]
+
 				# Coefficents for the plot
 				with warnings.catch_warnings():
 					# Ignore 'poorly conditioned data' warnings
 					warnings.simplefilter('ignore', numpy.RankWarning)
 
 					# Use errors as weights
-					errSum = (numpy.array(vyErrPlus) + numpy.array(vyErrMinus)) / 2.0
+					errSum = (vyErrPlus + vyErrMinus) / 2.0
 					errSum = 1 / errSum
 
-					# Calculate coefficients
-					coeff = numpy.polyfit( vx, vy, deg, w=errSum )
-					coeffPlus = numpy.polyfit( vx, vyErrPlus, deg, w=errSum )
-					coeffMinus = numpy.polyfit( vx, vyErrMinus, deg, w=errSum )
+					# Calculate the coefficients of all three curves at once
+					coeff = numpy.polyfit( vx, numpy.column_stack([ vy, vyErrPlus, vyErrMinus ]), deg, w=errSum )
 
 				# Calculate the combined coefficients
-				combCoeff = numpy.concatenate( [coeff, coeffPlus, coeffMinus] )
+				combCoeff = coeff.T.flatten()
 
 			# If we don't have metadata, return
 			if not meta:
 				return combCoeff
 
-			# Prepare metadata
-			meta = {
-				'x': [ self.x, self.xErrMinus, self.xErrPlus ],
-				'logY': logY,
-				'coef': len(combCoeff),
-				'bins': self.bins,
-				'name': self.name,
-				'meta': self.meta
-			}
-
 			# Return coefficients and metadata
-			return (combCoeff, meta)
+			return (combCoeff, self.fitMeta(combCoeff, logY))
 
 		# Catch exceptions
 		except Exception as e:
@@ -370,6 +497,104 @@ class Histogram:
 			# On exception return None
 			return (None, None)
 
+	def fitMeta(self, combCoeff, logY):
+		"""
+		Return the metadata required to re-construct the histogram from the
+		given coefficients, using Histogram.fromFit()
+		"""
+		return {
+			'x': [ self.x, self.xErrMinus, self.xErrPlus ],
+			'logY': logY,
+			'coef': len(combCoeff),
+			'bins': self.bins,
+			'name': self.name,
+			'meta': self.meta
+		}
+
+	@staticmethod
+	def polyFitStack(histos, degrees, logY=None):
+		"""
+		Calculate the polyFit() of all the given histograms, using the respective
+		polynomial degree from the degrees list.
+
+		The histograms with the same number of bins and degree are fitted together,
+		solving all of their weighted least-squares problems with one stacked SVD.
+		Returns a list of (coefficients, metadata) tuples, like polyFit().
+		"""
+
+		# Results and groups of (bins, degree)
+		ans = [ (None, None) ] * len(histos)
+		groups = { }
+
+		# Group histograms
+		for i in range(len(histos)):
+			h = histos[i]; deg = degrees[i]
+
+			# Simple cases are handled by polyFit
+			if (h.bins <= 1) or (deg is None) or (deg <= 0):
+				ans[i] = h.polyFit(deg=deg, logY=logY)
+				continue
+
+			# Stack the rest
+			k = (h.bins, int(deg))
+			if not k in groups:
+				groups[k] = [ ]
+			groups[k].append(i)
+
+		# Fit each group
+		for (bins, deg), index in groups.iteritems():
+			group = [ histos[i] for i in index ]
+			num = len(group)
+
+			# Check if we should use logY
+			vLogY = [ (h.meta.get('logY', True) if logY is None else logY) for h in group ]
+			hLogY = numpy.array(vLogY, dtype=bool)
+
+			# Stack the values
+			x = numpy.array([ h.x for h in group ], dtype=numpy.float64)
+			y = numpy.array([ h.y for h in group ], dtype=numpy.float64)
+			yErrPlus = numpy.array([ h.yErrPlus for h in group ], dtype=numpy.float64)
+			yErrMinus = numpy.array([ h.yErrMinus for h in group ], dtype=numpy.float64)
+
+			# Get the values to fit, on log scale only where needed
+			(vy, vyErrPlus, vyErrMinus) = fitValues( y, yErrPlus, yErrMinus, hLogY[:,None] )
+
+			# Zero y-bins are excluded from the fit by giving them zero weight
+			nonZero = (y != 0)
+			with numpy.errstate(divide='ignore', invalid='ignore'):
+				w = numpy.where( nonZero, 1 / ((vyErrPlus + vyErrMinus) / 2.0), 0.0 )
+
+				# Weighted and column-scaled vandermonde matrices (as in numpy.polyfit)
+				lhs = x[:,:,None] ** numpy.arange(deg, -1, -1) * w[:,:,None]
+				rhs = numpy.where( nonZero[:,:,None], numpy.dstack([ vy, vyErrPlus, vyErrMinus ]), 0.0 ) * w[:,:,None]
+				scale = numpy.sqrt( numpy.sum(lhs * lhs, axis=1) )
+				lhs /= scale[:,None,:]
+
+			# Histograms that cannot be stacked are fitted one by one
+			numValues = numpy.sum(nonZero, axis=1)
+			good = (numValues > 0) & numpy.all(numpy.isfinite(lhs), axis=(1,2)) & numpy.all(numpy.isfinite(rhs), axis=(1,2))
+			for j in numpy.nonzero(~good)[0]:
+				ans[index[j]] = group[j].polyFit(deg=deg, logY=logY)
+			if not numpy.any(good):
+				continue
+
+			# Solve all least-squares problems with a stacked SVD,
+			# using the same cut-off as numpy.polyfit
+			(U, S, Vt) = numpy.linalg.svd( lhs[good], full_matrices=False )
+			rcond = numValues[good] * numpy.finfo(numpy.float64).eps
+			cutoff = S > (rcond * S[:,0])[:,None]
+			Sinv = numpy.where( cutoff, 1.0 / numpy.where(cutoff, S, 1.0), 0.0 )
+			UtB = numpy.einsum( 'hbk,hbc->hkc', U, rhs[good] ) * Sinv[:,:,None]
+			coeff = numpy.einsum( 'hkd,hkc->hdc', Vt, UtB ) / scale[good][:,:,None]
+
+			# Collect results
+			for (j, c) in zip(numpy.nonzero(good)[0], coeff):
+				combCoeff = c.T.flatten()
+				ans[index[j]] = (combCoeff, group[j].fitMeta(combCoeff, vLogY[j]))
+
+		# Return results
+		return ans
+
 	"""
 	Try various polyFit degrees and pick the one most optimally fitting on the given set of data
 	"""
@@ -443,17 +668,20 @@ class Histogram:
 		else:
 
 			# Calculate the size of the coefficients array
+			coeff = numpy.asarray(coeff, dtype=numpy.float64)
 			cl = len(coeff) / 3
 
+			# Evaluate all three polynomials with a single product
+			# against the cached vandermonde matrix of the bin grid
+			vander = VandermondeCache.get( meta['name'], x, cl )
+			values = numpy.dot( vander, coeff[0:cl*3].reshape(3, cl).T )
+
 			# Re-create bin values from fitted data
 			if meta['logY']:
-				y = numpy.exp(numpy.polyval( coeff[0:cl], x ))
-				yErrMinus = numpy.exp(numpy.polyval( coeff[cl:cl*2], x ))
-				yErrPlus = numpy.exp(numpy.polyval( coeff[cl*2:cl*3], x ))
-			else:
-				y = numpy.polyval( coeff[0:cl], x )
-				yErrMinus = numpy.polyval( coeff[cl:cl*2], x )
-				yErrPlus = numpy.polyval( coeff[cl*2:cl*3], x )
+				values = numpy.exp(values)
+			y = values[:,0]
+			yErrMinus = values[:,1]
+			yErrPlus = values[:,2]
 
 		# Return histogram instance
 		return Histogram(
@@ -0,0 +1,137 @@
+################################################################
+# LiveQ - An interactive volunteering computing batch system
+# Copyright (C) 2013 Ioannis Charalampidis
+# 
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+################################################################
+
+
+"""
+Pluggable compression codecs for the packed histogram buffers.
+
+Every buffer compressed through this module starts with a small header
+that records the codec that was used, therefore the receiving end can
+decompress it without knowing in advance how it was compressed:
+
+	+--------+-------------------------------------------+
+	| char*3 | Magic bytes 'LQZ'                         |
+	|  uchar | Codec ID                                  |
+	+--------+-------------------------------------------+
+	|   ..   | Compressed payload                        |
+	+--------+-------------------------------------------+
+
+Buffers without the header are assumed to be legacy LZMA payloads.
+
+The codecs that depend on optional python modules (snappy, lz4) are only
+registered if the respective module is available.
+"""
+
+import zlib
+import struct
+import pylzma
+
+#: Uncompressed payload
+CODEC_NONE = 0
+#: zlib (deflate) compression
+CODEC_ZLIB = 1
+#: Google snappy compression
+CODEC_SNAPPY = 2
+#: LZ4 block compression
+CODEC_LZ4 = 3
+#: LZMA compression (slow, but with the best ratio)
+CODEC_LZMA = 4
+
+#: The magic bytes in front of every compressed buffer
+MAGIC = "LQZ"
+
+#: Registered codecs, indexed by ID: (name, compress, decompress)
+CODECS = { }
+
+#: Codec IDs indexed by name
+CODEC_NAMES = { }
+
+def registerCodec(cid, name, fCompress, fDecompress):
+	"""
+	Register a codec with the given ID and name
+	"""
+
+	# Store the codec in the registry
+	CODECS[cid] = (name, fCompress, fDecompress)
+	CODEC_NAMES[name] = cid
+
+def getCodec(codec):
+	"""
+	Return the ID of the given codec, specified either by name or by ID
+	"""
+
+	# Lookup by name
+	if isinstance(codec, basestring):
+		if not codec in CODEC_NAMES:
+			raise ValueError("The compression codec '%s' is not available" % codec)
+		return CODEC_NAMES[codec]
+
+	# Lookup by ID
+	if not codec in CODECS:
+		raise ValueError("The compression codec #%r is not available" % codec)
+	return codec
+
+def compress(buf, codec=CODEC_LZMA):
+	"""
+	Compress the given buffer using the specified codec and prefix
+	it with the codec header
+	"""
+
+	# Compress and put header
+	cid = getCodec(codec)
+	return MAGIC + struct.pack("<B", cid) + CODECS[cid][1]( buf )
+
+def decompress(buf):
+	"""
+	Decompress the given buffer, detecting the codec from it's header
+	"""
+
+	# Legacy buffers have no header and are always LZMA-compressed
+	if not buf.startswith(MAGIC):
+		return pylzma.decompress( buf )
+
+	# Read codec ID
+	(cid,) = struct.unpack("<B", buf[3:4])
+	if not cid in CODECS:
+		raise ValueError("The compression codec #%i is not available for decompressing the buffer" % cid)
+
+	# Decompress
+	return CODECS[cid][2]( buf[4:] )
+
+# Register the codecs that are always available
+registerCodec( CODEC_NONE, "none", str, str )
+registerCodec( CODEC_ZLIB, "zlib", lambda buf: zlib.compress(buf, 1), zlib.decompress )
+registerCodec( CODEC_LZMA, "lzma", pylzma.compress, pylzma.decompress )
+
+# Register snappy if available
+try:
+	import snappy
+	registerCodec( CODEC_SNAPPY, "snappy", snappy.compress, snappy.decompress )
+except ImportError:
+	pass
+
+# Register lz4 if available (the block API moved to lz4.block in lz4 >= 0.10)
+try:
+	try:
+		import lz4.block as lz4block
+	except ImportError:
+		import lz4 as lz4block
+	registerCodec( CODEC_LZ4, "lz4", lz4block.compress, lz4block.decompress )
+except ImportError:
+	pass
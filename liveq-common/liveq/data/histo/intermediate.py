@@ -25,13 +25,14 @@ import numpy
 import glob
 
 import bz2
-import pylzma
 import base64
 
 import traceback
 
 from liveq.utils.FLAT import FLATParser
 from liveq.data.histo import Histogram
+from liveq.data.histo import compression
+from liveq.io.bus import BinaryPayload
 from liveq.data.histo.interpolate import InterpolatableCollection
 
 class IntermediateHistogramCollection(dict):
@@ -39,9 +40,13 @@ class IntermediateHistogramCollection(dict):
 	A class that provides a unified interface access to the generated histograms.
 	"""
 
-	# Overridable default compression function for packing
-	F_COMPRESS = pylzma.compress
-	F_DECOMPRESS = pylzma.decompress
+	#: Overridable default compression codec for packing (the codec
+	#: used is stored in the packed buffer, so unpacking detects it)
+	CODEC = compression.CODEC_LZMA
+
+	#: The protocol version to use when packing (1 is kept for talking
+	#: to older components, fromPack() can read both)
+	PACK_VERSION = 2
 
 	def __init__(self, state=0):
 		"""
@@ -158,23 +163,36 @@ class IntermediateHistogramCollection(dict):
 	def fromPack(buf, decompress=True, decode=True):
 		"""
 		The reverse function of pack() that reads the packed data 
-		and re-creates the IntermediateHistogramCollection object
+		and re-creates the IntermediateHistogramCollection object.
+
+		Both the protocol version 1 and version 2 buffers are supported.
 		"""
 
-		# Decode and decompress
-		if decode:
+		# Decode and decompress (binary bus payloads are not encoded)
+		if decode and not isinstance(buf, BinaryPayload):
 			buf = base64.b64decode(buf)
 		if decompress:
-			buf = IntermediateHistogramCollection.F_DECOMPRESS( buf )
+			buf = compression.decompress( buf )
+
+		# Dispatch according to protocol version
+		(ver,) = struct.unpack_from("<B", buf)
+		if ver == 1:
+			return IntermediateHistogramCollection._unpackV1( buf )
+		elif ver == 2:
+			return IntermediateHistogramCollection._unpackV2( buf )
+		else:
+			raise ValueError("The protocol version %i is not supported for unpacking IntermediateHistogramCollection" % ver)
+
+	@staticmethod
+	def _unpackV1(buf):
+		"""
+		Unpack a protocol version 1 buffer
+		"""
 
 		# Get version, histogram count and state
 		(ver, numHistos, state) = struct.unpack("<BIB", buf[:6])
 		p = 6
 
-		# Validate protocol version
-		if ver != 1:
-			raise ValueError("The protocol version %i is not supported for unpacking IntermediateHistogramCollection" % version)
-
 		# Start parsing histograms
 		ans = IntermediateHistogramCollection()
 		for i in range(numHistos):
@@ -189,8 +207,7 @@ class IntermediateHistogramCollection(dict):
 
 			# Read the numpy buffers
 			npBufferLen = 8 * 8 * hBins
-			npBuffer = numpy.frombuffer( buf[p:p+npBufferLen], dtype=numpy.float64 )
-			npBuffer.setflags(write=True)
+			npBuffer = numpy.frombuffer( bytearray(buf[p:p+npBufferLen]), dtype=numpy.float64 )
 			p += npBufferLen
 
 			# Create histogram
@@ -217,6 +234,66 @@ class IntermediateHistogramCollection(dict):
 		# Return answer
 		return ans
 
+	@staticmethod
+	def _unpackV2(buf):
+		"""
+		Unpack a protocol version 2 buffer. The bin values of all the
+		histograms are views on the (writable) buffer, so no data is copied.
+		"""
+
+		# The numpy views must be writable, so we need a mutable buffer.
+		# This is a single bulk copy, regardless of the number of histograms.
+		if not isinstance(buf, bytearray):
+			buf = bytearray(buf)
+
+		# Read header
+		(ver, state, _, numHistos, numBins, lenNames) = struct.unpack_from("<BBHIII", buf, 0)
+		p = 16
+
+		# Read the histogram table
+		table = [ ]
+		for i in range(numHistos):
+			table.append( struct.unpack_from("<IIQd", buf, p) )
+			p += 24
+
+		# Read the name index
+		names = str(buf[p:p+lenNames]).split("\0")
+		p += (lenNames + 7) & ~7
+
+		# Map the 8 columns as a single 2D view
+		cols = numpy.frombuffer( buf, dtype=numpy.float64, count=8*numBins, offset=p ).reshape(8, numBins)
+
+		# Create histograms
+		ans = IntermediateHistogramCollection()
+		for i in range(numHistos):
+			(hBins, hOfs, hNevts, hXS) = table[i]
+			hName = names[i]
+			e = hOfs + hBins
+
+			# Create histogram
+			ans[hName] = IntermediateHistogram(
+					name=hName,
+					bins=hBins,
+					meta={
+						'nevts': hNevts,
+						'crosssection': hXS
+					},
+					xlow=cols[0, hOfs:e],
+					xfocus=cols[1, hOfs:e],
+					xhigh=cols[2, hOfs:e],
+					Entries=cols[3, hOfs:e],
+					SumW=cols[4, hOfs:e],
+					SumW2=cols[5, hOfs:e],
+					SumXW=cols[6, hOfs:e],
+					SumX2W=cols[7, hOfs:e],
+				)
+
+		# Store state
+		ans.state = state
+
+		# Return answer
+		return ans
+
 	@staticmethod
 	def fromPackFile(filename, decompress=True, decode=True):
 		"""
@@ -229,11 +306,109 @@ class IntermediateHistogramCollection(dict):
 			# Read and unpack
 			return IntermediateHistogramCollection.fromPack( f.read() )
 
-	def pack(self, encode=True, compress=True):
+	def pack(self, encode=True, compress=True, codec=None):
 		"""
 		Generate a packed version of the data that can be streamed
 		over network.
 
+		The buffer is compressed with the specified codec (or the CODEC
+		class default) from the liveq.data.histo.compression module.
+
+		Buffer format (protocol version 2):
+
+		/ Header
+		+--------+-------------------------------------------+
+		|  uchar | Protocol version (current: 2)             |
+		|  uchar | The collection state (user-defined)       |
+		| ushort | (Reserved)                                |
+		|  uint  | Number of histograms in the file          |
+		|  uint  | Total number of bins in all histograms    |
+		|  uint  | Length of the name index                  |
+		+--------+-------------------------------------------+
+		/ Histogram table (x Number of histograms)
+		+--------+-------------------------------------------+
+		|  uint  | Number of bins in histogram               |
+		|  uint  | Offset of the first bin in the columns    |
+		| uint64 | The number of events in the histogram     |
+		| double | The crosssection of the histogram         |
+		+--------+-------------------------------------------+
+		/ Name index
+		+--------+-------------------------------------------+
+		|  char* | Histogram names, separated with '\\0' and |
+		|        | padded to the next 8-byte boundary        |
+		+--------+-------------------------------------------+
+		/ Columns (x 8: xlow, xfocus, xhigh, Entries, SumW,
+		           SumW2, SumXW, SumX2W)
+		+--------+-------------------------------------------+
+		|   ..   | float64 values for the bins of all the    |
+		|        | histograms, in histogram table order      |
+		+--------+-------------------------------------------+
+
+		Every section is 64-bit aligned.
+		"""
+
+		# Format values
+		if self.state == None:
+			self.state = 0
+
+		# Use legacy format if requested
+		if IntermediateHistogramCollection.PACK_VERSION == 1:
+			buf = self._packV1()
+
+		else:
+
+			# Calculate the section sizes
+			histos = self.values()
+			names = "\0".join([ str(h.name) for h in histos ])
+			numBins = sum([ h.bins for h in histos ])
+			pTable = 16
+			pNames = pTable + 24 * len(histos)
+			pCols = pNames + ((len(names) + 7) & ~7)
+
+			# Allocate the entire buffer at once
+			buf = bytearray( pCols + 8 * 8 * numBins )
+
+			# Put header and name index
+			struct.pack_into("<BBHIII", buf, 0, 2, int(self.state), 0, len(histos), numBins, len(names))
+			buf[pNames:pNames+len(names)] = names
+
+			# Put histogram table and histogram data
+			cols = numpy.frombuffer( buf, dtype=numpy.float64, count=8*numBins, offset=pCols ).reshape(8, numBins)
+			p = pTable; ofs = 0
+			for histo in histos:
+				struct.pack_into("<IIQd", buf, p, histo.bins, ofs, histo.nevts, histo.crosssection)
+				p += 24
+
+				# Put histogram data
+				e = ofs + histo.bins
+				cols[0, ofs:e] = histo.xlow
+				cols[1, ofs:e] = histo.xfocus
+				cols[2, ofs:e] = histo.xhigh
+				cols[3, ofs:e] = histo.Entries
+				cols[4, ofs:e] = histo.SumW
+				cols[5, ofs:e] = histo.SumW2
+				cols[6, ofs:e] = histo.SumXW
+				cols[7, ofs:e] = histo.SumX2W
+				ofs = e
+
+			# Convert to string
+			buf = str(buf)
+
+		# Compress & encode
+		if compress:
+			if codec is None:
+				codec = IntermediateHistogramCollection.CODEC
+			buf = compression.compress( buf, codec )
+		if encode:
+			buf = base64.b64encode(buf)
+
+		# Return buffer
+		return buf
+
+	def _packV1(self):
+		"""
+		Generate a protocol version 1 buffer. (Uncompressed and not encoded)
+
 		Buffer format:
 
 		/ Header
@@ -255,10 +430,6 @@ class IntermediateHistogramCollection(dict):
 		/!\ Note: This buffer is NOT 64-bit aligned!
 		"""
 
-		# Format values
-		if self.state == None:
-			self.state = 0
-		
 		# Prepare buffer
 		buf = struct.pack("<BIB", 1, len(self), int(self.state))
 
@@ -282,16 +453,10 @@ class IntermediateHistogramCollection(dict):
 				])
 			buf += str( numpy.getbuffer( npbuf ) )
 
-		# Compress & encode
-		if compress:
-			buf = IntermediateHistogramCollection.F_COMPRESS( buf )
-		if encode:
-			buf = base64.b64encode(buf)
-
 		# Return buffer
 		return buf
 
-	def packToFile(self, filename, encode=True, compress=True):
+	def packToFile(self, filename, encode=True, compress=True, codec=None):
 		"""
 		Pack and store to the specified file
 		"""
@@ -300,7 +465,7 @@ class IntermediateHistogramCollection(dict):
 		with open(filename, 'wb') as f:
 
 			# Dump
-			f.write( self.pack(encode, compress) )
+			f.write( self.pack(encode, compress, codec) )
 
 
 	def subset(self, names):
@@ -750,3 +915,106 @@ class IntermediateHistogram:
 				SumX2W=values[7::8]
 			)
 
+
+class IntermediateHistogramCache:
+	"""
+	A cache of the intermediate histograms parsed from the FLAT files of a
+	directory, indexed by the modification time and size of each file.
+
+	Every call to scan() re-reads only the files that were created or changed
+	since the previous scan and keeps track of the histograms that changed.
+	"""
+
+	def __init__(self, baseDir, state=1):
+		"""
+		Initialize the cache for the specified directory
+		"""
+
+		#: The directory to scan
+		self.baseDir = baseDir
+
+		#: The state of the generated collections
+		self.state = state
+
+		#: The cached files, as a filename -> (mtime, size, histogram) dictionary
+		self.files = { }
+
+		#: The names of the histograms changed in the last scan
+		self.changed = set()
+
+	def scan(self):
+		"""
+		Re-scan the directory, parsing only the files that were modified since
+		the last scan. Returns the set with the names of the changed histograms.
+		"""
+
+		# List files in the directory
+		try:
+			flatFiles = [ f for f in os.listdir(self.baseDir) if f.endswith(".dat") ]
+		except OSError as e:
+			logging.error("Unable to list directory %s (%s)" % (self.baseDir, str(e)))
+			flatFiles = [ ]
+
+		# Check every file for modifications
+		changed = set()
+		files = { }
+		for f in flatFiles:
+			ffile = os.path.join( self.baseDir, f )
+
+			# Skip files that have gone away in the meantime
+			try:
+				st = os.stat( ffile )
+			except OSError:
+				logging.error("File has gone away %s" % ffile)
+				continue
+
+			# Keep the previous histogram if the file is not modified
+			key = (st.st_mtime, st.st_size)
+			if (ffile in self.files) and (self.files[ffile][0:2] == key):
+				files[ffile] = self.files[ffile]
+				continue
+
+			# Try to load the given histogram
+			histo = None
+			try:
+				histo = IntermediateHistogram.fromFLAT( ffile )
+			except Exception as e:
+				logging.error("Exception while loading file %s (%s)" % (ffile, str(e)))
+
+			# Report errors
+			if histo == None:
+				logging.error("Unable to load intermediate histogram from %s" % ffile)
+			else:
+				changed.add( histo.name )
+
+			# Cache even the failed files, so they are retried only when modified
+			files[ffile] = (st.st_mtime, st.st_size, histo)
+
+		# Replace cache and return the changed histograms
+		self.files = files
+		self.changed = changed
+		return changed
+
+	def collection(self, histograms=None):
+		"""
+		Return an IntermediateHistogramCollection with the cached histograms.
+
+		Optionally you can specify only a subset of histogram names to include
+		(for example the changed ones).
+		"""
+
+		# Collect histograms
+		ans = IntermediateHistogramCollection( state=self.state )
+		for (mtime, size, histo) in self.files.values():
+			if (histo != None) and ((histograms is None) or (histo.name in histograms)):
+				ans[histo.name] = histo
+
+		# Return collection
+		return ans
+
+	def clear(self):
+		"""
+		Forget all the cached histograms
+		"""
+		self.files = { }
+		self.changed = set()
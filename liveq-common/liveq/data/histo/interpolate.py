@@ -26,11 +26,12 @@ import glob
 
 import cPickle as pickle
 import bz2
-import pylzma
 import base64
 
 from liveq.utils.FLAT import FLATParser
 from liveq.data.histo import Histogram
+from liveq.data.histo import compression
+from liveq.io.bus import BinaryPayload
 
 class InterpolatableCollection(dict):
 	"""
@@ -40,9 +41,9 @@ class InterpolatableCollection(dict):
 	This class is optimized for use by the interpolator. 
 	"""
 
-	# Overridable default compression function for packing
-	F_COMPRESS = pylzma.compress
-	F_DECOMPRESS = pylzma.decompress
+	#: Overridable default compression codec for packing (the codec
+	#: used is stored in the packed buffer, so unpacking detects it)
+	CODEC = compression.CODEC_LZMA
 
 	def __init__(self, tune=None, dataCoeff=None, dataMeta=None):
 		"""
@@ -104,22 +105,22 @@ class InterpolatableCollection(dict):
 		# Create collection
 		self.clear()
 
-		# Calculate coefficient slice width
-		w = len(self.dataCoeff) / len(self.dataMeta)
+		# Work on a contiguous array, so the slices are views
+		dataCoeff = numpy.asarray(self.dataCoeff, dtype=numpy.float64)
 
 		# Rebuild histograms
 		ofs=0
 		for meta in self.dataMeta:
 
-			# Skip histogram if we were not asked to process it
-			if histograms and (not meta['name'] in histograms):
-				continue
-
 			# Fetch coefficient slice and forward to next
 			w = int(meta['coef'])
-			coeff = self.dataCoeff[ofs:ofs+w]
+			coeff = dataCoeff[ofs:ofs+w]
 			ofs += w
 
+			# Skip histogram if we were not asked to process it
+			if histograms and (not meta['name'] in histograms):
+				continue
+
 			# Create and store histogram
 			histo = Histogram.fromFit( coeff, meta )
 			self[histo.name] = histo
@@ -142,16 +143,21 @@ class InterpolatableCollection(dict):
 		# Sort keys
 		histograms.sort()
 
-		# Process histograms in array
+		# Get the fit degree of every histogram
+		degrees = [ ]
 		for hname in histograms:
 
 			# Check if we have a fitDegree override
 			histoDegree=None
 			if not (fitDegree is None) and (hname in fitDegree):
 				histoDegree=fitDegree[hname]
+			degrees.append( histoDegree )
 
-			# Fit histogram
-			coeff, meta = self[hname].polyFit(deg=histoDegree)
+		# Fit all histograms at once
+		fits = Histogram.polyFitStack( [ self[hname] for hname in histograms ], degrees )
+
+		# Process histograms in array
+		for hname, (coeff, meta) in zip(histograms, fits):
 
 			# Skip buggy histograms
 			if coeff is None:
@@ -216,11 +222,11 @@ class InterpolatableCollection(dict):
 		and re-creates the InterpolatableCollection object
 		"""
 
-		# Decode and decompress
-		if decode:
+		# Decode and decompress (binary bus payloads are not encoded)
+		if decode and not isinstance(buf, BinaryPayload):
 			buf = base64.b64decode( buf )
 		if decompress:
-			buf = InterpolatableCollection.F_DECOMPRESS( buf )
+			buf = compression.decompress( buf )
 
 		# Get version, histogram count and state
 		(ver, lenCoef, lenMeta) = struct.unpack("<BII", buf[:9])
@@ -242,11 +248,14 @@ class InterpolatableCollection(dict):
 		# Return histogram
 		return ic
 
-	def pack(self, compress=True, encode=True):
+	def pack(self, compress=True, encode=True, codec=None):
 		"""
 		Generate a packed version of the data that can be streamed
 		over network.
 
+		The buffer is compressed with the specified codec (or the CODEC
+		class default) from the liveq.data.histo.compression module.
+
 		Buffer format:
 
 		/ Header
@@ -276,9 +285,109 @@ class InterpolatableCollection(dict):
 
 		# Decode and decompress
 		if compress:
-			buf = InterpolatableCollection.F_COMPRESS( buf )
+			if codec is None:
+				codec = InterpolatableCollection.CODEC
+			buf = compression.compress( buf, codec )
 		if encode:
 			buf = base64.b64encode( buf )
 
 		# Return buffer
 		return buf
+
+	@staticmethod
+	def packMany(collections, compress=True, encode=True, codec=None):
+		"""
+		Generate a single packed buffer with the specified list of
+		InterpolatableCollections.
+
+		Buffer format:
+
+		/ Header
+		+--------+-------------------------------------------+
+		|  uchar | Protocol version (current: 1)             |
+		|  uint  | Size of the coefficients buffer           |
+		|  uint  | Pickled metadata size                     |
+		+--------+-------------------------------------------+
+		/ Coefficients
+		+--------+-------------------------------------------+
+		|   ..   | float64 numpy buffer of all collections   |
+		+--------+-------------------------------------------+
+		/ Metadata
+		+--------+-------------------------------------------+
+		|   ..   | Pickled dictionary with the lists of the  |
+		|        | coefficient counts, metadata and tunes    |
+		+--------+-------------------------------------------+
+
+		Metadata objects shared by many collections are pickled only once.
+		A None item in the list is kept as an empty slot, which fromPackMany()
+		returns as None.
+		"""
+
+		# Prepare buffers
+		buf_coef = ""
+		present = [ c for c in collections if c is not None ]
+		if present:
+			buf_coef = str(numpy.getbuffer( numpy.concatenate([ c.dataCoeff for c in present ]).astype(numpy.float64) ))
+		buf_meta = str(pickle.dumps( {
+				"count": [ None if c is None else len(c.dataCoeff) for c in collections ],
+				"meta": [ None if c is None else c.dataMeta for c in collections ],
+				"tune": [ None if c is None else c.tune for c in collections ]
+			} ))
+
+		# Build buffer
+		buf = struct.pack("<BII", 1, len(buf_coef), len(buf_meta)) + buf_coef + buf_meta
+
+		# Compress and encode
+		if compress:
+			if codec is None:
+				codec = InterpolatableCollection.CODEC
+			buf = compression.compress( buf, codec )
+		if encode:
+			buf = base64.b64encode( buf )
+
+		# Return buffer
+		return buf
+
+	@staticmethod
+	def fromPackMany( buf, decompress=True, decode=True ):
+		"""
+		The reverse function of packMany() that returns the list of
+		InterpolatableCollections in the packed data (None for the empty slots)
+		"""
+
+		# Decode and decompress (binary bus payloads are not encoded)
+		if decode and not isinstance(buf, BinaryPayload):
+			buf = base64.b64decode( buf )
+		if decompress:
+			buf = compression.decompress( buf )
+
+		# Get version and buffer sizes
+		(ver, lenCoef, lenMeta) = struct.unpack("<BII", buf[:9])
+		p = 9
+
+		# Fetch coefficients from numpy buffer
+		coeff = numpy.frombuffer( buf[p:p+lenCoef], dtype=numpy.float64 )
+		p += lenCoef
+
+		# Unpickle dictionary
+		kvdata = pickle.loads( buf[p:p+lenMeta] )
+
+		# Create interpolatable collections
+		ans = [ ]
+		ofs = 0
+		for i in range(0, len(kvdata['count'])):
+
+			# Keep empty slots
+			if kvdata['count'][i] is None:
+				ans.append(None)
+				continue
+
+			ic = InterpolatableCollection()
+			ic.dataCoeff = coeff[ ofs : ofs + kvdata['count'][i] ]
+			ic.dataMeta = kvdata['meta'][i]
+			ic.tune = kvdata['tune'][i]
+			ofs += kvdata['count'][i]
+			ans.append(ic)
+
+		# Return histograms
+		return ans
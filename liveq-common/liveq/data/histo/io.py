@@ -19,12 +19,12 @@
 
 import struct
 import base64
-import pylzma
 import numpy as np
 import cPickle as pickle
 
 from liveq.data.histo.collection import HistogramCollection
 from liveq.data.histo import Histogram
+from liveq.data.histo import compression
 
 def packHistogram(histo):
 	"""
@@ -45,7 +45,7 @@ def packHistogram(histo):
 	# Combine two buffers and return
 	return struct.pack("<BII", 1, len(buf_numpy), len(buf_meta)) + buf_numpy + buf_meta
 
-def packHistogramCollection(collection, encode=True, compress=True):
+def packHistogramCollection(collection, encode=True, compress=True, codec=compression.CODEC_LZMA):
 	"""
 	Pack a collection of histograms
 	"""
@@ -59,7 +59,7 @@ def packHistogramCollection(collection, encode=True, compress=True):
 
 	# Compress if asked
 	if compress:
-		buf = pylzma.compress(buf)
+		buf = compression.compress(buf, codec)
 	# Encode if asked
 	if encode:
 		buf = base64.b64encode(buf)
@@ -115,7 +115,7 @@ def unpackHistogramCollection(buf, decode=True, decompress=True):
 		buf = base64.b64decode(buf)
 	# Deompress if asked
 	if decompress:
-		buf = pylzma.decompress(buf)
+		buf = compression.decompress(buf)
 
 	# Read header
 	(ver, numHistograms) = struct.unpack("<BI", buf[:5])
@@ -20,6 +20,7 @@
 import os
 import logging
 import traceback
+import numpy
 
 from liveq.models import Lab
 from liveq.config.histograms import HistogramsConfig
@@ -121,10 +122,44 @@ class ReferenceHistograms:
 		chi2count = 0
 		chi2list = {}
 
-		# Iterate in the collection
+		# Collect the normalized histograms and their references
+		histos = [ ]
+		refs = [ ]
 		for histo in histoCollection.values():
-			chi2value = self.histoChi2Reference( histo )
-			chi2list[histo.name] = chi2value
+			chi2list[histo.name] = 0.0
+
+			# Skip empty histograms or histograms without reference
+			if (histo.bins == 0):
+				continue
+			ref = self.loadReferenceHistogram( histo.name )
+			if not ref:
+				continue
+
+			# Normalize
+			try:
+				if not isinstance(histo, Histogram):
+					histos.append( histo.toHistogram().normalize() )
+				else:
+					histos.append( histo.copy().normalize() )
+				refs.append( ref )
+			except Exception as e:
+				logging.error("Exception while calculating chi2 of histogram %s: %s" % (str(histo.name), str(e)))
+				traceback.print_exc()
+
+		# Calculate the chi2 of all the histograms at once
+		chi2values = Histogram.chi2ToReferenceStack( histos, refs )
+
+		# Iterate in the results
+		for i in range(len(histos)):
+			name = histos[i].name
+			chi2value = float(chi2values[i])
+
+			# Histograms that could not be compared count as zero
+			if numpy.isnan(chi2value):
+				logging.error("Unable to calculate chi2 of histogram %s" % str(name))
+				chi2value = 0.0
+
+			chi2list[name] = chi2value
 			if chi2value > 0.0:
 				chi2sum += chi2value
 				chi2count += 1
@@ -195,3 +195,136 @@ def intermediateCollectionMerge(collections):
 	# Return answer
 	return ans
 
+
+class IntermediateCollectionSum:
+	"""
+	Running sums of IntermediateHistogramCollections, that can be updated
+	incrementally by adding and removing collections.
+
+	For every histogram the un-normalized weighted sums are kept (the number
+	of events, the sum of nevts*crosssection and the bin sums weighted with
+	nevts, or nevts^2 for SumW2), so adding or removing a collection costs
+	the same regardless of how many collections were merged. The collection()
+	function returns the same result as intermediateCollectionMerge() on all
+	the collections added.
+	"""
+
+	def __init__(self, sums=None):
+		"""
+		Initialize the running sums, optionally from an IntermediateHistogramCollection
+		with previously packed sums
+		"""
+
+		#: The running sums, as an IntermediateHistogramCollection
+		self.sums = sums
+		if self.sums is None:
+			self.sums = IntermediateHistogramCollection()
+
+	def add(self, collection, sign=1):
+		"""
+		Add the histograms of the given collection to the running sums
+		(or remove them if sign is -1)
+		"""
+
+		# Keep track of the state (0 if the states of the collections differ)
+		if sign > 0:
+			if len(self.sums) == 0:
+				self.sums.state = collection.state
+			elif self.sums.state != collection.state:
+				self.sums.state = 0
+
+		# Process histograms
+		for name, histo in collection.iteritems():
+
+			# Get the running sum of this histogram
+			acc = self.sums.get(name, None)
+
+			# Empty histograms do not contribute to the sums
+			if (histo.bins == 0) or (histo.nevts == 0):
+				if acc is None:
+					self.sums[name] = IntermediateHistogram.empty(name)
+				continue
+
+			# Allocate the running sum using the first non-empty histogram
+			if (acc is None) or (acc.bins == 0):
+				acc = IntermediateHistogram(
+					bins=histo.bins,
+					name=name,
+					meta={ 'nevts': 0, 'crosssection': 0.0 },
+					xlow=numpy.array(histo.xlow, dtype=numpy.float64),
+					xfocus=numpy.array(histo.xfocus, dtype=numpy.float64),
+					xhigh=numpy.array(histo.xhigh, dtype=numpy.float64)
+				)
+				self.sums[name] = acc
+
+			# Check for compatibility
+			elif acc.bins != histo.bins:
+				raise IncompatibleMergeException("Histogram %s is not compatible with the running sum" % name)
+
+			# Update the sums (vectorized)
+			n = float(histo.nevts)
+			acc.Entries += sign*histo.Entries
+			acc.SumW 	+= sign*n*histo.SumW
+			acc.SumW2 	+= sign*n*n*histo.SumW2
+			acc.SumXW 	+= sign*n*histo.SumXW
+			acc.SumX2W 	+= sign*n*histo.SumX2W
+
+			# Update the number of events and the cross-section sum
+			acc.nevts += sign*histo.nevts
+			acc.crosssection += sign*n*histo.crosssection
+
+	def remove(self, collection):
+		"""
+		Remove the histograms of the given collection from the running sums
+		"""
+		self.add(collection, sign=-1)
+
+	def collection(self):
+		"""
+		Return the IntermediateHistogramCollection with the merged histograms
+		"""
+
+		# Create a response collection
+		ans = IntermediateHistogramCollection( state=self.sums.state )
+		for name, acc in self.sums.iteritems():
+
+			# Nothing was merged in this histogram
+			if (acc.bins == 0) or (acc.nevts <= 0):
+				ans[name] = IntermediateHistogram.empty(name)
+				continue
+
+			# Normalize the weighted sums
+			n = float(acc.nevts)
+			ans[name] = IntermediateHistogram(
+				bins=acc.bins,
+				name=name,
+				meta={ 'nevts': acc.nevts, 'crosssection': acc.crosssection / n },
+				xlow=acc.xlow,
+				xfocus=acc.xfocus,
+				xhigh=acc.xhigh,
+				Entries=numpy.array(acc.Entries),
+				SumW=acc.SumW / n,
+				SumW2=acc.SumW2 / (n*n),
+				SumXW=acc.SumXW / n,
+				SumX2W=acc.SumX2W / n
+			)
+
+		# Return collection
+		return ans
+
+	def pack(self, encode=True, compress=True):
+		"""
+		Pack the running sums using the IntermediateHistogramCollection format
+		"""
+		return self.sums.pack(encode=encode, compress=compress)
+
+	@staticmethod
+	def fromPack(buf, decompress=True, decode=True):
+		"""
+		Re-create the running sums from a buffer created with pack()
+		"""
+
+		# Unpack the running sums
+		return IntermediateCollectionSum(
+				IntermediateHistogramCollection.fromPack(buf, decompress=decompress, decode=decode)
+			)
@@ -17,7 +17,6 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 ################################################################
 
-import math
 import logging
 import numpy as np
 
@@ -25,6 +24,142 @@ from numpy import sqrt, sum
 from liveq.models import Lab
 from liveq.config.tuneaddressing import TuneAddressingConfig
 
+class TuneAddressing:
+	"""
+	The neighborhood addressing of the tunes with a given set of parameters,
+	compiled from the tune addressing configuration.
+	"""
+
+	def __init__(self, keys):
+		"""
+		Compile the addressing of the tunes with the specified parameter names
+		"""
+
+		# Keep the configuration we are compiled against
+		self.config = (TuneAddressingConfig.TUNE_CONFIG, TuneAddressingConfig.TUNE_DEFAULT_DECIMALS, TuneAddressingConfig.TUNE_DEFAULT_ROUND)
+
+		# Sort the parameters by their aliased names
+		aliased = [ ]
+		for k in keys:
+			sk = k
+			lk = k.lower()
+			if lk in TuneAddressingConfig.TUNE_CONFIG:
+				sk = TuneAddressingConfig.TUNE_CONFIG[lk]['alias']
+			aliased.append( (sk, k) )
+		aliased.sort()
+
+		#: The parameter names in addressing order
+		self.keys = [ k for (sk, k) in aliased ]
+
+		# Get the rounding and the decimals of every parameter
+		rounds = [ ]
+		decimals = [ ]
+		for k in self.keys:
+			vDecimals = TuneAddressingConfig.TUNE_DEFAULT_DECIMALS
+			vRound = TuneAddressingConfig.TUNE_DEFAULT_ROUND
+			lk = k.lower()
+			if lk in TuneAddressingConfig.TUNE_CONFIG:
+				tv = TuneAddressingConfig.TUNE_CONFIG[lk]
+				vDecimals = int(tv['decimals'])
+				vRound = float(tv['round'])
+			rounds.append(vRound)
+			decimals.append(vDecimals)
+
+		#: The bin size of every parameter, in addressing order
+		self.rounds = np.array(rounds, dtype=np.float64)
+		self.keyRounds = zip(self.keys, rounds)
+
+		#: The format of the neighborhood ID
+		self.format = "%s" + "".join([ ":%%.%if" % d for d in decimals ])
+
+		#: The indices of the parameters of getValues() in addressing order
+		vkeys = sorted(self.keys)
+		self.order = np.array([ vkeys.index(k) for k in self.keys ], dtype=int)
+
+		#: The bin size of every parameter, in the order of getValues()
+		self.valueRounds = np.zeros(len(self.keys))
+		self.valueRounds[self.order] = self.rounds
+
+		#: The width of the neighborhood bin of every parameter, in the
+		#: order of getValues()
+		self.valueBins = np.zeros(len(self.keys))
+		self.valueBins[self.order] = self.rounds * np.power(10.0, -np.array(decimals, dtype=np.float64))
+
+		#: The radius of the interpolation bin
+		self.radius = np.sum( self.rounds / 2.0 )
+
+	def offsets(self, offset):
+		"""
+		Return the bin offsets of the neighbor with the given index
+		"""
+
+		# Apply offset
+		offsets = np.zeros(len(self.keys))
+		if offset > 0:
+
+			# Get element index and amplitude
+			w = pow(3, len(self.keys))
+			elmIndex = offset % w
+			elmAplitude = (offset // w) + 1
+
+			# Convert to base 3 and process
+			i = 0
+			b3Num = elmIndex
+			while True:
+
+				# Get current base and eminder
+				b3Rem = b3Num % 3
+				b3Num = b3Num // 3
+
+				# Update according to value
+				if b3Rem>0:
+					offsets[i] = (b3Rem*2 - 3) * elmAplitude
+
+				# Go to next item
+				i += 1
+
+				# Check if we reached the end
+				if b3Num < 3:
+					if b3Num>0:
+						offsets[i] = (b3Num*2 - 3) * elmAplitude
+					break
+
+		# Return offsets
+		return offsets
+
+	def getNeighborhoodID(self, labid, tune, offset=0):
+		"""
+		Return the neighborhood ID of the given tune
+		"""
+		tidx = [ float(tune[k]) / r for (k, r) in self.keyRounds ]
+		if offset > 0:
+			tidx = np.array(tidx) + self.offsets(offset)
+		return self.format % ((labid,) + tuple(tidx))
+
+	def binIndex(self, values):
+		"""
+		Return the integer coordinates of the neighborhood bin of the given
+		values, in the order of getValues()
+		"""
+		return tuple( np.round( np.asarray(values, dtype=np.float64) / self.valueBins ).astype(int) )
+
+	def binCenter(self, values):
+		"""
+		Return the values at the center of the neighborhood bin of the
+		given values, in the order of getValues()
+		"""
+		return np.array( self.binIndex(values), dtype=np.float64 ) * self.valueBins
+
+	def getNeighborhoodIDs(self, labid, values, offset=0):
+		"""
+		Return the neighborhood IDs of the tunes in the rows of the given
+		matrix, with the parameters in the order of getValues()
+		"""
+		tidx = np.asarray(values, dtype=np.float64)[:, self.order] / self.rounds
+		if offset > 0:
+			tidx = tidx + self.offsets(offset)
+		return [ self.format % ((labid,) + tuple(row)) for row in tidx ]
+
 class Tune(dict):
 	"""
 	The Tune object provides the basic parameters
@@ -33,6 +168,27 @@ class Tune(dict):
 	#: Pre-cached, sorted keys for each known lab id
 	LAB_TUNE_KEYS = { }
 
+	#: Pre-compiled addressing for each known lab id and set of parameters
+	LAB_ADDRESSING = { }
+
+	@staticmethod
+	def getAddressingOf(labid, keys):
+		"""
+		Return the compiled addressing of the tunes of the given lab with the
+		specified parameter names
+		"""
+
+		# Check if we have the answer cached and compiled against
+		# the current configuration
+		ckey = (labid, tuple(sorted(keys)))
+		addr = Tune.LAB_ADDRESSING.get(ckey, None)
+		if (addr is None) or (addr.config != (TuneAddressingConfig.TUNE_CONFIG, TuneAddressingConfig.TUNE_DEFAULT_DECIMALS, TuneAddressingConfig.TUNE_DEFAULT_ROUND)):
+			addr = TuneAddressing(ckey[1])
+			Tune.LAB_ADDRESSING[ckey] = addr
+
+		# Return addressing
+		return addr
+
 	@staticmethod
 	def fromLabData(labid, data):
 		"""
@@ -87,29 +243,15 @@ class Tune(dict):
 		of the edges of any bin used by the interpolation binning
 		mechanism.
 		"""
+		return self.getAddressing().radius
 
-		# Distances for each diemtion
-		dist = []
-
-		# Iterate over the keys
-		for k in self.keys():
-
-			# Setup default tune value calculation variables
-			vRound = TuneAddressingConfig.TUNE_DEFAULT_ROUND
-
-			# Get tune-tuning per tune parameter
-			lk = k.lower()
-			if lk in TuneAddressingConfig.TUNE_CONFIG:
-
-				# Get parameters
-				tv = TuneAddressingConfig.TUNE_CONFIG[lk]
-				vRound = float(tv['round'])
-
-			# Return distance
-			dist.append( (vRound/2.0) ** 2 )
-
-		# Return square root of all the distances
-		return sum(sqrt( np.array(dist) ))
+	def getAddressing(self):
+		"""
+		Return the compiled neighborhood addressing of this tune
+		"""
+		if self._addressing is None:
+			self._addressing = Tune.getAddressingOf(self.labid, self.keys())
+		return self._addressing
 
 	def distanceTo(self, tune):
 		"""
@@ -155,87 +297,8 @@ class Tune(dict):
 		if labid is None:
 			labid = self.labid
 
-		# Start tune id with the lab id
-		tid = str(labid)
-
-		# Generate aliased keys for proper sorting
-		real_key = {}
-		ksorted = []
-		for k in self.keys():
-
-			lk = k.lower()
-			sk = k
-
-			# Get alias for sorting key
-			if lk in TuneAddressingConfig.TUNE_CONFIG:
-				sk = TuneAddressingConfig.TUNE_CONFIG[lk]['alias']
-
-			# Store real key lookup
-			real_key[sk] = k
-
-			# Keep aliased key for sorting
-			ksorted.append(sk)
-
-		# Sort keys ascending
-		ksorted = sorted(ksorted)
-
-		# Apply offset
-		offsets = [0] * len(self)
-		if offset > 0:
-
-			# Get element index and amplitude
-			w = pow(3, len(self))
-			elmIndex = offset % w
-			elmAplitude = int(math.ceil(offset / w)) + 1
-
-			# Convert to base 3 and process
-			i = 0
-			b3Num = elmIndex
-			while True:
-
-				# Get current base and eminder
-				b3Rem = b3Num % 3
-				b3Num = b3Num // 3
-
-				# Update according to value
-				if b3Rem>0:
-					offsets[i] = (b3Rem*2 - 3) * elmAplitude
-
-				# Go to next item
-				i += 1
-
-				# Check if we reached the end
-				if b3Num < 3:
-					if b3Num>0:
-						offsets[i] = (b3Num*2 - 3) * elmAplitude
-					break
-
-		# Start processing parameter indices
-		for i in range(0,len(ksorted)):
-
-			# Get tune value
-			k = real_key[ksorted[i]]
-			v = self[k]
-
-			# Setup default tune value calculation variables
-			vDecimals = TuneAddressingConfig.TUNE_DEFAULT_DECIMALS
-			vRound = TuneAddressingConfig.TUNE_DEFAULT_ROUND
-
-			# Get tune-tuning per tune parameter
-			lk = k.lower()
-			if lk in TuneAddressingConfig.TUNE_CONFIG:
-
-				# Get parameters
-				tv = TuneAddressingConfig.TUNE_CONFIG[lk]
-				vDecimals = int(tv['decimals'])
-				vRound = float(tv['round'])
-
-			# Calculate bin ID
-			tidx = (float(v) / vRound) + offsets[i]
-			tid += (":%." + str(vDecimals) + "f") % tidx
-
-		# Return the tune id
-		return tid
+		# Get the ID from the compiled addressing
+		return self.getAddressing().getNeighborhoodID(labid, self, offset)
 
 	def getValues(self):
 		"""
@@ -264,6 +327,7 @@ class Tune(dict):
 
 		# Reset values
 		self._values = None
+		self._addressing = None
 
 		# Setup dict with the rest arguments
 		dict.__init__(self, *args, **kwargs)
@@ -273,4 +337,21 @@ class Tune(dict):
 		Override itemset operator in order to invalidate the value cache
 		"""
 		self._values = None
-		dict.__setitem__(self,k,v)
\ No newline at end of file
+		self._addressing = None
+		dict.__setitem__(self,k,v)
+
+	def __getstate__(self):
+		"""
+		Do not pickle the compiled addressing
+		"""
+		state = dict(self.__dict__)
+		state['_addressing'] = None
+		return state
+
+	def __setstate__(self, state):
+		"""
+		Restore the instance variables, including the ones missing from
+		tunes pickled by older versions
+		"""
+		self.__dict__.update(state)
+		self._addressing = None
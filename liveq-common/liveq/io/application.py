@@ -45,6 +45,10 @@ class JobApplication(EventDispatcher):
 		self.logger = logging.getLogger("application")
 		self.logger.debug("Class '%s' instantiated" % self.__class__.__name__)
 
+		#: If True, the intermediate 'job_data' events can carry only the
+		#: histograms changed since the previous event (partial updates)
+		self.partialUpdates = False
+
 	def start(self):
 		"""
 		Launch application binaries
@@ -69,3 +73,10 @@ class JobApplication(EventDispatcher):
 		"""
 		raise NotImplementedError("The application class did not implement the setConfig() function")
 
+	def requestFullUpdate(self):
+		"""
+		Request the next intermediate 'job_data' event to carry the full data
+		(applications that never send partial updates can ignore this)
+		"""
+		pass
+
@@ -17,6 +17,7 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 ################################################################
 
+import base64
 from liveq.events import EventDispatcher
 
 class BusChannelException(Exception):
@@ -37,6 +38,35 @@ class NoBusChannelException(BusChannelException):
 	def __str__(self):
 		return "No channel '%s' is available on the bus" % str(self.value)
 
+class BinaryPayload(str):
+	"""
+	A raw binary buffer placed in the data of a bus message.
+
+	Buses that support binary frames transfer it as-is, without any
+	encoding. Buses that can only carry text base64-encode it, using
+	the textPayload() function.
+	"""
+	pass
+
+def textPayload(data):
+	"""
+	Replace every BinaryPayload in the given message data with it's
+	base64-encoded version, for buses that can only carry text.
+	"""
+
+	# Encode binary payloads
+	if isinstance(data, BinaryPayload):
+		return base64.b64encode(data)
+
+	# Walk containers
+	elif isinstance(data, dict):
+		return dict([ (k, textPayload(v)) for k,v in data.iteritems() ])
+	elif isinstance(data, list) or isinstance(data, tuple):
+		return [ textPayload(v) for v in data ]
+
+	# Everything else is passed as-is
+	return data
+
 class BusChannel(EventDispatcher):
 	"""
 	A channel on a bus that the user can send messages or listen for other
@@ -57,9 +87,27 @@ class BusChannel(EventDispatcher):
 	def send(self, name, data, waitReply=False, timeout=30):
 		"""
 		Sends a message to the bus
+
+		Raw binary buffers can be sent by wrapping them in a BinaryPayload.
 		"""
 		raise NotImplementedError("The BusChannel did not implement the send() function")
 
+	def sendAsync(self, name, data):
+		"""
+		Sends a message to the bus without waiting for the reply and returns
+		a handle that should be passed to collectReply().
+
+		Channels that cannot send asynchronously wait for the reply here.
+		"""
+		return { "data": self.send(name, data, waitReply=True) }
+
+	def collectReply(self, handle, timeout=30):
+		"""
+		Wait for the reply to a message sent with sendAsync() and return it,
+		or None if it did not arrive within the specified timeout
+		"""
+		return handle["data"]
+
 	def reply(self, data):
 		"""
 		Reply to the last message received
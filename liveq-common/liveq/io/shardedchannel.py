@@ -0,0 +1,187 @@
+################################################################
+# LiveQ - An interactive volunteering computing batch system
+# Copyright (C) 2013 Ioannis Charalampidis
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+################################################################
+
+import logging
+import threading
+import collections
+
+from liveq.io.bus import BusChannel, BinaryPayload
+from liveq.utils.hashring import HashRing
+from liveq.data.tune import Tune
+from liveq.data.histo.interpolate import InterpolatableCollection
+
+class ShardedChannel(BusChannel):
+	"""
+	A channel that routes every message to one of many bus channels, using
+	a consistent hash of the key the keyFunction returns for the message.
+	"""
+
+	def __init__(self, name, channels, keyFunction):
+		"""
+		Initialize the channel over the specified shard channels
+		"""
+		BusChannel.__init__(self, name)
+		self.channels = channels
+		self.keyFunction = keyFunction
+		self.ring = HashRing( range(0, len(channels)) )
+
+	def getChannel(self, name, data):
+		"""
+		Return the shard channel that should receive the given message
+		"""
+
+		# Get the routing key
+		key = None
+		try:
+			key = self.keyFunction(name, data)
+		except Exception as e:
+			logging.warn("Unable to get the shard key of message '%s' (%s)" % (name, str(e)))
+
+		# Messages without key go to the first shard
+		if key is None:
+			return self.channels[0]
+		return self.channels[ self.ring.getNode(key) ]
+
+	def send(self, name, data, waitReply=False, timeout=30):
+		"""
+		Send a message to the shard responsible for it
+		"""
+
+		# Batch requests can span many shards
+		if (name == 'interpolate_batch') and isinstance(data.get('parameters', None), list):
+			return self.sendBatch(name, data, waitReply=waitReply, timeout=timeout)
+
+		return self.getChannel(name, data).send(name, data, waitReply=waitReply, timeout=timeout)
+
+	def sendBatch(self, name, data, waitReply=False, timeout=30):
+		"""
+		Split a batch interpolation request by shard, send one sub-batch to
+		every shard in parallel and merge their replies in the request order.
+		"""
+
+		# Group the tunes of the batch by shard channel
+		groups = collections.OrderedDict()
+		for i in range(0, len(data['parameters'])):
+			channel = self.getChannel(name, dict(data, parameters=[ data['parameters'][i] ]))
+			groups.setdefault(channel, []).append(i)
+
+		# Nothing to split
+		if len(groups) <= 1:
+			return self.getChannel(name, data).send(name, data, waitReply=waitReply, timeout=timeout)
+
+		# Send sub-batches in parallel
+		replies = { }
+		def sendGroup(channel, idx):
+			replies[channel] = channel.send(name, dict(data, parameters=[ data['parameters'][i] for i in idx ]), waitReply=waitReply, timeout=timeout)
+		threads = [ threading.Thread(target=sendGroup, args=(channel, idx)) for (channel, idx) in groups.iteritems() ]
+		for t in threads:
+			t.start()
+		for t in threads:
+			t.join()
+
+		# Nothing to merge
+		if not waitReply:
+			return None
+
+		# Place the results of every sub-batch in the original slots
+		meta = [ None ] * len(data['parameters'])
+		histos = [ None ] * len(data['parameters'])
+		error = None
+		for (channel, idx) in groups.iteritems():
+			reply = replies.get(channel, None)
+
+			# Keep an error for the tunes of the failed shards
+			if (reply is None) or (reply.get('result', None) != 'ok'):
+				if reply is None:
+					reply = { 'result': 'error', 'error': 'Interpolator shard did not reply' }
+				error = reply
+				for i in idx:
+					meta[i] = { 'error': reply.get('error', 'Interpolation failed') }
+				continue
+
+			# Unpack results
+			results = InterpolatableCollection.fromPackMany( reply['data'] )
+			for j in range(0, len(idx)):
+				meta[idx[j]] = reply['meta'][j]
+				histos[idx[j]] = results[j]
+
+		# Fail only if no tune could be interpolated
+		if all([ h is None for h in histos ]):
+			return error
+
+		# Return the merged reply
+		return {
+			'result': 'ok',
+			'exact': 0,
+			'meta': meta,
+			'data': BinaryPayload(InterpolatableCollection.packMany(histos, encode=False))
+		}
+
+	def close(self):
+		"""
+		Close all the shard channels
+		"""
+		for c in self.channels:
+			c.close()
+
+def interpolatorShardKey(name, data):
+	"""
+	Return the shard key of a message to the interpolator, that is the
+	neighborhood ID (which includes the lab ID) of the tune it refers to.
+
+	Batch requests that are not split by the channel are routed by their
+	first tune.
+	"""
+
+	# Interpolation requests and results sent with their tune
+	if ('lab' in data) and ('parameters' in data):
+		parameters = data['parameters']
+		if isinstance(parameters, list):
+			if not parameters:
+				return None
+			parameters = parameters[0]
+		return Tune(parameters, labid=data['lab']).getNeighborhoodID()
+
+	# Otherwise get the tune from the packed results
+	if 'data' in data:
+		histos = InterpolatableCollection.fromPack( data['data'] )
+		if histos.tune:
+			return histos.tune.getNeighborhoodID()
+
+	# No key
+	return None
+
+def interpolatorChannelName(shard):
+	"""
+	Return the name of the bus channel served by the given interpolator shard
+	"""
+	return "interpolate-%i" % shard
+
+def openInterpolatorChannel(bus, shards=1):
+	"""
+	Open the channel to the interpolator. If many interpolator shards are
+	running, a ShardedChannel that routes the messages to them is returned.
+	"""
+
+	# Single interpolator
+	if shards <= 1:
+		return bus.openChannel("interpolate")
+
+	# Route to interpolator shards
+	return ShardedChannel("interpolate", [ bus.openChannel(interpolatorChannelName(i)) for i in range(0, shards) ], interpolatorShardKey)
@@ -218,16 +218,20 @@ class Lab(BaseModel):
 		# Return tunable configuration
 		return config
 
-	def formatTunables(self, tunables, asString=False):
+	def formatTunables(self, tunables, asString=False, cfgTunables=None):
 		"""
 		Format tunables
+
+		The tunable configuration already fetched with getTunables() can be
+		passed as cfgTunables, to avoid querying it again.
 		"""
 
 		# Prepare response
 		ans = { }
 
 		# Process tunables
-		cfgTunables = self.getTunables()
+		if cfgTunables is None:
+			cfgTunables = self.getTunables()
 		for t in cfgTunables:
 
 			# Get value
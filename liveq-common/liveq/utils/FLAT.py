@@ -19,14 +19,60 @@
 
 import numpy
 import re
+import warnings
+
+def parseFLATValues(lines):
+	"""
+	Convert the given histogram data lines into a 2D numpy array, one row
+	per line. The entire block is converted with a single bulk conversion,
+	falling back to line-by-line parsing only on irregular blocks.
+	"""
+
+	# Empty blocks have no values
+	if not lines:
+		return [ ]
+
+	# Bulk-convert the entire block if every line has the
+	# column count of the first line
+	numCols = len(lines[0].split())
+	if (numCols >= 3) and all([ len(line.split()) == numCols for line in lines ]):
+		with warnings.catch_warnings():
+			warnings.simplefilter("ignore")
+			values = numpy.fromstring(" ".join(lines), dtype=numpy.float64, sep=" ")
+		if values.size == numCols*len(lines):
+			return values.reshape( (len(lines), numCols) )
+
+	# Irregular block, parse line by line
+	rows = [ ]
+	for line in lines:
+
+		# Split data values
+		data = FLATParser.WHITESPACE.split(line.strip())
+
+		# Check for faulty values
+		if len(data) < 3:
+			continue
+
+		# Otherwise collect
+		rows.append( numpy.array(data, dtype=numpy.float64) )
+
+	# Return a 2D array if the rows are regular
+	if not rows:
+		return [ ]
+	if len(set([ len(r) for r in rows ])) == 1:
+		return numpy.array(rows)
+	return rows
 
 def parseFLATBuffer(buf, index=True):
 	"""
-	Parse FLAT buffer and return the structured data
+	Parse FLAT buffer and return the structured data.
+
+	The histogram data of every section are returned in the 'v' field,
+	as a 2D numpy array with one row per bin.
 	"""
-	sections_list = []
 	section = None
 	activesection = None
+	activelines = None
 
 	# Pick appropriate return format
 	sections = None
@@ -48,7 +94,6 @@ def parseFLATBuffer(buf, index=True):
 			# Ignore labels found some times in AIDA files
 			dat = line.split(" ")
 			section = dat[2]
-			sectiontype = 0
 
 			# Get additional section title
 			title = ""
@@ -57,8 +102,13 @@ def parseFLATBuffer(buf, index=True):
 
 			# Allocate section record
 			activesection = { "d": { }, "v": [ ], "t": title }
+			activelines = [ ]
 
 		elif ("# END " in line) and (section != None):
+
+			# Convert all the data lines of the section at once
+			activesection['v'] = parseFLATValues( activelines )
+
 			# Section end
 			if index:
 				sections[section] = activesection
@@ -67,7 +117,7 @@ def parseFLATBuffer(buf, index=True):
 				sections.append(activesection)
 			section = None
 
-		elif line.startswith("#") or line.startswith(";"):
+		elif line[0] == "#" or line[0] == ";":
 			# Comment
 			pass
 
@@ -78,25 +128,15 @@ def parseFLATBuffer(buf, index=True):
 			if section == "SPECIAL":
 				continue
 
-			# Try to split
-			data = line.split("=",1)
-
-			# Could not split : They are histogram data
-			if len(data) == 1:
-
-				# Split data values
-				data = FLATParser.WHITESPACE.split(line.strip())
-
-				# Check for faulty values
-				if len(data) < 3:
-					continue
-
-				# Otherwise collect
-				activesection['v'].append( numpy.array(data, dtype=numpy.float64) )
+			# Lines without '=' are histogram data, collected
+			# for bulk conversion at the end of the section
+			if not "=" in line:
+				activelines.append( line )
 
 			else:
 
 				# Store value
+				data = line.split("=",1)
 				activesection['d'][data[0]] = data[1]
 
 	# Return sections
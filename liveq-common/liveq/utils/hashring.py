@@ -0,0 +1,69 @@
+################################################################
+# LiveQ - An interactive volunteering computing batch system
+# Copyright (C) 2013 Ioannis Charalampidis
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+################################################################
+
+"""
+Consistent Hashing
+
+This module provides a consistent hash ring that maps arbitrary keys to a set
+of nodes, so that adding or removing a node only moves the keys of that node.
+"""
+
+import bisect
+import hashlib
+
+class HashRing:
+	"""
+	A consistent hash ring with a number of virtual points for every node
+	"""
+
+	def __init__(self, nodes, replicas=160):
+		"""
+		Place the specified nodes on the ring
+		"""
+
+		# Place the virtual points of every node
+		ring = [ ]
+		for node in nodes:
+			for i in range(0, replicas):
+				ring.append( (HashRing.hash("%s:%i" % (node, i)), node) )
+		ring.sort()
+
+		# Keep the sorted points and their nodes
+		self.points = [ p for (p, node) in ring ]
+		self.nodes = [ node for (p, node) in ring ]
+
+	@staticmethod
+	def hash(key):
+		"""
+		Return the position of the given key on the ring
+		"""
+		return int( hashlib.md5(str(key)).hexdigest()[0:16], 16 )
+
+	def getNode(self, key):
+		"""
+		Return the node responsible for the specified key
+		"""
+
+		# No nodes
+		if not self.points:
+			return None
+
+		# Pick the first point clockwise from the key
+		i = bisect.bisect( self.points, HashRing.hash(key) ) % len(self.points)
+		return self.nodes[i]
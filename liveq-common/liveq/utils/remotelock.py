@@ -23,19 +23,21 @@ Remote Locking Mechanism
 This class provides the menas of acquiring exclusive locks between multiple
 computers. It's back-end is usually the system-wide ``Store `` object.
 
-.. warning::
-	This locking mechanism does not offer any protection against sudden termination
-	of an instance.
+The owner key of a lock expires if it is not refreshed, so a lock held by
+an instance that was suddenly terminated is released after a while.
 
 """
 
 import uuid
 import os
+import time
 import atexit
 import thread
 import logging
+import threading
 
 from threading import Lock
+from redis.exceptions import WatchError
 
 # Register cleanup
 @atexit.register
@@ -53,6 +55,18 @@ def remotelockExitCleanup():
 	# Empty list
 	RemoteLock.REAP_LIST = []
 
+def remotelockRefresh():
+	"""
+	Refresh the expiry of all the locks held by this instance
+	"""
+	while True:
+		time.sleep( RemoteLock.EXPIRE / 3.0 )
+		for e in list(RemoteLock.REAP_LIST):
+			try:
+				e.refresh()
+			except Exception as ex:
+				logging.warn("Unable to refresh lock '%s' (%s)" % (e.lockKey, str(ex)))
+
 class RemotePresence:
 	"""
 	This class provides a sudden-termination detection mechanism that works
@@ -102,16 +116,27 @@ class RemoteLock:
 	#: A list of locked object to be released upon unexpected termination
 	REAP_LIST = [ ]
 
+	#: The time (in seconds) after which a lock that is not refreshed
+	#: expires, in case its owner died while holding it
+	EXPIRE = 60
+
+	#: The thread refreshing the locks held by this instance
+	REFRESH_THREAD = None
+
+	#: Lock protecting the creation of the refresh thread
+	REFRESH_LOCK = Lock()
+
 	def __init__(self, instance, key):
 		"""
 		Initialize RemoteLock
 
 		Parametes:
-			instance (instance) : A store instance that proides the .get(), .set(), .blpop(), .lpop(), .rpush(), and .llen() functions.
+			instance (instance) : A store instance that proides the .get(), .set(), .expire(), .delete(), .blpop(), .lpop(), .rpush(), .llen() and .pipeline() functions.
 			key (string)		: The key name to use for locking purposes
 		"""
 		self.lockInstance = instance
 		self.lockKey = key
+		self.lockToken = None
 		self.lockActive = False
 		self.lockInterThread = Lock()
 		self.lockPresence = RemotePresence( instance, RemoteLock.INSTANCE_ID )
@@ -126,12 +151,50 @@ class RemoteLock:
 
 		# Check if it's present
 		if locker:
-			if self.lockPresence.isAlive(self.lockInstance, locker):
+			if self.lockPresence.isAlive(self.lockInstance, locker.split(":")[0]):
 				return True
 
 		# Either it's not present or the locking entity is not alive
 		return False
 
+	def _ifOwner(self, token, action):
+		"""
+		Atomically run the given action on a pipeline, only if the owner of
+		the lock is the given token. Returns True if the action was run.
+		"""
+		ownerKey = "%s:owner" % self.lockKey
+		pipe = self.lockInstance.pipeline()
+		try:
+			while True:
+				try:
+					# Watch the owner, so the check and the action are atomic
+					pipe.watch( ownerKey )
+					if pipe.get( ownerKey ) != token:
+						return False
+
+					# Run action
+					pipe.multi()
+					action(pipe)
+					pipe.execute()
+					return True
+
+				except WatchError:
+					# The owner changed in the meantime, check again
+					continue
+		finally:
+			pipe.reset()
+
+	def refresh(self):
+		"""
+		Extend the expiry of the lock, as long as we are still its owner
+		"""
+		token = self.lockToken
+		if token is None:
+			return
+		if not self._ifOwner( token, lambda pipe: pipe.expire( "%s:owner" % self.lockKey, RemoteLock.EXPIRE ) ):
+			if self.lockToken == token:
+				logging.warn("Lock '%s' expired while being held" % self.lockKey)
+
 	def acquire(self, blocking=False, signal=None):
 		"""
 		Acquire a lock, blocking or non-blocking.
@@ -145,46 +208,46 @@ class RemoteLock:
 		if self.lockActive:
 			return self.lockInterThread.acquire(blocking)
 
-		# Check if the queue is locked by somebody else		
-		if self.is_locked():
+		# Try to atomically become the owner of the lock, with an owner
+		# key that expires if we die while holding it
+		token = "%s:%s" % (RemoteLock.INSTANCE_ID, uuid.uuid4().hex)
+		while not self.lockInstance.set( "%s:owner" % self.lockKey, token, nx=True, ex=RemoteLock.EXPIRE ):
+
+			# Take over the lock if the locking entity is not alive
+			locker = self.lockInstance.get( "%s:owner" % self.lockKey )
+			if locker and not self.lockPresence.isAlive(self.lockInstance, locker.split(":")[0]):
+				self._ifOwner( locker, lambda pipe: pipe.delete( "%s:owner" % self.lockKey ) )
+				continue
 
 			# If we are non-blocking do nothing
 			if not blocking:
-					return False
+				return False
 
-			# Otherwise, register us on the waiting list 
+			# Otherwise, register us on the waiting list and wait for
+			# the owner to release it, trying again every second in
+			# case the release happened before we registered
 			self.lockInstance.rpush( "%s:observers" % self.lockKey, RemoteLock.INSTANCE_ID )
-
-			# Get the instance id of the entity locking the queue
-			locker = self.lockInstance.get( "%s:owner" % self.lockKey )
-
-			# And wait for response, checking every 10 seconds for the 
-			# health of the other party
-			while True:
-				try:
-					self.lockInstance.blpop( "%s:lock" % self.lockKey, 10 )
-					break
-				except Exception as e:
-					# An exception is raised when the request timed out
-					if not self.lockPresence.isAlive(self.lockInstance, locker):
-						# The locking instance is actually dead. Continue
-						break
-
-			# Remove us from the observing list
-			self.lockInstance.lpop( "%s:observers" % self.lockKey )
+			try:
+				self.lockInstance.blpop( "%s:lock" % self.lockKey, 1 )
+			finally:
+				self.lockInstance.lpop( "%s:observers" % self.lockKey )
 
 		# Start the presence agent
 		self.lockPresence.start()
 
-		# Make ourselves the new owners of the list 
-		self.lockInstance.set( "%s:owner" % self.lockKey, RemoteLock.INSTANCE_ID )
-
 		# Let future calls know that we acquired the lock (state sync)
+		self.lockToken = token
 		self.lockActive = True
 		self.lockInterThread.acquire(False)
 
-		# Add us on the reap list so we get released even if we crash
+		# Add us on the reap list so we get released even if we crash,
+		# and refreshed while we hold the lock
 		RemoteLock.REAP_LIST.append(self)
+		with RemoteLock.REFRESH_LOCK:
+			if RemoteLock.REFRESH_THREAD is None:
+				RemoteLock.REFRESH_THREAD = threading.Thread(target=remotelockRefresh)
+				RemoteLock.REFRESH_THREAD.daemon = True
+				RemoteLock.REFRESH_THREAD.start()
 
 		# Return true
 		return True
@@ -210,23 +273,21 @@ class RemoteLock:
 		# Get the number of observers in the lock queue
 		numObservers = self.lockInstance.llen( "%s:observers" % self.lockKey )
 
-		# Begin transaction ---------
-		pipe = self.lockInstance.pipeline()
-
-		# Remove us from the owners
-		pipe.delete( "%s:owner" % self.lockKey)
-
-		# Unlock observers
-		for i in range(0, numObservers):
-			pipe.rpush( "%s:lock" % self.lockKey, RemoteLock.INSTANCE_ID )
-
-		# Execute transaction -------
-		pipe.execute()
+		# Remove us from the owners and unlock observers, only if we are
+		# still the owners. Otherwise the lock expired and somebody else
+		# might be holding it now.
+		def unlock(pipe):
+			pipe.delete( "%s:owner" % self.lockKey, "%s:lock" % self.lockKey )
+			for i in range(0, numObservers):
+				pipe.rpush( "%s:lock" % self.lockKey, RemoteLock.INSTANCE_ID )
+		if not self._ifOwner( self.lockToken, unlock ):
+			logging.warn("Lock '%s' expired while being held" % self.lockKey)
 
 		# Stop the presence agent
 		self.lockPresence.stop()
 
 		# Also release the interthread lock
+		self.lockToken = None
 		self.lockActive = False
 		self.lockInterThread.release()
 
@@ -25,9 +25,13 @@ import random
 import numpy as np
 
 from liveq.component import Component
+from liveq.io.bus import Bus, BinaryPayload
+from liveq.io.shardedchannel import interpolatorChannelName
 
 from interpolator.config import Config
-from interpolator.data.store import HistogramStore
+from interpolator.data.store import HistogramStore, ModelCache
+from interpolator.data.exact import ExactResults
+from interpolator.preload import Preloader
 
 import liveq.data.histo.io as io
 from liveq.data.histo.intermediate import IntermediateHistogramCollection
@@ -40,22 +44,50 @@ class InterpolatorComponent(Component):
 	Core jobmanager
 	"""
 
-	def __init__(self):
+	def __init__(self, channel=None):
 		"""
-		Setup interpolator
+		Setup interpolator, serving the specified channel or the channel of
+		the configured shard.
 		"""
 		Component.__init__(self)
 
 		# Setup logger
 		self.logger = logging.getLogger("interpolator")
 
-		# Open the interpolator
-		self.ipolChannel = Config.IBUS.openChannel("interpolate")
+		# Open the interpolator channel, or the channel of our shard
+		# if many interpolator shards are running
+		if channel is not None:
+			self.ipolChannel = channel
+		elif Config.IPOL_SHARDS > 1:
+			self.logger.info("Serving interpolator shard %i/%i" % (Config.SHARD, Config.IPOL_SHARDS))
+			self.ipolChannel = Config.IBUS.openChannel(interpolatorChannelName(Config.SHARD), Bus.OPEN_BIND)
+		else:
+			self.ipolChannel = Config.IBUS.openChannel("interpolate")
+
+		# Build the models of the hot neighborhoods
+		self.preloader = Preloader(Config.PRELOAD, Config.PRELOAD_THREADS)
+		if Config.PRELOAD > 0:
+			self.preloader.start()
+			if Config.PRELOAD_WAIT:
+				self.preloader.wait()
 
 		# Bind events
+		self.ipolChannel.on('status', self.onStatusRequest)
 		self.ipolChannel.on('interpolate', self.onInterpolateRequest)
+		self.ipolChannel.on('interpolate_batch', self.onInterpolateBatchRequest)
 		self.ipolChannel.on('results', self.onInterpolateResults)
 
+	def onStatusRequest(self, data):
+		"""
+		Reply the warm-start progress and the model cache status
+		"""
+		self.ipolChannel.reply({
+				'result': 'ok',
+				'shard': Config.SHARD,
+				'preload': self.preloader.status(),
+				'models': len(ModelCache.CACHE)
+			})
+
 	def onInterpolateRequest(self, data):
 		"""
 		A request in the interpolator bus to get an estimate
@@ -80,6 +112,22 @@ class InterpolatorComponent(Component):
 		if 'histograms' in data:
 			histoTrim = data['histograms']
 
+		# Count the request for the warm-start of the next runs
+		HistogramStore.recordRequest(tune, histoTrim)
+
+		# Reply the results of a completed job with the same tune if we have one
+		exact = ExactResults.find(data['lab'], data['parameters'], histoTrim)
+		if exact is not None:
+			(jobID, payload) = exact
+			self.logger.info("Exact match with job %s" % jobID)
+			self.ipolChannel.reply({
+					'result': 'ok',
+					'exact': 1,
+					'meta': { 'job': int(jobID) },
+					'data': BinaryPayload(payload)
+				})
+			return
+
 		# Get an interpolator for this region
 		ipol = HistogramStore.getInterpolator(tune, histograms=histoTrim)
 		if not ipol:
@@ -100,9 +148,51 @@ class InterpolatorComponent(Component):
 				'result': 'ok',
 				'exact': 0,
 				'meta': ipol.meta,
-				'data': histograms.pack()
+				'data': BinaryPayload(histograms.pack(encode=False))
+			})
+
+
+	def onInterpolateBatchRequest(self, data):
+		"""
+		A request in the interpolator bus to get an estimate for many tunes
+		at once. The 'parameters' field is a list of parameter sets.
+
+		The reply has a result for every tune in the request order. The
+		request fails only if none of the tunes could be interpolated.
+		"""
+
+		# Ensure we have required parameters in the data
+		if not all([ x in data for x in ('lab', 'parameters', 'histograms')]) or not isinstance(data['parameters'], list):
+			self.logger.warn("Missing parameters in the batch interpolation request")
+			self.ipolChannel.reply({
+				'result': 'error',
+				'error': "Missing parameters in the request"
+			})
+			return
+
+		# Log
+		self.logger.info("Interpolating %i tunes for lab %s" % (len(data['parameters']), data['lab']))
+
+		# Generate tune objects
+		tunes = [ Tune(p, labid=data['lab']) for p in data['parameters'] ]
+
+		# Interpolate all of them
+		results = HistogramStore.interpolateBatch(tunes, histograms=data['histograms'])
+		if all([ histograms is None for (histograms, meta) in results ]):
+			self.ipolChannel.reply({
+					'result': 'error',
+					'error': 'Not enough data for interpolation'
 			})
+			return
 
+		# Return all the histogram collections packed together, leaving an
+		# empty slot and a per-tune error for the tunes without enough data
+		self.ipolChannel.reply({
+				'result': 'ok',
+				'exact': 0,
+				'meta': [ { 'error': 'Not enough data for interpolation' } if histograms is None else meta for (histograms, meta) in results ],
+				'data': BinaryPayload(InterpolatableCollection.packMany([ histograms for (histograms, meta) in results ], encode=False))
+			})
 
 	def onInterpolateResults(self, data):
 		"""
@@ -31,9 +31,70 @@ class InterpolatorConfig:
 	Local configuration for the interpolator
 	"""
 
+	#: How many solved interpolators to keep in memory
+	MODEL_CACHE_SIZE = 64
+
+	#: The maximum distance of the samples used for interpolation from
+	#: the center of the bin of the tune, in neighborhood bins
+	MAX_DISTANCE = 1.5
+
+	#: The interpolator shard served by this instance
+	SHARD = 0
+
+	#: How many hot neighborhoods to preload on startup
+	PRELOAD = 0
+
+	#: The length (in seconds) of the windows of the request statistics
+	#: used for finding the hot neighborhoods
+	HOT_WINDOW = 3600
+
+	#: How many windows of request statistics to keep
+	HOT_WINDOWS = 24
+
+	#: How many neighborhoods to keep in every window
+	HOT_KEEP = 1000
+
+	#: The number of threads used for preloading
+	PRELOAD_THREADS = 2
+
+	#: Wait for the preload to complete before serving requests
+	PRELOAD_WAIT = False
+
+	#: The job manager results directory, used for exact matches
+	RESULTS_PATH = ""
+
 	@staticmethod
 	def fromConfig(config, runtimeConfig):
-		pass
+
+		# Get the size of the interpolator cache
+		if config.has_option("interpolator", "model_cache"):
+			InterpolatorConfig.MODEL_CACHE_SIZE = config.getint("interpolator", "model_cache")
+
+		# Get the maximum distance of the samples
+		if config.has_option("interpolator", "max_distance"):
+			InterpolatorConfig.MAX_DISTANCE = config.getfloat("interpolator", "max_distance")
+
+		# Get the shard served by this instance
+		if config.has_option("interpolator", "shard"):
+			InterpolatorConfig.SHARD = config.getint("interpolator", "shard")
+
+		# Get the warm-start preload configuration
+		if config.has_option("interpolator", "preload"):
+			InterpolatorConfig.PRELOAD = config.getint("interpolator", "preload")
+		if config.has_option("interpolator", "hot_window"):
+			InterpolatorConfig.HOT_WINDOW = config.getint("interpolator", "hot_window")
+		if config.has_option("interpolator", "hot_windows"):
+			InterpolatorConfig.HOT_WINDOWS = config.getint("interpolator", "hot_windows")
+		if config.has_option("interpolator", "hot_keep"):
+			InterpolatorConfig.HOT_KEEP = config.getint("interpolator", "hot_keep")
+		if config.has_option("interpolator", "preload_threads"):
+			InterpolatorConfig.PRELOAD_THREADS = config.getint("interpolator", "preload_threads")
+		if config.has_option("interpolator", "preload_wait"):
+			InterpolatorConfig.PRELOAD_WAIT = config.getboolean("interpolator", "preload_wait")
+
+		# Get the results directory of the job manager
+		if config.has_option("interpolator", "results_path"):
+			InterpolatorConfig.RESULTS_PATH = config.get("interpolator", "results_path")
 
 """
 Create a configuration for the JOB MANAGER based on the core config
@@ -0,0 +1,99 @@
+################################################################
+# LiveQ - An interactive volunteering computing batch system
+# Copyright (C) 2013 Ioannis Charalampidis
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+################################################################
+
+import os
+import base64
+import logging
+import threading
+
+from liveq.models import Lab, JobQueue
+from liveq.data.histo.intermediate import IntermediateHistogramCollection
+
+from interpolator.config import Config
+
+class ExactResults:
+	"""
+	Look-up of the results of completed jobs that were run with exactly
+	the requested tune, using the lab-<uuid>:exact index of the job value
+	indices, filled by the job manager, and its results dumps.
+	"""
+
+	#: The (lab, tunables) looked-up so far, by UUID
+	LABS = { }
+
+	#: Lock protecting the lab cache
+	LOCK = threading.Lock()
+
+	@staticmethod
+	def getLab(labid):
+		"""
+		Return the lab with the given UUID and its tunable configuration,
+		or (None, None) if it does not exist
+		"""
+		with ExactResults.LOCK:
+			if not labid in ExactResults.LABS:
+				try:
+					lab = Lab.get(Lab.uuid == labid)
+				except Lab.DoesNotExist:
+					return (None, None)
+				ExactResults.LABS[labid] = (lab, lab.getTunables())
+			return ExactResults.LABS[labid]
+
+	@staticmethod
+	def find(labid, parameters, histograms=None):
+		"""
+		Return the ID of the completed job with the given tune and the raw
+		(unencoded) packed IntermediateHistogramCollection of its results,
+		trimmed to the given histograms, or None if there is no such job or
+		its results are not available.
+		"""
+
+		# Exact matches are disabled without the results directory
+		if not Config.RESULTS_PATH:
+			return None
+
+		# Find a completed job with the same tune
+		try:
+			(lab, tunables) = ExactResults.getLab(labid)
+			if lab is None:
+				return None
+			index = JobQueue.getValueIndex( lab.formatTunables(parameters, cfgTunables=tunables) )
+			jobID = Config.STORE.hget( "lab-%s:exact" % labid, index )
+		except Exception as e:
+			logging.warn("Unable to look-up exact match for lab %s (%s)" % (labid, str(e)))
+			return None
+		if not jobID:
+			return None
+
+		# Load the results dump of the job
+		dumpPath = "%s/job-%s.bin" % (Config.RESULTS_PATH, jobID)
+		if not os.path.exists(dumpPath):
+			return None
+		with open(dumpPath, "rb") as f:
+			payload = f.read()
+		if not payload:
+			return None
+		payload = base64.b64decode(payload)
+
+		# Keep only the histograms of interest
+		if histograms is not None:
+			payload = IntermediateHistogramCollection.fromPack( payload, decode=False ).subset( histograms ).pack( encode=False )
+
+		# Return job and decoded payload
+		return (jobID, payload)
@@ -0,0 +1,125 @@
+################################################################
+# LiveQ - An interactive volunteering computing batch system
+# Copyright (C) 2013 Ioannis Charalampidis
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+################################################################
+
+import heapq
+import numpy as np
+
+class KDTree:
+	"""
+	A static k-dimensional tree for k-nearest neighbour lookups.
+
+	Every inner node splits the points on the median of the dimension with
+	the largest spread, and the leaves keep up to leafSize point indices that
+	are scanned with numpy when visited.
+	"""
+
+	def __init__(self, points, leafSize=16):
+		"""
+		Build a tree over the specified (N x dimensions) array of points
+		"""
+
+		# Keep the points
+		self.points = np.asarray(points, dtype=np.float64)
+		self.leafSize = max(1, leafSize)
+
+		# Build the tree
+		self.root = None
+		if len(self.points) > 0:
+			self.root = self._build( np.arange(len(self.points)) )
+
+	def __len__(self):
+		"""
+		Return the number of points in the tree
+		"""
+		return len(self.points)
+
+	def _build(self, idx):
+		"""
+		Build the sub-tree with the points of the specified indices
+		"""
+
+		# Small enough sets become leaves
+		if len(idx) <= self.leafSize:
+			return (None, None, idx, None)
+
+		# Split on the dimension with the largest spread
+		pts = self.points[idx]
+		spread = pts.max(axis=0) - pts.min(axis=0)
+		dim = int(np.argmax(spread))
+
+		# If all the points are the same, that's a leaf
+		if spread[dim] == 0:
+			return (None, None, idx, None)
+
+		# Split on the median
+		order = np.argsort(pts[:,dim], kind='mergesort')
+		mid = len(idx) // 2
+		split = pts[order[mid], dim]
+
+		# Create node
+		return (dim, split, self._build(idx[order[:mid]]), self._build(idx[order[mid:]]))
+
+	def query(self, x, k=1):
+		"""
+		Return the squared distances and the indices of the k points nearest
+		to x, ordered by increasing distance.
+		"""
+
+		# Nothing to look for
+		if (self.root is None) or (k < 1):
+			return ([], [])
+
+		# Collect the k nearest in a max-heap of (-distance, index)
+		heap = [ ]
+		self._query(self.root, np.asarray(x, dtype=np.float64), k, heap)
+
+		# Sort by increasing distance
+		ans = sorted([ (-d, i) for (d, i) in heap ])
+		return ([ d for (d, i) in ans ], [ i for (d, i) in ans ])
+
+	def _query(self, node, x, k, heap):
+		"""
+		Visit the specified node, updating the heap of the nearest points
+		"""
+
+		(dim, split, left, right) = node
+
+		# Scan leaf points
+		if dim is None:
+			d2 = ((self.points[left] - x)**2).sum(axis=1)
+			for j in np.argsort(d2)[0:k]:
+				if len(heap) < k:
+					heapq.heappush(heap, (-d2[j], left[j]))
+				elif d2[j] < -heap[0][0]:
+					heapq.heapreplace(heap, (-d2[j], left[j]))
+				else:
+					break
+			return
+
+		# Visit the nearest side first
+		diff = x[dim] - split
+		if diff < 0:
+			(near, far) = (left, right)
+		else:
+			(near, far) = (right, left)
+		self._query(near, x, k, heap)
+
+		# Visit the other side only if it can contain closer points
+		if (len(heap) < k) or (diff*diff < -heap[0][0]):
+			self._query(far, x, k, heap)
@@ -17,8 +17,13 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 ################################################################
 
+import copy
+import json
 import random
 import time
+import hashlib
+import threading
+import collections
 import snappy
 import numpy as np
 import cPickle as pickle
@@ -28,7 +33,227 @@ from liveq.data.histo.interpolate import InterpolatableCollection
 
 from interpolator.config import Config
 from interpolator.scipy.interpolate import Rbf
-	
+from interpolator.data.kdtree import KDTree
+
+class ModelCache:
+	"""
+	LRU cache of the solved interpolators, validated against the samples
+	and the version counters of the neighborhoods they were built from
+	"""
+
+	#: The cached interpolators, in least-recently-used order
+	CACHE = collections.OrderedDict()
+
+	#: Lock protecting the cache
+	LOCK = threading.Lock()
+
+	@staticmethod
+	def get(key, versions):
+		"""
+		Return the interpolator cached with the given key, or None if it is
+		missing or it was built from other samples or older versions of the
+		neighborhoods
+		"""
+		with ModelCache.LOCK:
+			entry = ModelCache.CACHE.pop(key, None)
+			if (entry is None) or (entry[0] != versions):
+				return None
+			ModelCache.CACHE[key] = entry
+			return entry[1]
+
+	@staticmethod
+	def put(key, versions, ipol):
+		"""
+		Store an interpolator in the cache, evicting the least recently used
+		"""
+		with ModelCache.LOCK:
+			ModelCache.CACHE.pop(key, None)
+			ModelCache.CACHE[key] = (versions, ipol)
+			while len(ModelCache.CACHE) > Config.MODEL_CACHE_SIZE:
+				ModelCache.CACHE.popitem(last=False)
+
+	@staticmethod
+	def clear():
+		"""
+		Drop all the cached interpolators
+		"""
+		with ModelCache.LOCK:
+			ModelCache.CACHE.clear()
+
+class SampleIndex:
+	"""
+	In-memory spatial index of the samples of a lab, used for picking the
+	samples nearest to a tune.
+
+	Every appended sample is also pushed to the lab-<labid>:samples list as
+	a (key, neighborhood, values) record. The index of every process keeps
+	the position it has read up to, so it can catch-up with the samples
+	appended by any interpolator with a single LRANGE.
+	"""
+
+	#: The sample indices of the known labs
+	INDICES = { }
+
+	#: Lock protecting the indices
+	LOCK = threading.Lock()
+
+	#: Rebuild the tree when the unindexed samples exceed this fraction of it
+	REBUILD_RATIO = 0.25
+
+	#: Always scan up to that many unindexed samples before rebuilding the tree
+	REBUILD_MIN = 64
+
+	@staticmethod
+	def forLab(labid):
+		"""
+		Return the sample index of the given lab
+		"""
+		with SampleIndex.LOCK:
+			if not labid in SampleIndex.INDICES:
+				SampleIndex.INDICES[labid] = SampleIndex(labid)
+			return SampleIndex.INDICES[labid]
+
+	@staticmethod
+	def record(key, nid, values):
+		"""
+		Return the record to push in the lab sample list for the given sample
+		"""
+		return pickle.dumps( (key, nid, np.asarray(values, dtype=np.float64).tostring()), 2 )
+
+	def __init__(self, labid):
+		"""
+		Initialize an empty index for the given lab
+		"""
+
+		self.labid = labid
+		self.lock = threading.Lock()
+
+		# The samples read so far
+		self.keys = [ ]
+		self.nids = [ ]
+		self.values = [ ]
+		self.known = set()
+
+		# The position in the lab sample list
+		self.position = 0
+		self.checked = False
+
+		# The tree over the first treeSize samples
+		self.tree = None
+		self.treeSize = 0
+		self.scale = None
+
+	def _indexExisting(self):
+		"""
+		Push the samples stored before the lab sample list was introduced
+		"""
+
+		# Only one process does that
+		if not Config.STORE.setnx("lab-%s:indexed" % self.labid, 1):
+			return
+
+		# Find the neighborhoods of this lab
+		nids = set()
+		for k in Config.STORE.scan_iter(match="tune-%s:*" % self.labid):
+			(nid, kind) = k[len("tune-"):].rsplit(":", 1)
+			if kind in ("samples", "v"):
+				nids.add(nid)
+
+		# Push the samples of every neighborhood
+		for nid in nids:
+			HistogramStore._migrateLegacy(nid)
+			pipe = Config.STORE.pipeline()
+			pipe.hgetall("tune-%s:samples" % nid)
+			pipe.get("tune-%s:meta" % nid)
+			(samples, metaBuf) = pipe.execute()
+			if not samples or not metaBuf:
+				continue
+
+			# Extract the tune values of every sample
+			numTunes = pickle.loads( HistogramStore.F_DECOMPRESS( metaBuf ) )['numTunes']
+			records = [ ]
+			for (key, buf) in samples.iteritems():
+				values = np.frombuffer( HistogramStore.F_DECOMPRESS( buf ) )
+				records.append( SampleIndex.record(key, nid, values[0:numTunes]) )
+
+			# Push records
+			Config.STORE.rpush("lab-%s:samples" % self.labid, *records)
+
+	def sync(self):
+		"""
+		Read the samples appended since the last synchronization
+		"""
+
+		# Index the samples stored in the old layout the first time
+		if not self.checked:
+			self._indexExisting()
+			self.checked = True
+
+		# Read the new records
+		records = Config.STORE.lrange("lab-%s:samples" % self.labid, self.position, -1)
+		self.position += len(records)
+
+		# Collect the new samples. Samples re-appended with the same tune
+		# replace the stored ones, so they are already known.
+		for rec in records:
+			(key, nid, values) = pickle.loads(rec)
+			if key in self.known:
+				continue
+			self.known.add(key)
+			self.keys.append(key)
+			self.nids.append(nid)
+			self.values.append(np.frombuffer(values, dtype=np.float64))
+
+	def nearest(self, tune, k, maxDistance=None):
+		"""
+		Return the (neighborhood, key) pairs of the k samples nearest to the
+		center of the neighborhood bin of the given tune, with distances
+		measured in neighborhood bins. Samples further than maxDistance bins
+		are dropped.
+
+		All the tunes of a bin get the same samples, so they can share
+		the same interpolator.
+		"""
+
+		with self.lock:
+
+			# Catch-up with the store
+			self.sync()
+			numSamples = len(self.keys)
+			if numSamples == 0:
+				return [ ]
+
+			# Get normalization factors
+			addressing = tune.getAddressing()
+			if self.scale is None:
+				self.scale = 1.0 / addressing.valueBins
+
+			# Rebuild the tree when too many samples are not in the tree
+			if (numSamples - self.treeSize) > max(SampleIndex.REBUILD_MIN, self.treeSize * SampleIndex.REBUILD_RATIO):
+				self.tree = KDTree( np.array(self.values) * self.scale )
+				self.treeSize = numSamples
+
+			# Look-up the tree around the center of the bin
+			x = addressing.binCenter(tune.getValues()) * self.scale
+			(dist, idx) = ([], [])
+			if self.tree is not None:
+				(dist, idx) = self.tree.query(x, k)
+
+			# Scan the samples that are not in the tree
+			if numSamples > self.treeSize:
+				d2 = (( np.array(self.values[self.treeSize:]) * self.scale - x )**2).sum(axis=1)
+				dist = np.concatenate([ dist, d2 ])
+				idx = np.concatenate([ np.array(idx, dtype=int), np.arange(self.treeSize, numSamples) ])
+				order = np.argsort(dist, kind='mergesort')[0:k]
+				(dist, idx) = (dist[order], idx[order])
+
+			# Drop the samples too far away
+			if maxDistance is not None:
+				idx = [ i for (d, i) in zip(dist, idx) if d <= maxDistance * maxDistance ]
+
+			# Return the neighborhood and the key of the nearest samples
+			return [ (self.nids[i], self.keys[i]) for i in idx ]
+
 class HistogramStore:
 	"""
 	Histogram I/O class that uses the store class
@@ -42,6 +267,9 @@ class HistogramStore:
 	#: ** Decompression method **
 	F_DECOMPRESS = snappy.decompress
 
+	#: The neighborhoods already checked for legacy data by this process
+	CHECKED_LEGACY = set()
+
 	@staticmethod
 	def _pickle(collections, validate=False):
 		"""
@@ -185,10 +413,124 @@ class HistogramStore:
 		# Return collection
 		return ans
 
+	@staticmethod
+	def tuneHash(tune):
+		"""
+		Return the key of the given tune in the neighborhood sample hash
+		"""
+		return hashlib.sha1( "%s:%s" % (tune.labid, np.asarray(tune.getValues(), dtype=np.float64).tostring()) ).hexdigest()
+
+	@staticmethod
+	def _packSample(collection):
+		"""
+		Pack the tune values and the coefficients of the given collection
+		into a sample buffer
+		"""
+		return HistogramStore.F_COMPRESS( np.getbuffer( np.concatenate([
+				np.asarray(collection.tune.getValues(), dtype=np.float64),
+				np.asarray(collection.dataCoeff, dtype=np.float64)
+			]) ) )
+
+	@staticmethod
+	def _unpackSamples(sampleBufs, metaBuf):
+		"""
+		Unpack the specified sample buffers that share the given metadata
+		into a list of InterpolatableCollections.
+		"""
+
+		# If we have missing data, return empty array
+		if not sampleBufs or not metaBuf:
+			return []
+
+		# Unpack metadata
+		metaData = pickle.loads( HistogramStore.F_DECOMPRESS( metaBuf ) )
+		iLabID = metaData['lab']
+		iNumTunes =  metaData['numTunes']
+		iNumCoeff =  metaData['numCoeff']
+		iHistoMeta =  metaData['meta']
+
+		# Unpack samples
+		ans = [ ]
+		for buf in sampleBufs:
+
+			# Skip samples that went away while reading
+			if not buf:
+				continue
+
+			# Unpack and slice tune and coefficients
+			values = np.frombuffer( HistogramStore.F_DECOMPRESS( buf ) )
+			if len(values) != iNumTunes + iNumCoeff:
+				continue
+
+			# Create and collect histogram collection
+			ans.append(InterpolatableCollection(
+				dataCoeff=values[ iNumTunes : ],
+				dataMeta=iHistoMeta,
+				tune=Tune.fromLabData(
+						iLabID, values[ 0 : iNumTunes ]
+					)
+				)
+			)
+
+		# Return collections
+		return ans
+
+	@staticmethod
+	def _migrateLegacy(nid):
+		"""
+		Move the neighbors of the given neighborhood from the legacy blobs
+		(tune-<nid>:v and tune-<nid>:m) to the per-sample layout.
+		"""
+
+		# Check every neighborhood only once
+		if nid in HistogramStore.CHECKED_LEGACY:
+			return
+		HistogramStore.CHECKED_LEGACY.add(nid)
+
+		# Fetch legacy blobs
+		vBuf = Config.STORE.get("tune-%s:v" % nid)
+		mBuf = Config.STORE.get("tune-%s:m" % nid)
+		if not vBuf or not mBuf:
+			return
+
+		# Unpack raw values and metadata
+		values = np.frombuffer( HistogramStore.F_DECOMPRESS( vBuf ) )
+		metaData = pickle.loads( HistogramStore.F_DECOMPRESS( mBuf ) )
+		iLabID = metaData['lab']
+		iNumTunes =  metaData['numTunes']
+		iNumCoeff =  metaData['numCoeff']
+		iWidth = iNumTunes + iNumCoeff
+
+		# Put every sample in the neighborhood hash
+		pipe = Config.STORE.pipeline()
+		pipe.setnx("tune-%s:meta" % nid, HistogramStore.F_COMPRESS( pickle.dumps( {
+				'lab' : iLabID,
+				'numTunes' : iNumTunes,
+				'numCoeff' : iNumCoeff,
+				'meta' : metaData['meta']
+			} ) ))
+		for i in range(0, metaData['numCollections']):
+			sample = values[ i*iWidth : (i+1)*iWidth ]
+			key = hashlib.sha1( "%s:%s" % (iLabID, sample[0:iNumTunes].tostring()) ).hexdigest()
+			pipe.hsetnx("tune-%s:samples" % nid, key, HistogramStore.F_COMPRESS( np.getbuffer( sample ) ))
+
+		# Drop legacy blobs and invalidate cached interpolators
+		pipe.delete("tune-%s:v" % nid, "tune-%s:m" % nid)
+		pipe.incr("tune-%s:ver" % nid)
+		pipe.execute()
+
 	@staticmethod
 	def append(collection):
 		"""
 		Put a histogram in the neighborhood
+
+		Every neighborhood keeps one entry per sample in the tune-<nid>:samples
+		hash, indexed by the hash of the tune, and the histogram metadata shared
+		by all the samples in tune-<nid>:meta. Therefore appending a sample costs
+		the same regardless of the size of the neighborhood and samples with the
+		same tune replace the older ones. Every append increments the version
+		counter in tune-<nid>:ver and it is recorded in the lab-<labid>:samples
+		list, from which the sample indices are updated.
 		"""
 
 		# Require a tune
@@ -198,85 +540,290 @@ class HistogramStore:
 		# Get neighborhood ID
 		nid = collection.tune.getNeighborhoodID()
 
-		# Fetch neighbors from neighborhood
-		vBuf = Config.STORE.get("tune-%s:v" % nid)
-		mBuf = Config.STORE.get("tune-%s:m" % nid)
-		neighbors = HistogramStore._unpickle( vBuf, mBuf )
+		# Migrate neighborhoods stored in the legacy format
+		HistogramStore._migrateLegacy(nid)
+
+		# Prepare the metadata shared by all the neighbors
+		sTune = collection.tune.getValues()
+		metaBuf = HistogramStore.F_COMPRESS( pickle.dumps( {
+				'lab' : collection.tune.labid,
+				'numTunes' : len(sTune),
+				'numCoeff' : len(collection.dataCoeff),
+				'meta' : collection.dataMeta
+			} ) )
+
+		# Put the metadata if missing and get the metadata in effect
+		pipe = Config.STORE.pipeline()
+		pipe.setnx("tune-%s:meta" % nid, metaBuf)
+		pipe.get("tune-%s:meta" % nid)
+		(_, metaBuf) = pipe.execute()
+
+		# Require compatible samples in the neighborhood
+		metaData = pickle.loads( HistogramStore.F_DECOMPRESS( metaBuf ) )
+		if metaData['lab'] != collection.tune.labid:
+			raise ValueError("All histogram tunes must belong to the same lab!")
+		if metaData['numTunes'] != len(sTune):
+			raise ValueError("All histogram tunes must have the same number of tunable parameters!")
+		if metaData['numCoeff'] != len(collection.dataCoeff):
+			raise ValueError("All histogram collections must have the same number of coefficients!")
+
+		# Put (or replace) the sample and bump the neighborhood version,
+		# invalidating the interpolators built from this neighborhood
+		key = HistogramStore.tuneHash(collection.tune)
+		pipe = Config.STORE.pipeline()
+		pipe.hset("tune-%s:samples" % nid, key, HistogramStore._packSample(collection))
+		pipe.incr("tune-%s:ver" % nid)
+		pipe.rpush("lab-%s:samples" % collection.tune.labid, SampleIndex.record(key, nid, sTune))
+		pipe.hlen("tune-%s:samples" % nid)
+		(_, _, _, numNeighbors) = pipe.execute()
 
 		# Debug
 		print "--[ Appending ]------------"
 		print "Size=%i" % len(collection)
 		print "Neighborhood=%s" % nid
-		print "Neighbors=%i" % len(neighbors)
-		if neighbors:
-			print "Neighbor histograms=%i" % len(neighbors[0])
+		print "Neighbors=%i" % numNeighbors
 		print "---------------------------"
 
-		# Replace identical indices
-		i = 0
-		found = False
-		for e in neighbors:
+	@staticmethod
+	def getNeighborhood(tune, offset=0, limit=None):
+		"""
+		Return the nodes from the given neighborhood
+
+		If limit is specified, up to that many random nodes are returned.
+		"""
+
+		return HistogramStore.getNeighborhoodByID( tune.getNeighborhoodID(offset=offset), limit )
 
-			# If tunes match exactly, use the newer data for the interpolation
-			if e.tune.equal(collection.tune):
-				neighbors[i] = collection
-				found = True
-				break
-			i += 1
+	@staticmethod
+	def getNeighborhoodByID(nid, limit=None):
+		"""
+		Return the nodes from the neighborhood with the given ID
 
-		# Append collection to the neighborhood if a
-		# simmilar entry was not found.
-		if not found:
-			neighbors.append(collection)
+		If limit is specified, up to that many random nodes are returned.
+		"""
 
-		# Put neighbors back to the neighborhood store
-		vBuf, mBuf = HistogramStore._pickle(neighbors)
-		Config.STORE.set("tune-%s:v" % nid, vBuf )
-		Config.STORE.set("tune-%s:m" % nid, mBuf )
+		# Migrate neighborhoods stored in the legacy format
+		HistogramStore._migrateLegacy(nid)
+
+		# Fetch all the samples, or a random subset of them
+		if limit is None:
+			pipe = Config.STORE.pipeline()
+			pipe.hvals("tune-%s:samples" % nid)
+			pipe.get("tune-%s:meta" % nid)
+			(sampleBufs, metaBuf) = pipe.execute()
+		else:
+			keys = Config.STORE.hkeys("tune-%s:samples" % nid)
+			if len(keys) > limit:
+				keys = random.sample(keys, limit)
+			if not keys:
+				return []
+			pipe = Config.STORE.pipeline()
+			pipe.hmget("tune-%s:samples" % nid, keys)
+			pipe.get("tune-%s:meta" % nid)
+			(sampleBufs, metaBuf) = pipe.execute()
+
+		# Unpack neighbors
+		return HistogramStore._unpackSamples( sampleBufs, metaBuf )
 
 	@staticmethod
-	def getNeighborhood(tune, offset=0):
+	def recordRequest(tune, histograms=None):
 		"""
-		Return the nodes from the given neighborhood
+		Count an interpolation request in the hot neighborhoods of this
+		interpolator shard, keeping the last request for every neighborhood
+		so its model can be rebuilt by the warm-start preload.
+
+		The requests are counted in the ipol-hot:<shard>:w:<window> sorted
+		set of the current window of HOT_WINDOW seconds, which expires after
+		HOT_WINDOWS windows and is trimmed to the HOT_KEEP top neighborhoods.
 		"""
 
-		# Get neighborhood ID
-		nid = tune.getNeighborhoodID(offset=offset)
+		# Count the request in the current window
+		nid = tune.getNeighborhoodID()
+		key = "ipol-hot:%i:w:%i" % (Config.SHARD, int(time.time() // Config.HOT_WINDOW))
+		expire = Config.HOT_WINDOW * Config.HOT_WINDOWS
+		pipe = Config.STORE.pipeline()
+		pipe.zincrby(key, nid, 1)
+		pipe.expire(key, expire)
+		pipe.zremrangebyrank(key, 0, -(Config.HOT_KEEP + 1))
+
+		# Keep the last request, as long as it is counted
+		pipe.setex("ipol-hot:%i:req:%s" % (Config.SHARD, nid), expire, json.dumps({
+				'lab': tune.labid,
+				'parameters': dict(tune),
+				'histograms': histograms
+			}))
+		pipe.execute()
 
-		vBuf = Config.STORE.get("tune-%s:v" % nid)
-		mBuf = Config.STORE.get("tune-%s:m" % nid)
+	@staticmethod
+	def getHotRequests(limit):
+		"""
+		Return the last requests of the most requested neighborhoods of this
+		interpolator shard, most requested first.
+
+		The counts of the last HOT_WINDOWS windows are summed, with the
+		weight of every window decreasing linearly with its age.
+		"""
+
+		# Drop the all-time counters of the older versions
+		Config.STORE.delete("ipol-hot:%i:hits" % Config.SHARD, "ipol-hot:%i:req" % Config.SHARD)
+
+		# Sum the decayed counts of the recent windows
+		now = int(time.time() // Config.HOT_WINDOW)
+		windows = dict([
+				("ipol-hot:%i:w:%i" % (Config.SHARD, now - i), float(Config.HOT_WINDOWS - i) / Config.HOT_WINDOWS)
+				for i in range(0, Config.HOT_WINDOWS)
+			])
+		scoreKey = "ipol-hot:%i:score" % Config.SHARD
+		pipe = Config.STORE.pipeline()
+		pipe.zunionstore(scoreKey, windows)
+		pipe.zrevrange(scoreKey, 0, limit - 1)
+		pipe.delete(scoreKey)
+		(_, nids, _) = pipe.execute()
+		if not nids:
+			return [ ]
+
+		# Return their requests
+		reqs = Config.STORE.mget([ "ipol-hot:%i:req:%s" % (Config.SHARD, nid) for nid in nids ])
+		return [ json.loads(r) for r in reqs if r ]
+
+	@staticmethod
+	def getInterpolator(tune, function='linear', histograms=None, maxSamples=100, maxDistance=None):
+		"""
+		Return an initialized interpolator instance with the maxSamples samples
+		nearest to the neighborhood bin of the given tune, up to maxDistance
+		bins away (MAX_DISTANCE if missing), or None if there are no samples
+		that close.
+
+		The solved interpolators are cached by lab, bin and histograms, so all
+		the tunes of a bin share the same interpolator, which is re-used until
+		its samples change or a new sample is appended in any of their
+		neighborhoods.
+		"""
+
+		# Find the nearest samples
+		if maxDistance is None:
+			maxDistance = Config.MAX_DISTANCE
+		samples = SampleIndex.forLab(tune.labid).nearest(tune, maxSamples, maxDistance)
+		if not samples:
+			return None
+
+		# Get the versions of the neighborhoods they belong to
+		nids = sorted(set([ nid for (nid, key) in samples ]))
+		versions = ( tuple(sorted([ key for (nid, key) in samples ])),
+			tuple(Config.STORE.mget([ "tune-%s:ver" % nid for nid in nids ])) )
+
+		# Check the cache
+		histoKey = None
+		if not histograms is None:
+			histoKey = tuple(sorted(histograms))
+		key = (tune.labid, tune.getAddressing().binIndex(tune.getValues()), histoKey, function)
+		ipol = ModelCache.get(key, versions)
+
+		# Build and cache interpolator if missing
+		if ipol is None:
+			ipol = HistogramStore.createInterpolator(samples, function, histograms)
+			if ipol is None:
+				return None
+			ModelCache.put(key, versions, ipol)
+
+		# Return a shallow copy with the metadata of this request
+		ipol = copy.copy(ipol)
+		ipol.meta = HistogramStore.interpolationMeta(ipol, tune, maxSamples)
+		return ipol
+
+	@staticmethod
+	def interpolationMeta(ipol, tune, maxSamples):
+		"""
+		Return the metadata of the interpolation of the given tune with the
+		specified interpolator
+		"""
+
+		# Calculate average distance to neighrborhood
+		avgDistance = np.mean( np.sqrt( ((ipol.xi - np.asarray(tune.getValues(), dtype=np.float64)[:,np.newaxis])**2).sum(axis=0) ) )
 
-		# Fetch neighbors from neighborhood
-		return HistogramStore._unpickle( vBuf, mBuf )
+		# Return metadata
+		return {
+				'samples' 		: ipol.N,
+				'maxsamples' 	: maxSamples,
+				'normdist'		: avgDistance / tune.binRadius()
+			}
 
 	@staticmethod
-	def getInterpolator(tune, function='linear', histograms=None, minSamples=10, maxIterations=10, maxSamples=100):
+	def interpolateBatch(tunes, function='linear', histograms=None, maxSamples=100):
 		"""
-		Return an initialized interpolator instance with the required
-		data from the appropriate neighborhoods.
+		Interpolate all the given tunes of the same lab.
 
-		TODO: Optimize (a lot)
+		The tunes are grouped by neighborhood and every group is evaluated
+		at once with the interpolator of the samples nearest to its center.
+		Returns a list with an InterpolatableCollection (or None if there are
+		no samples) and a metadata dictionary for every tune.
 		"""
 
-		# Get neighborhood
-		data = HistogramStore.getNeighborhood(tune)
+		# Nothing to do
+		if not tunes:
+			return [ ]
+
+		# Group tunes by neighborhood
+		allValues = np.array([ t.getValues() for t in tunes ], dtype=np.float64)
+		groups = collections.OrderedDict()
+		nids = tunes[0].getAddressing().getNeighborhoodIDs(tunes[0].labid, allValues)
+		for i in range(0, len(tunes)):
+			groups.setdefault(nids[i], []).append(i)
+
+		# Process groups
+		ans = [ (None, None) ] * len(tunes)
+		for idx in groups.itervalues():
+
+			# Get an interpolator around the center of the group
+			values = allValues[idx]
+			center = Tune(zip( sorted(tunes[idx[0]].keys()), values.mean(axis=0) ), labid=tunes[idx[0]].labid)
+			ipol = HistogramStore.getInterpolator(center, function, histograms, maxSamples)
+			if ipol is None:
+				continue
+
+			# Evaluate all the points of the group
+			results = ipol.interpolateMany( *values.T )
+			for j in range(0, len(idx)):
+				results[j].tune = tunes[idx[j]]
+				ans[idx[j]] = ( results[j], HistogramStore.interpolationMeta(ipol, tunes[idx[j]], maxSamples) )
+
+		# Return results
+		return ans
+
+	@staticmethod
+	def getSamples(samples):
+		"""
+		Return the InterpolatableCollections of the specified (neighborhood, key)
+		samples, fetched with a single round-trip to the store.
+		"""
 
-		# If data are underpopulated, fetch neighbor bins
-		iterations = 0
-		while len(data) < minSamples:
-			iterations += 1
+		# Group sample keys by neighborhood
+		groups = collections.OrderedDict()
+		for (nid, key) in samples:
+			groups.setdefault(nid, []).append(key)
 
-			# Collect neighbor samples
-			data += HistogramStore.getNeighborhood(tune, offset=iterations)
+		# Fetch samples and metadata of every neighborhood
+		pipe = Config.STORE.pipeline()
+		for (nid, keys) in groups.iteritems():
+			pipe.hmget("tune-%s:samples" % nid, keys)
+			pipe.get("tune-%s:meta" % nid)
+		bufs = pipe.execute()
 
-			# Check if we reached max iterations
-			if iterations > maxIterations:
-				break
+		# Unpack samples
+		data = [ ]
+		for i in range(0, len(groups)):
+			data += HistogramStore._unpackSamples( bufs[2*i], bufs[2*i+1] )
+		return data
 
-		# Usually for more than maxSamples, Rbf behaves very slowly
-		if len(data) > maxSamples:
-			data = random.sample(data, maxSamples)
+	@staticmethod
+	def createInterpolator(samples, function='linear', histograms=None):
+		"""
+		Create an interpolator instance with the specified (neighborhood, key)
+		samples.
+		"""
 
+		# Fetch samples
+		data = HistogramStore.getSamples(samples)
 		# Iterate over items and create interpolation indices and data variables
 		datavalues = [ ]
 		indexvars = [ ]
@@ -290,23 +837,12 @@ class HistogramStore:
 			datavalues.append(hc)
 			indexvars.append(hc.tune.getValues())
 
-
-		# Flip matrix of indexvars
-		indexvars = np.swapaxes( np.array(indexvars), 0, 1 )
-
 		# Nothing available
 		if len(indexvars) == 0:
 			return None
 
-		# Calculate average distance to neighrborhood
-		avgDistance = 0
-		for ic in data:
-			avgDistance += tune.distanceTo( ic.tune )
-		avgDistance /= len(data)
+		# Flip matrix of indexvars
+		indexvars = np.swapaxes( np.array(indexvars), 0, 1 )
 
 		# Create and return interpolator
-		return Rbf( *indexvars, data=datavalues, function=function, meta={
-				'samples' 		: len(data),
-				'maxsamples' 	: maxSamples,
-				'normdist'		: avgDistance / tune.binRadius()
-			})
+		return Rbf( *indexvars, data=datavalues, function=function )
@@ -0,0 +1,171 @@
+################################################################
+# LiveQ - An interactive volunteering computing batch system
+# Copyright (C) 2013 Ioannis Charalampidis
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+################################################################
+
+"""
+Local Interpolator Shards
+
+This module runs many interpolator shards as local processes that exchange
+messages through multiprocessing queues instead of a message broker. The
+shards share the store configured in the parent process, so it can be used
+for testing the sharded setup on a single machine.
+"""
+
+import uuid
+import Queue
+import logging
+import threading
+import multiprocessing
+
+from liveq.io.bus import BusChannel
+from liveq.io.shardedchannel import ShardedChannel, interpolatorShardKey
+
+class LocalShardChannel(BusChannel):
+	"""
+	The channel used by an interpolator inside a local shard process,
+	which collects the reply to the message under processing.
+	"""
+
+	def __init__(self, name):
+		"""
+		Initialize the channel
+		"""
+		BusChannel.__init__(self, name)
+		self.lastReply = None
+
+	def reply(self, data):
+		"""
+		Keep the reply to the message under processing
+		"""
+		self.lastReply = data
+
+	def close(self):
+		"""
+		Nothing to close
+		"""
+		pass
+
+class LocalShardClient(BusChannel):
+	"""
+	The channel used for sending messages to a local shard process
+	"""
+
+	def __init__(self, name, inQueue, outQueue):
+		"""
+		Initialize the channel over the shard queues
+		"""
+		BusChannel.__init__(self, name)
+		self.inQueue = inQueue
+		self.outQueue = outQueue
+		self.lock = threading.Lock()
+
+	def send(self, name, data, waitReply=False, timeout=30):
+		"""
+		Send a message to the shard process and optionally wait for the reply
+		"""
+
+		# Just post message
+		if not waitReply:
+			self.inQueue.put( (None, name, data) )
+			return None
+
+		# Post message and wait for the reply with the same ID
+		with self.lock:
+			msgID = uuid.uuid4().hex
+			self.inQueue.put( (msgID, name, data) )
+			while True:
+				try:
+					(replyID, reply) = self.outQueue.get(timeout=timeout)
+				except Queue.Empty:
+					return None
+				if replyID == msgID:
+					return reply
+
+	def close(self):
+		"""
+		Ask the shard process to exit
+		"""
+		self.inQueue.put(None)
+
+def _shardMain(inQueue, outQueue):
+	"""
+	Main function of a local shard process
+	"""
+
+	# Import here, so the component is created in the shard process
+	from interpolator.component import InterpolatorComponent
+
+	# Create an interpolator serving the local channel
+	channel = LocalShardChannel("interpolate")
+	component = InterpolatorComponent(channel)
+
+	# Process messages until asked to exit
+	while True:
+		msg = inQueue.get()
+		if msg is None:
+			break
+		(msgID, name, data) = msg
+
+		# Handle message
+		channel.lastReply = None
+		try:
+			channel.trigger(name, data)
+		except Exception as e:
+			logging.error("Error while handling '%s' in interpolator shard (%s)" % (name, str(e)))
+			channel.lastReply = { 'result': 'error', 'error': str(e) }
+
+		# Send reply if expected
+		if msgID is not None:
+			outQueue.put( (msgID, channel.lastReply) )
+
+class LocalInterpolatorPool(ShardedChannel):
+	"""
+	A channel to many interpolator shards running as local processes,
+	routing the messages the same way as the shards on the bus.
+
+	The configuration must be loaded before creating the pool, since the
+	shard processes are forked from the current process.
+	"""
+
+	def __init__(self, shards):
+		"""
+		Start the specified number of shard processes
+		"""
+
+		# Start shard processes
+		self.processes = [ ]
+		channels = [ ]
+		for i in range(0, shards):
+			inQueue = multiprocessing.Queue()
+			outQueue = multiprocessing.Queue()
+			proc = multiprocessing.Process(target=_shardMain, args=(inQueue, outQueue))
+			proc.daemon = True
+			proc.start()
+			self.processes.append(proc)
+			channels.append( LocalShardClient("interpolate", inQueue, outQueue) )
+
+		# Route to shards
+		ShardedChannel.__init__(self, "interpolate", channels, interpolatorShardKey)
+
+	def close(self):
+		"""
+		Stop all the shard processes
+		"""
+		ShardedChannel.close(self)
+		for proc in self.processes:
+			proc.join()
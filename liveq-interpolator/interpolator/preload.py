@@ -0,0 +1,142 @@
+################################################################
+# LiveQ - An interactive volunteering computing batch system
+# Copyright (C) 2013 Ioannis Charalampidis
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+################################################################
+
+import time
+import logging
+import threading
+from multiprocessing.pool import ThreadPool
+
+from liveq.data.tune import Tune
+
+from interpolator.config import Config
+from interpolator.data.store import HistogramStore
+
+class Preloader:
+	"""
+	Warm-start of the interpolator, that builds the models of the most
+	requested neighborhoods of this shard in a background thread pool.
+	"""
+
+	def __init__(self, limit, threads=2):
+		"""
+		Initialize a preloader for up to limit neighborhoods
+		"""
+
+		self.limit = limit
+		self.threads = max(1, threads)
+		self.logger = logging.getLogger("interpolator.preload")
+		self.lock = threading.Lock()
+		self.finished = threading.Event()
+
+		# Progress metrics
+		self.state = "idle"
+		self.total = 0
+		self.done = 0
+		self.failed = 0
+		self.startTime = None
+		self.endTime = None
+
+	def status(self):
+		"""
+		Return the progress metrics of the preload
+		"""
+		with self.lock:
+			elapsed = 0.0
+			if self.startTime is not None:
+				elapsed = (self.endTime or time.time()) - self.startTime
+			return {
+				'state': self.state,
+				'total': self.total,
+				'done': self.done,
+				'failed': self.failed,
+				'elapsed': elapsed
+			}
+
+	def start(self):
+		"""
+		Start preloading in the background
+		"""
+		thread = threading.Thread(target=self.run)
+		thread.daemon = True
+		thread.start()
+
+	def wait(self, timeout=None):
+		"""
+		Wait for the preload to complete
+		"""
+		self.finished.wait(timeout)
+
+	def _build(self, req):
+		"""
+		Build the interpolator of the given request
+		"""
+
+		# Build model, keeping it in the model cache
+		ok = False
+		try:
+			tune = Tune(req['parameters'], labid=req['lab'])
+			ok = HistogramStore.getInterpolator(tune, histograms=req['histograms']) is not None
+		except Exception as e:
+			self.logger.warn("Unable to preload interpolator for lab %s (%s)" % (req.get('lab', None), str(e)))
+
+		# Update progress
+		with self.lock:
+			if ok:
+				self.done += 1
+			else:
+				self.failed += 1
+
+	def run(self):
+		"""
+		Build the models of the hot neighborhoods
+		"""
+
+		# Never preload more models than the cache can keep, otherwise
+		# the last ones built would evict the hottest ones
+		limit = min(self.limit, Config.MODEL_CACHE_SIZE)
+		if limit < self.limit:
+			self.logger.warn("Preloading only %i neighborhoods, the size of the model cache" % limit)
+
+		# Get the hot requests
+		with self.lock:
+			self.state = "running"
+			self.startTime = time.time()
+		try:
+			reqs = HistogramStore.getHotRequests(limit)
+		except Exception as e:
+			self.logger.warn("Unable to read the hot neighborhoods (%s)" % str(e))
+			reqs = [ ]
+		with self.lock:
+			self.total = len(reqs)
+		self.logger.info("Preloading %i hot neighborhoods using %i threads" % (len(reqs), self.threads))
+
+		# Build models in the thread pool, coldest first, so the hottest
+		# ones are the most recently used in the model cache
+		if reqs:
+			pool = ThreadPool(self.threads)
+			pool.map(self._build, reqs[::-1])
+			pool.close()
+			pool.join()
+
+		# Done
+		with self.lock:
+			self.state = "done"
+			self.endTime = time.time()
+		self.finished.set()
+		self.logger.info("Preloaded %i interpolators (%i failed) in %.2f seconds" % (self.done, self.failed, self.endTime - self.startTime))
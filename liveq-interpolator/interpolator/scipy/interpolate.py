@@ -48,7 +48,7 @@ import sys
 
 from numpy.linalg import LinAlgError
 from numpy import (sqrt, log, asarray, array, newaxis, all, dot, exp, eye,
-				   float_, zeros, swapaxes)
+				   float_, zeros, swapaxes, ones)
 from numpy import linalg
 from interpolator.scipy.lib.six import callable, get_method_function, \
 	 get_function_code
@@ -252,18 +252,27 @@ class Rbf(object):
 			self.nodes = linalg.solve(self.A, self.di)
 
 		else:
-			# In any other cases, create a node array
-			self.nodes = []
-			for di in self.di:
-
-				# Try to create node and use None
-				# if it failed
-				try:
-					la = linalg.solve(self.A, di)
-				except LinAlgError as e:
-					la = None
-
-				self.nodes.append(la)
+			# In any other cases, solve for all the coefficients at once,
+			# factorizing A only once. The nodes are stored in a (N x coefficients)
+			# matrix and the columns that could not be solved are masked-out.
+			try:
+				self.nodes = linalg.solve(self.A, self.di.T)
+				self.valid = ones(self.nodes.shape[1], dtype=bool)
+
+			except LinAlgError as e:
+
+				# Fall back to solving every coefficient separately, using
+				# zero for the columns that failed
+				self.nodes = zeros((self.N, len(self.di)))
+				self.valid = zeros(len(self.di), dtype=bool)
+				i = 0
+				for di in self.di:
+					try:
+						self.nodes[:,i] = linalg.solve(self.A, di)
+						self.valid[i] = True
+					except LinAlgError as e:
+						pass
+					i += 1
 
 
 	def _call_norm(self, x1, x2):
@@ -275,6 +284,42 @@ class Rbf(object):
 		x2 = x2[..., newaxis, :]
 		return self.norm(x1, x2)
 
+	def _interpolateNodes(self, r):
+		"""
+		Evaluate all the coefficients of a histogram set at the single point
+		with distances r to the nodes, using one kernel evaluation and one
+		matrix product. Coefficients that could not be solved are zero.
+		"""
+		ans = dot(self._function(r), self.nodes).reshape(-1)
+		ans[~self.valid] = 0.0
+		return ans
+
+	def interpolateMany(self, *args):
+		"""
+		Evaluate the interpolator at many points at once, using one kernel
+		evaluation and one matrix product for all of them.
+
+		In histogram set mode a list with an InterpolatableCollection per
+		point is returned.
+		"""
+		args = [asarray(x).flatten() for x in args]
+		if not all([x.shape == y.shape for x in args for y in args]):
+			raise ValueError("Array lengths must be equal")
+		xa = asarray(args, dtype=float_)
+		r = self._call_norm(xa, self.xi)
+
+		if self.ipolmode == Rbf.DATA_SINGLE:
+			# Single interpolation
+			return dot(self._function(r), self.nodes)
+
+		elif self.ipolmode == Rbf.DATA_HISTOSET:
+			# Histogram interpolation and re-generation
+			ans = dot(self._function(r), self.nodes)
+			ans[:, ~self.valid] = 0.0
+
+			# Create and return a new histogram object for every point
+			return [ InterpolatableCollection(dataCoeff=row, dataMeta=self._histometa) for row in ans ]
+
 	def interpolate(self, args, dataMeta=None):
 		args = [asarray(x) for x in args]
 		if not all([x.shape == y.shape for x in args for y in args]):
@@ -289,12 +334,7 @@ class Rbf(object):
 
 		elif self.ipolmode == Rbf.DATA_HISTOSET:
 			# Histogram interpolation and re-generation
-			ans = zeros( len(self.nodes) )
-			i = 0
-			for node in self.nodes:
-				if not node is None:
-					ans[i] = dot(self._function(r), node).reshape(shp)
-				i += 1
+			ans = self._interpolateNodes(r)
 
 			# Create and return a new histogram object
 			return InterpolatableCollection(dataCoeff=ans, dataMeta=dataMeta)
@@ -318,12 +358,7 @@ class Rbf(object):
 
 		elif self.ipolmode == Rbf.DATA_HISTOSET:
 			# Histogram interpolation and re-generation
-			ans = zeros( len(self.nodes) )
-			i = 0
-			for node in self.nodes:
-				if not node is None:
-					ans[i] = dot(self._function(r), node).reshape(shp)
-				i += 1
+			ans = self._interpolateNodes(r)
 
 			# Create and return a new histogram object
 			return InterpolatableCollection(dataCoeff=ans, dataMeta=self._histometa)
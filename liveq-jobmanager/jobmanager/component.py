@@ -26,6 +26,7 @@ import traceback
 import jobmanager.io.jobs as jobs
 import jobmanager.io.scheduler as scheduler
 import jobmanager.io.agents as agents
+import jobmanager.io.pool as pool
 import jobmanager.io.results as results
 import liveq.data.histo.reference as reference
 
@@ -33,7 +34,8 @@ from jobmanager.config import Config
 
 from liveq.component import Component
 from liveq.io.eventbroadcast import EventBroadcast
-from liveq.io.bus import BusChannelException
+from liveq.io.bus import BusChannelException, BinaryPayload
+from liveq.io.shardedchannel import openInterpolatorChannel
 from liveq.classes.bus.xmppmsg import XMPPBus
 from liveq.models import Agent, AgentGroup, AgentMetrics, Observable, JobQueue
 
@@ -76,6 +78,12 @@ class JobManagerComponent(Component):
 		LARS.initialize()
 		LARS.openEntity("components/job-manager", "%s#%s" % (Config.EBUS.jid, Config.EBUS.resource), autoKeepalive=True, alias="core")
 
+		# Index the agent pool the scheduler is working on
+		pool.start()
+
+		# Index the results of the completed jobs for the interpolator
+		results.indexCompleted()
+
 		# Register the arbitrary channel creations that can happen
 		# when we have an incoming agent handshake
 		Config.EBUS.on('channel', self.onChannelCreation)
@@ -90,7 +98,7 @@ class JobManagerComponent(Component):
 		self.jobChannel.on('job_results', self.onBusJobResults)
 
 		# Open the interpolator channel were we are dumping the final results
-		self.ipolChannel = Config.IBUS.openChannel("interpolate")
+		self.ipolChannel = openInterpolatorChannel(Config.IBUS, Config.IPOL_SHARDS)
 
 		# Open the results manager channel where we are dumping the final results
 		# self.resultsChannel = Config.IBUS.openChannel("results")
@@ -106,10 +114,17 @@ class JobManagerComponent(Component):
 		# Channel mapping
 		self.channels = { }
 
-	def adaptCollection(self, lab, collection, requiredHistograms):
+		# The sequence number of the last data frame
+		# received from every (job, agent) pair
+		self.agentSequence = { }
+
+	def adaptCollection(self, lab, collection, requiredHistograms, createMissing=True):
 		"""
 		Trim histograms that does not belong to requiredHistograms
 		and/or create missing histograms using reference values.
+
+		Partial collections should use createMissing=False, in order not
+		to replace the histograms that were not sent with empty ones.
 		"""
 
 		# Log information
@@ -135,6 +150,8 @@ class JobManagerComponent(Component):
 				del createHistograms[i]
 
 		# Create missing histograms
+		if not createMissing:
+			createHistograms = [ ]
 		for h in createHistograms:
 			collection[h] = IntermediateHistogram.empty( h )
 			logAdded.append(h)
@@ -216,59 +233,119 @@ class JobManagerComponent(Component):
 		# Return instance
 		return channel
 
+	def forgetSequence(self, jid=None, agentID=None):
+		"""
+		Forget the sequence of the last data frame of the (job, agent) pairs
+		of the given job and/or the given agent
+		"""
+		for key in self.agentSequence.keys():
+			if ((jid is None) or (str(key[0]) == str(jid))) and ((agentID is None) or (key[1] == agentID)):
+				self.agentSequence.pop(key, None)
+
 	def step(self):
 		"""
 		Internal component loop
 		"""
 
+		# Wait until something is queued or released
+		scheduler.waitForWork( Config.SCHEDULER_IDLE )
+
 		# Handle deferred completed jobs
 		c_jobs = scheduler.getCompletedJobs()
 		for job in c_jobs:
 			# Notify interested entities that the specified job is completed
 			self.notifyJobCompleted(job)
 
-		# Handle the next step in the scheduler
-		(job, a_cancel, a_start) = scheduler.process()
-		if job:
+		# Place all the pending jobs that fit
+		placed = scheduler.processBatch( Config.SCHEDULER_BATCH )
+		self.startJobs( placed )
 
-			# First, cancel the job on the given a_cancel agents
-			for agent in a_cancel:
-				try:
-
-					# Send status
-					job.sendStatus("Aborting job on worker %s" % agent.uuid)
-
-					# Get channel and send cancellations (synchronous)
-					agentChannel = self.getAgentChannel( agent.uuid )
-					ans = agentChannel.send('job_cancel', {
-							'jid': agent.jobToCancel
-						})
-
-					# Let job2cancel know that it has lost an agent
-					job2c = jobs.getJob(agent.jobToCancel)
-					if job2c:
-						job2c.stockAgentData(agent)
-						job2c.removeAgentInfo(agent)
-
-					# Assume aborted
-					self.logger.info("Successfuly cancelled job %s on %s" % ( agent.jobToCancel, agent.uuid ))
-					agents.agentJobAborted(agent.uuid, job)
-
-				except Exception as e:
-					traceback.print_exc()
-					self.logger.error("Exception while cancelling job: %s" % str(e))
-
-			# Calculate run-time parameters for this group of agents
-			# that are about to start. This is defining the number
-			# of events we have to run in order to accumulate to the 
-			# maxium events requested
-			if len(a_start) > 0:
-
-				# The getBatchRuntimeConfig function will return a list
-				# of configurations, one for each agent in the baatch
-				runtimeConfig = job.getBatchRuntimeConfig( a_start )
-
-			# Then, start the job on a_start
+		# If we hit the batch limit, there might be more to place
+		if len(placed) >= Config.SCHEDULER_BATCH:
+			scheduler.wakeup()
+
+	def sendToAgents(self, requests, waitReply=False):
+		"""
+		Send the (agent ID, message, data) requests to the agents at once,
+		returning the answers in the same order.
+
+		All the messages are sent before waiting for any reply, and the replies
+		are collected against a single deadline, AGENT_TIMEOUT seconds after the
+		last message was sent. The answer of an agent that did not reply is None,
+		and the answer of an agent that could not be sent the message is the
+		exception that was raised.
+		"""
+
+		# Send all the messages without waiting
+		handles = [ ]
+		for (agentID, message, data) in requests:
+			try:
+				channel = self.getAgentChannel( agentID )
+				if waitReply:
+					handles.append( (channel, channel.sendAsync(message, data)) )
+				else:
+					channel.send(message, data)
+					handles.append( (channel, None) )
+			except Exception as e:
+				traceback.print_exc()
+				handles.append( (None, e) )
+
+		# Nothing to wait for
+		if not waitReply:
+			return [ h if isinstance(h, Exception) else None for (channel, h) in handles ]
+
+		# Collect the replies until the deadline
+		deadline = time.time() + Config.AGENT_TIMEOUT
+		answers = [ ]
+		for (channel, h) in handles:
+			if isinstance(h, Exception):
+				answers.append(h)
+			else:
+				answers.append( channel.collectReply(h, max(deadline - time.time(), 0)) )
+		return answers
+
+	def startJobs(self, placed):
+		"""
+		Cancel the jobs on the a_cancel agents and start every job on its
+		a_start agents, for every (job, a_cancel, a_start) reserved by the scheduler.
+
+		The messages to all the agents are sent at once, so an unresponsive
+		agent does not delay the rest of the batch.
+		"""
+
+		# First, cancel the jobs on the a_cancel agents
+		cancels = [ (job, agent) for (job, a_cancel, a_start) in placed for agent in a_cancel ]
+		for (job, agent) in cancels:
+			job.sendStatus("Aborting job on worker %s" % agent.uuid)
+
+		# Send cancellations
+		replies = self.sendToAgents([ (agent.uuid, 'job_cancel', { 'jid': agent.jobToCancel }) for (job, agent) in cancels ])
+		for ((job, agent), ans) in zip(cancels, replies):
+
+			# The agent is taken from its job, forget its data frames
+			self.forgetSequence( agent.jobToCancel, agent.uuid )
+			try:
+
+				# Check for failures while sending
+				if isinstance(ans, Exception):
+					raise ans
+
+				# Let job2cancel know that it has lost an agent
+				job2c = jobs.getJob(agent.jobToCancel)
+				if job2c:
+					job2c.stockAgentData(agent)
+					job2c.removeAgentInfo(agent)
+
+				# Assume aborted
+				self.logger.info("Successfuly cancelled job %s on %s" % ( agent.jobToCancel, agent.uuid ))
+				agents.agentJobAborted(agent.uuid, job)
+
+			except Exception as e:
+				self.logger.error("Exception while cancelling job: %s" % str(e))
+
+		# Then, prepare the job start on a_start
+		starts = [ ]
+		for (job, a_cancel, a_start) in placed:
 			for agent in a_start:
 
 				# Send status
@@ -277,47 +354,48 @@ class JobManagerComponent(Component):
 				# Merge with runtime config
 				config = dict(job.parameters)
 				config.update( agent.getRuntime() )
+				starts.append( (job, agent, config) )
 
-				# Get channel and send start (synchronous)
-				agentChannel = self.getAgentChannel( agent.uuid )
-				ans = agentChannel.send('job_start', {
-						'jid': job.id,
-						'config': config
-					}, waitReply=True)
-
-				# Log results
-				if not ans:
-					job.sendStatus("Could not contact worker %s" % agent.uuid)
-					self.logger.warn("Could not contact %s to cancel job %s. Marking agent offline" % ( agent.uuid, job.id ) )
+		# Send start requests and wait for the replies
+		replies = self.sendToAgents([ (agent.uuid, 'job_start', { 'jid': job.id, 'config': config }) for (job, agent, config) in starts ], waitReply=True)
+		for ((job, agent, config), ans) in zip(starts, replies):
 
-					# Mark agent offline
-					agents.updatePresence( agent.uuid, 0 )
-					scheduler.markOffline( agent.uuid )
+			# The request was never sent, keep the agent available
+			if isinstance(ans, Exception):
+				job.sendStatus("Could not contact worker %s" % agent.uuid)
+				self.logger.warn("Could not send the request to start job %s to %s (%s)" % ( job.id, agent.uuid, str(ans) ) )
+				scheduler.releaseFromJob( agent.uuid, job )
+				continue
 
-					# Exit
-					return 
+			# Log results
+			if not ans:
+				job.sendStatus("Could not contact worker %s" % agent.uuid)
+				self.logger.warn("Could not contact %s to start job %s. Marking agent offline" % ( agent.uuid, job.id ) )
 
-				# We sent our request
-				agents.agentJobSent(agent.uuid, job)
+				# Mark agent offline
+				agents.updatePresence( agent.uuid, 0 )
+				scheduler.markOffline( agent.uuid )
+				self.forgetSequence( agentID=agent.uuid )
+				continue
 
-				if ans['result'] == "ok":
+			# We sent our request
+			agents.agentJobSent(agent.uuid, job)
 
-					job.addAgentInfo(agent)
-					self.logger.info("Successfuly started job %s on %s (runEvents=%i)" % ( job.id, agent.uuid, config['events'] ))
+			if ans['result'] == "ok":
 
-					# Job is running
-					job.setStatus( jobs.RUN )
+				job.addAgentInfo(agent)
+				self.logger.info("Successfuly started job %s on %s (runEvents=%i)" % ( job.id, agent.uuid, config['events'] ))
 
-				else:
+				# Job is running
+				job.setStatus( jobs.RUN )
 
-					job.sendStatus("Could not start: %s" % ans['error'])
-					self.logger.warn("Cannot start job %s on %s (%s)" % ( job.id, agent.uuid, ans['error'] ))
+			else:
 
-					# A failure occured on the agent - register it
-					agents.agentJobFailed(agent.uuid, job)
+				job.sendStatus("Could not start: %s" % ans['error'])
+				self.logger.warn("Cannot start job %s on %s (%s)" % ( job.id, agent.uuid, ans['error'] ))
 
-		# Delay a bit
-		time.sleep(5)
+				# A failure occured on the agent - register it
+				agents.agentJobFailed(agent.uuid, job)
 
 	def sendResultsToInterpolator(self, job, histograms):
 		"""
@@ -350,8 +428,11 @@ class JobManagerComponent(Component):
 			return
 
 		# Send the resulting data to the interpolation database
+		# (the tune is used for routing to the interpolator shard)
 		self.ipolChannel.send("results", {
-				'data': res.pack()
+				'lab': job.lab.uuid,
+				'parameters': job.getTunableValues(),
+				'data': BinaryPayload(res.pack(encode=False))
 			})
 
 	def notifyJobCompleted(self, job, histoCollection=None):
@@ -391,7 +472,7 @@ class JobManagerComponent(Component):
 				'jid': job.id,
 				'result': 0,
 				'fit': chi2fit,
-				'data': histoCollection.pack()
+				'data': BinaryPayload(histoCollection.pack(encode=False))
 			})
 
 		# Send data to interpolator
@@ -409,6 +490,7 @@ class JobManagerComponent(Component):
 
 		# Cleanup job from scheduler
 		scheduler.releaseJob( job )
+		self.forgetSequence( jid=job.id )
 
 		# And then cleanup job
 		job.release(reason=jobs.COMPLETED)
@@ -553,6 +635,7 @@ class JobManagerComponent(Component):
 
 		# Notify scheduler that the agent is offline
 		scheduler.markOffline( channel.name )
+		self.forgetSequence( agentID=channel.name )
 
 	def onAgentLARSData(self, message, channel=None):
 		"""
@@ -583,7 +666,8 @@ class JobManagerComponent(Component):
 			if agent:
 				agent.activeJob = 0
 				agent.setRuntime( None )
-				agent.save()
+				pool.update( agent )
+				self.forgetSequence( agentID=channel.name )
 
 		# Send agent report to LARS
 		report = LARS.openGroup("agents", channel.name, alias=channel.name)
@@ -600,12 +684,14 @@ class JobManagerComponent(Component):
 
 		else:
 			# VER 2: Newer agents are listening for new message
+			# (and can send partial job data frames)
 			channel.send('handshake_ack', {
-					'status': 'ok'
+					'status': 'ok',
+					'partial': True
 				})
 
 			# Send report
-			report.set("version", 2)
+			report.set("version", version)
 			report.set("handshake", 1)
 
 	def onAgentJobData(self, data, channel=None):
@@ -631,12 +717,27 @@ class JobManagerComponent(Component):
 			report.openGroup("errors").add("wrong-job-id", 1)
 			return
 
+		# Partial frames carry only the histograms changed since the previous
+		# frame of the agent. If we have missed a frame, request a full one.
+		seqKey = (jid, channel.name)
+		seq = data.get('seq', None)
+		partial = bool(data.get('partial', False))
+		if partial and ((seq is None) or (self.agentSequence.get(seqKey, None) != seq - 1)):
+			self.logger.warn("[%s] Out of sequence partial data for job %s, requesting resync" % (channel.name, jid))
+			report.openGroup("errors").add("resync", 1)
+			self.agentSequence.pop(seqKey, None)
+			channel.send('job_resync', {
+					'jid': jid
+				})
+			return
+
 		# Get the intermediate histograms from the agent buffer
 		agentHistos = IntermediateHistogramCollection.fromPack( data['data'] )
 		if not agentHistos:
 			job.sendStatus("Could not parse data from worker %s" % channel.name)
 			self.logger.warn("[%s] Could not parse data for job %s" % (channel.name, jid))
 			report.openGroup("errors").add("unpack-error", 1)
+			self.agentSequence.pop(seqKey, None)
 			return
 
 		# DEBUG: Discard final histograms
@@ -645,17 +746,22 @@ class JobManagerComponent(Component):
 			return
 
 		# Adapt histogram collection to the lab tunables
-		agentHistos = self.adaptCollection( job.lab, agentHistos, job.lab.getHistograms() )
+		agentHistos = self.adaptCollection( job.lab, agentHistos, job.lab.getHistograms(), createMissing=not partial )
 
 		# Merge histograms with other histograms of the same job
 		# and return resulting histogram collection
-		sumHistos = job.updateHistograms( channel.name, agentHistos )
+		sumHistos = job.updateHistograms( channel.name, agentHistos, partial=partial )
 		if sumHistos == None:
 			job.sendStatus("Unable to merge histograms")
 			self.logger.warn("[%s] Unable to merge histograms of job %s" % (channel.name, jid))
 			report.openGroup("errors").add("merge-error", 1)
+			self.agentSequence.pop(seqKey, None)
 			return
 
+		# Keep the sequence number of the last frame applied
+		if seq is not None:
+			self.agentSequence[seqKey] = seq
+
 		self.logger.info("[%s] Got data for job %s (events=%i)" % (channel.name, jid, job.getEvents()))
 
 		# Send status
@@ -665,12 +771,14 @@ class JobManagerComponent(Component):
 			})
 
 		report.add("data-frames", 1)
+		if partial:
+			report.add("partial-frames", 1)
 
 		# Re-pack histogram collection and send to the
 		# internal bus for further processing
 		job.channel.send("job_data", {
 				'jid': jid,
-				'data': sumHistos.pack()
+				'data': BinaryPayload(sumHistos.pack(encode=False))
 			})
 
 	def onAgentJobCompleted(self, data, channel=None):
@@ -691,6 +799,9 @@ class JobManagerComponent(Component):
 			# Send reports
 			report.openGroup("jobs").add("failed", 1)
 
+		# Forget the sequence of the agent data frames
+		self.agentSequence.pop((jid, channel.name), None)
+
 		# Fetch job class
 		job = jobs.getJob(jid)
 		if not job:
@@ -749,7 +860,7 @@ class JobManagerComponent(Component):
 				# Otherwise just send intermediate data
 				job.channel.send("job_data", {
 						'jid': jid,
-						'data': histos.pack()
+						'data': BinaryPayload(histos.pack(encode=False))
 					})
 
 	# =========================
@@ -814,7 +925,16 @@ class JobManagerComponent(Component):
 
 		# Place our job inquiry in scheduler and check for response
 		self.logger.info("Requesting job #%s on scheduler" % job.id)
-		scheduler.requestJob( job )
+		if not scheduler.requestJob( job ):
+
+			# The job was not admitted
+			job.setStatus( jobs.FAILED )
+			self.jobChannel.reply({
+					'jid': job.id,
+					'result': 'error',
+					'error': 'You have reached the maximum number of queued jobs'
+				})
+			return
 
 		# Reply success
 		self.jobChannel.reply({
@@ -853,6 +973,7 @@ class JobManagerComponent(Component):
 
 		# Abort job on scheduler and return the agents that were used
 		a_cancel = scheduler.abortJob( job )
+		self.forgetSequence( jid=job.id )
 		if a_cancel:
 			for agent in a_cancel:
 
@@ -917,7 +1038,7 @@ class JobManagerComponent(Component):
 		# Send data on job channel
 		job.channel.send("job_data", {
 				'jid': jid,
-				'data': histos.pack()
+				'data': BinaryPayload(histos.pack(encode=False))
 			})
 
 		# If we are completed, send job_compelted + histograms
@@ -925,7 +1046,7 @@ class JobManagerComponent(Component):
 			job.channel.send("job_completed", {
 					'jid': job.id,
 					'result': 0,
-					'data': histoCollection.pack()
+					'data': BinaryPayload(histoCollection.pack(encode=False))
 				})
 
 	def onBusJobResults(self, message):
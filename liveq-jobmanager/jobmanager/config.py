@@ -26,6 +26,10 @@ from liveq.config.internalbus import InternalBusConfig
 from liveq.config.externalbus import ExternalBusConfig
 from liveq.config.histograms import HistogramsConfig
 from liveq.models import createBaseTables
+from liveq.exceptions import ConfigException
+from liveq.data.histo import compression
+from liveq.data.histo.intermediate import IntermediateHistogramCollection
+from liveq.data.histo.interpolate import InterpolatableCollection
 
 class JobManagerConfig:
 	"""
@@ -52,6 +56,42 @@ class JobManagerConfig:
 	#: a job in a worker
 	MIN_EVENT_THRESSHOLD = 1000
 
+	#: The compression codec for the histograms sent to the other components
+	PACK_CODEC = "lzma"
+
+	#: The maximum number of jobs the scheduler places on every wakeup
+	SCHEDULER_BATCH = 32
+
+	#: The maximum time (in seconds) the scheduler sleeps when it is not
+	#: woken up by a queued job or a freed agent
+	SCHEDULER_IDLE = 5
+
+	#: The interval (in seconds) between the writes of the modified
+	#: agents to the database
+	POOL_FLUSH_INTERVAL = 1
+
+	#: The maximum number of agents written to the database with
+	#: a single statement
+	POOL_FLUSH_BATCH = 500
+
+	#: The time (in seconds) to wait for the agents to reply to
+	#: a batch of job requests
+	AGENT_TIMEOUT = 30
+
+	#: The weights of the teams and the users in the job queue, as
+	#: a dictionary of "team:<id>" or "user:<id>" to their weight
+	QUEUE_WEIGHTS = { }
+
+	#: The waiting time (in seconds) that gives a queued job the
+	#: same priority as one job less in the queue (0 to disable aging)
+	QUEUE_AGING = 300
+
+	#: The maximum number of queued jobs per user (0 for no limit)
+	QUEUE_USER_LIMIT = 0
+
+	#: The maximum number of queued jobs per team (0 for no limit)
+	QUEUE_TEAM_LIMIT = 0
+
 	@staticmethod
 	def fromConfig(config, runtimeConfig):
 
@@ -62,6 +102,45 @@ class JobManagerConfig:
 		JobManagerConfig.FAIL_RETRY_DELAY = config.getint("jobmanager", "failure_retry_delay")
 		JobManagerConfig.RESULTS_PATH = config.get("jobmanager", "results_path")
 		JobManagerConfig.MIN_EVENT_THRESSHOLD = config.getint("jobmanager", "min_event_thresshold")
+		if config.has_option("jobmanager", "codec"):
+			JobManagerConfig.PACK_CODEC = config.get("jobmanager", "codec")
+		if config.has_option("jobmanager", "scheduler_batch"):
+			JobManagerConfig.SCHEDULER_BATCH = config.getint("jobmanager", "scheduler_batch")
+		if config.has_option("jobmanager", "scheduler_idle"):
+			JobManagerConfig.SCHEDULER_IDLE = config.getfloat("jobmanager", "scheduler_idle")
+		if config.has_option("jobmanager", "pool_flush_interval"):
+			JobManagerConfig.POOL_FLUSH_INTERVAL = config.getfloat("jobmanager", "pool_flush_interval")
+		if config.has_option("jobmanager", "pool_flush_batch"):
+			JobManagerConfig.POOL_FLUSH_BATCH = config.getint("jobmanager", "pool_flush_batch")
+		if config.has_option("jobmanager", "agent_timeout"):
+			JobManagerConfig.AGENT_TIMEOUT = config.getfloat("jobmanager", "agent_timeout")
+		if config.has_option("jobmanager", "queue_aging"):
+			JobManagerConfig.QUEUE_AGING = config.getfloat("jobmanager", "queue_aging")
+		if config.has_option("jobmanager", "queue_user_limit"):
+			JobManagerConfig.QUEUE_USER_LIMIT = config.getint("jobmanager", "queue_user_limit")
+		if config.has_option("jobmanager", "queue_team_limit"):
+			JobManagerConfig.QUEUE_TEAM_LIMIT = config.getint("jobmanager", "queue_team_limit")
+
+		# Parse the queue weights (ex. "team:1=2,user:12=0.5")
+		if config.has_option("jobmanager", "queue_weights"):
+			JobManagerConfig.QUEUE_WEIGHTS = { }
+			for entry in config.get("jobmanager", "queue_weights").split(","):
+				if not entry.strip():
+					continue
+				try:
+					(key, weight) = entry.split("=")
+					JobManagerConfig.QUEUE_WEIGHTS[key.strip()] = float(weight)
+				except ValueError:
+					raise ConfigException("Invalid queue weight '%s'" % entry)
+				if JobManagerConfig.QUEUE_WEIGHTS[key.strip()] <= 0:
+					raise ConfigException("The queue weight of '%s' must be positive" % key.strip())
+
+		# Use the configured codec when packing histograms
+		try:
+			IntermediateHistogramCollection.CODEC = compression.getCodec( JobManagerConfig.PACK_CODEC )
+			InterpolatableCollection.CODEC = IntermediateHistogramCollection.CODEC
+		except ValueError as e:
+			raise ConfigException(str(e))
 
 """
 Create a configuration for the JOB MANAGER based on the core config
@@ -24,6 +24,8 @@ import logging
 from geoip import geolite2
 from jobmanager.config import Config
 
+import jobmanager.io.pool as pool
+
 from liveq.models import Agent, AgentGroup, AgentMetrics, PostMortems
 from liveq.reporting.postmortem import PostMortem
 from liveq.reporting.lars import LARS
@@ -86,14 +88,23 @@ def getAgent(uid):
 	it's missing
 	"""
 
+	# Use the indexed instance
+	agent = pool.getAgent(uid)
+	if agent:
+		return agent
+
 	# Fetch or create agent
 	try:
-		return Agent.get(Agent.uuid==uid)
+		agent = Agent.get(Agent.uuid==uid)
 
 	except Agent.DoesNotExist:
 
-		# Return the new agent entry
-		return Agent.create(uuid=uid, group=getAgentGroup(DEFAULT_GROUP))
+		# Create the new agent entry
+		agent = Agent.create(uuid=uid, group=getAgentGroup(DEFAULT_GROUP))
+
+	# Index and return
+	pool.update(agent)
+	return agent
 
 def getAgentMetrics(uid):
 	"""
@@ -119,12 +130,11 @@ def getAgentFromJob(jid):
 	Return the agent that is running the given job
 	"""
 
-	# Try to fetch agent
-	try:
-		return Agent.get(Agent.activeJob == int(jid))
-	except Agent.DoesNotExist:
-		# Return none if missing
+	# Try to fetch agent, returning None if missing
+	agents = pool.getJobAgents(jid, online=False)
+	if not agents:
 		return None
+	return agents[0]
 
 def getOnlineAgents():
 	"""
@@ -132,7 +142,7 @@ def getOnlineAgents():
 	"""
 
 	# Return all the agents
-	return Agent.select().where( Agent.state == 1 )
+	return pool.getAgents(online=True)
 
 def updateActivity(uid):
 	"""
@@ -144,7 +154,7 @@ def updateActivity(uid):
 
 	# Update activity
 	agentEntry.lastActivity = time.time()
-	agentEntry.save()
+	pool.update(agentEntry)
 
 def updatePresence(uid, state=1):
 	"""
@@ -159,7 +169,7 @@ def updatePresence(uid, state=1):
 	agentEntry.lastActivity = time.time()
 
 	# Save entry
-	agentEntry.save()
+	pool.update(agentEntry)
 
 	# Send report to LARS
 	report = LARS.openGroup("agents", uid, alias=uid)
@@ -170,13 +180,12 @@ def updateAllPresence(state=1, exclude=[]):
 	Update the presence of all workers
 	"""
 
-	# Prepare query
-	query = Agent.select()
-	if len(exclude) > 0:
-		query = query.where( Agent.uuid.not_in( exclude ) )
-
 	# Iterate over agents
-	for agentEntry in query:
+	for agentEntry in pool.getAgents():
+
+		# Skip excluded
+		if agentEntry.uuid in exclude:
+			continue
 
 		# Switch state and last time seen
 		agentEntry.state = state
@@ -184,7 +193,7 @@ def updateAllPresence(state=1, exclude=[]):
 			agentEntry.lastActivity = time.time()
 
 		# Save entry
-		agentEntry.save()
+		pool.update(agentEntry)
 
 def updateHandshake(uid, attrib):
 	"""
@@ -256,7 +265,7 @@ def updateHandshake(uid, attrib):
 	report.set("ip", ip)
 
 	# Save entry
-	agentEntry.save()
+	pool.update(agentEntry)
 	return agentEntry
 
 def agentJobFailed(uid, job, postMortemBuffer=None):
@@ -274,7 +283,7 @@ def agentJobFailed(uid, job, postMortemBuffer=None):
 	# Update error count and error timestamp
 	agentEntry.fail_count += 1
 	agentEntry.fail_timestamp = time.time()
-	agentEntry.save()
+	pool.update(agentEntry)
 
 	# Fetch agent metrics
 	agentMetrics = getAgentMetrics(uid)
@@ -317,7 +326,7 @@ def agentJobSucceeded(uid, job):
 	# Reset error count and error timestamp
 	agentEntry.fail_count = 0
 	agentEntry.fail_timestamp = 0
-	agentEntry.save()
+	pool.update(agentEntry)
 
 	# Fetch agent metrics
 	agentMetrics = getAgentMetrics(uid)
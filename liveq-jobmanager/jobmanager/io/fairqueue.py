@@ -0,0 +1,213 @@
+################################################################
+# LiveQ - An interactive volunteering computing batch system
+# Copyright (C) 2013 Ioannis Charalampidis
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+################################################################
+
+"""
+Weighted Fair Queue
+
+The jobs of every agent group are kept in a sorted set in the store, ordered
+by the virtual time their service is finished if every user gets a share of
+the group proportional to their weight. A user that floods the queue is
+therefore pushed back in favour of the users with fewer queued jobs.
+
+The weight of a user is the product of the user and the team weights defined
+in the QUEUE_WEIGHTS configuration, and the jobs that are waiting are aged:
+every QUEUE_AGING seconds of waiting is worth one job of virtual time.
+The number of queued jobs of every user and team can also be limited.
+"""
+
+import time
+import json
+import logging
+
+from jobmanager.config import Config
+
+logger = logging.getLogger("fairqueue")
+
+#: The groups whose legacy (list) queue was already migrated
+migratedGroups = set()
+
+def getWeight(team, user):
+	"""
+	Return the weight of the given team/user
+	"""
+	return Config.QUEUE_WEIGHTS.get("team:%s" % team, 1.0) * Config.QUEUE_WEIGHTS.get("user:%s" % user, 1.0)
+
+def _migrate(group):
+	"""
+	Move the jobs of the legacy list queue of the given group to the front
+	of the fair queue, keeping their order
+	"""
+
+	# Do it once per group
+	if group in migratedGroups:
+		return
+	migratedGroups.add(group)
+
+	# Pop in the same order the legacy queue did
+	legacyKey = "scheduler:queue:%s" % group
+	while True:
+		job_id = Config.STORE.rpop( legacyKey )
+		if not job_id:
+			break
+		Config.STORE.rpush( "scheduler:wfq:%s:deferred" % group, job_id )
+
+def _release(prefix, job_id):
+	"""
+	Drop the info of a job that was taken out of the queue with the given
+	prefix and release it from the user and team counters
+	"""
+
+	# Fetch the job info
+	info = Config.STORE.hget( "%s:jobs" % prefix, job_id )
+	if not info:
+		return None
+	info = json.loads(info)
+
+	# Release the job from the user and team counters
+	pipe = Config.STORE.pipeline()
+	pipe.hdel( "%s:jobs" % prefix, job_id )
+	pipe.hincrby( "%s:pending" % prefix, "team:%s" % info['team'], -1 )
+	pipe.hincrby( "%s:pending" % prefix, "user:%s" % info['user'], -1 )
+	pipe.execute()
+	return info
+
+def enqueue(group, job_id, team, user, now=None):
+	"""
+	Place the given job of team/user in the queue of the given group.
+
+	This function returns FALSE if the job was not admitted, because the user
+	or the team has reached the maximum number of queued jobs.
+	"""
+
+	# Get current time
+	if now is None:
+		now = time.time()
+
+	# Check admission limits
+	prefix = "scheduler:wfq:%s" % group
+	(teamJobs, userJobs) = Config.STORE.hmget( "%s:pending" % prefix, [ "team:%s" % team, "user:%s" % user ] )
+	if (Config.QUEUE_TEAM_LIMIT > 0) and (int(teamJobs or 0) >= Config.QUEUE_TEAM_LIMIT):
+		logger.warn("Team %s has reached the limit of %i queued jobs" % (team, Config.QUEUE_TEAM_LIMIT))
+		return False
+	if (Config.QUEUE_USER_LIMIT > 0) and (int(userJobs or 0) >= Config.QUEUE_USER_LIMIT):
+		logger.warn("User %s has reached the limit of %i queued jobs" % (user, Config.QUEUE_USER_LIMIT))
+		return False
+
+	# The job starts after the previous job of the same user,
+	# but not before the current virtual time of the queue
+	flow = "%s:%s" % (team, user)
+	vtime = float( Config.STORE.get( "%s:vtime" % prefix ) or 0 )
+	start = max( vtime, float( Config.STORE.hget( "%s:finish" % prefix, flow ) or 0 ) )
+	finish = start + 1.0 / getWeight(team, user)
+
+	# Age the job by ordering on the submission time as well
+	score = finish
+	if Config.QUEUE_AGING > 0:
+		score += now / Config.QUEUE_AGING
+
+	# Place job
+	pipe = Config.STORE.pipeline()
+	pipe.hset( "%s:finish" % prefix, flow, finish )
+	pipe.hset( "%s:jobs" % prefix, job_id, json.dumps({ 'team': team, 'user': user, 'start': start }) )
+	pipe.hincrby( "%s:pending" % prefix, "team:%s" % team, 1 )
+	pipe.hincrby( "%s:pending" % prefix, "user:%s" % user, 1 )
+	pipe.zadd( prefix, score, job_id )
+	pipe.execute()
+	return True
+
+def defer(group, job_id, team, user):
+	"""
+	Put the given job back in the front of the queue of the given group,
+	since it was already picked by the fair queue
+	"""
+
+	# Place job
+	prefix = "scheduler:wfq:%s" % group
+	pipe = Config.STORE.pipeline()
+	pipe.hset( "%s:jobs" % prefix, job_id, json.dumps({ 'team': team, 'user': user, 'start': None }) )
+	pipe.hincrby( "%s:pending" % prefix, "team:%s" % team, 1 )
+	pipe.hincrby( "%s:pending" % prefix, "user:%s" % user, 1 )
+	pipe.rpush( "%s:deferred" % prefix, job_id )
+	pipe.execute()
+
+def pop(group):
+	"""
+	Pop the next job ID from the queue of the given group, or return
+	None if the queue is empty
+	"""
+
+	# Migrate the legacy queue
+	_migrate(group)
+
+	# Deferred jobs go first
+	prefix = "scheduler:wfq:%s" % group
+	job_id = Config.STORE.lpop( "%s:deferred" % prefix )
+	while not job_id:
+
+		# Then pick the job with the lowest score
+		head = Config.STORE.zrange( prefix, 0, 0 )
+		if not head:
+			return None
+
+		# Another job manager might have taken it
+		if Config.STORE.zrem( prefix, head[0] ):
+			job_id = head[0]
+
+	# Release the job from the user and team counters
+	info = _release( prefix, job_id )
+	if not info:
+		return job_id
+
+	# The virtual time reaches the start of the job in service
+	if not info['start'] is None:
+		vtime = float( Config.STORE.get( "%s:vtime" % prefix ) or 0 )
+		if info['start'] > vtime:
+			Config.STORE.set( "%s:vtime" % prefix, info['start'] )
+
+	# Return the job ID
+	return job_id
+
+def remove(group, job_id):
+	"""
+	Remove the given job from the queue of the given group, if it is still
+	waiting there, and release it from the user and team counters.
+
+	This function returns TRUE if the job was removed, or FALSE if it was
+	not queued (or another job manager has already popped it).
+	"""
+
+	# Migrate the legacy queue
+	_migrate(group)
+
+	# Only the one that takes the job out of the queue releases it
+	prefix = "scheduler:wfq:%s" % group
+	if not Config.STORE.zrem( prefix, job_id ):
+		if not Config.STORE.lrem( "%s:deferred" % prefix, 0, job_id ):
+			return False
+
+	# Release the job from the user and team counters
+	_release( prefix, job_id )
+	return True
+
+def getPending(group):
+	"""
+	Return the number of jobs waiting in the queue of the given group
+	"""
+	prefix = "scheduler:wfq:%s" % group
+	return Config.STORE.zcard( prefix ) + Config.STORE.llen( "%s:deferred" % prefix )
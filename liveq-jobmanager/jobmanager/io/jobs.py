@@ -23,12 +23,14 @@ import cPickle as pickle
 import random
 import json
 
+import jobmanager.io.pool as pool
+
 from jobmanager.config import Config
-from peewee import fn
 
 from liveq.utils import deepupdate
-from liveq.models import Agent, Lab, JobQueue
-from liveq.data.histo.sum import intermediateCollectionMerge
+from liveq.models import Lab, JobQueue
+from liveq.data.histo.intermediate import IntermediateHistogramCollection
+from liveq.data.histo.sum import IntermediateCollectionSum
 from liveq.utils.remotelock import RemoteLock
 from liveq.reporting.lars import LARS
 
@@ -83,28 +85,101 @@ class Job:
 		else:
 			self.channel = None
 
-	def updateHistograms(self, agent_id, data):
+	def _lockSums(self):
+		"""
+		Acquire and return the lock that protects the running sums and the
+		per-agent histograms of the job from concurrent updates
+		"""
+		lock = RemoteLock(Config.STORE, "job-%s:sumlck" % self.id)
+		lock.acquire(True)
+		return lock
+
+	def _loadSums(self):
+		"""
+		Return the running sums of the histograms of all the agents, migrating
+		the data of jobs stored in the legacy (pickled) format if needed.
+
+		The caller must hold the lock returned by _lockSums().
+		"""
+
+		# Fetch the running sums from the store
+		buf = Config.STORE.get("job-%s:sum" % self.id)
+		if buf:
+			return IntermediateCollectionSum.fromPack(buf, decompress=False, decode=False)
+
+		# Check for legacy data
+		acc = IntermediateCollectionSum()
+		buf = Config.STORE.get("job-%s:histo" % self.id)
+		if not buf:
+			return acc
+
+		# Split the pickled collections to the per-agent hash
+		pipe = Config.STORE.pipeline()
+		for agent_id, histos in pickle.loads(buf).iteritems():
+			acc.add(histos)
+			pipe.hset("job-%s:agents" % self.id, agent_id, histos.pack(encode=False))
+		pipe.set("job-%s:sum" % self.id, acc.pack(encode=False, compress=False))
+		pipe.delete("job-%s:histo" % self.id)
+		pipe.execute()
+
+		# Return sums
+		return acc
+
+	def updateHistograms(self, agent_id, data, partial=False):
 		"""
 		Add/Update a histogram data for the given agent_id
 		and return all the histograms as an array
+
+		If partial is True, the data contain only the changed histograms of
+		the agent and are patched on top of the previously stored ones.
+
+		The histograms of every agent are kept in the job-<id>:agents hash and
+		the merged result is updated incrementally through the running sums
+		in job-<id>:sum, so the cost does not depend on the number of agents.
 		"""
 
-		# Prepare histograms dict
-		histos = { }
+		# Lock the sums for the whole read-modify-write
+		lock = self._lockSums()
+		try:
 
-		# Fetch histogram buffer from store
-		buf = Config.STORE.get("job-%s:histo" % self.id)
-		if buf:
-			histos = pickle.loads(buf)
+			# Fetch the running sums and the previous data of the agent
+			acc = self._loadSums()
+			buf = Config.STORE.hget("job-%s:agents" % self.id, agent_id)
+
+			# Subtract the previous contribution of the agent
+			histos = data
+			if buf:
+				prev = IntermediateHistogramCollection.fromPack(buf, decode=False)
+				if partial:
+
+					# Only the histograms sent are replaced
+					old = IntermediateHistogramCollection(state=prev.state)
+					for k in data.keys():
+						if k in prev:
+							old[k] = prev[k]
+					acc.remove(old)
 
-		# Update our histogram
-		histos[agent_id] = data
+					# Patch the stored agent data
+					prev.update(data)
+					histos = prev
 
-		# Put it back
-		Config.STORE.set("job-%s:histo" % self.id, pickle.dumps(histos))
+				else:
+					acc.remove(prev)
 
-		# Merge histograms
-		hc = intermediateCollectionMerge( histos.values() )
+			# Add the new contribution
+			acc.add(data)
+
+			# Put both back
+			pipe = Config.STORE.pipeline()
+			pipe.hset("job-%s:agents" % self.id, agent_id, histos.pack(encode=False))
+			pipe.set("job-%s:sum" % self.id, acc.pack(encode=False, compress=False))
+			pipe.execute()
+
+		finally:
+			lock.release()
+
+		# Get merged histograms
+		hc = acc.collection()
 
 		# Update number of events in the job files
 		self.job.events = hc.countEvents()
@@ -134,78 +209,95 @@ class Job:
 		Get and merge all the histograms in the stack
 		"""
 
-		# Prepare histograms dict
-		histos = { }
-
-		# Fetch histogram buffer from store
-		buf = Config.STORE.get("job-%s:histo" % self.id)
-		if buf:
-			histos = pickle.loads(buf)
+		# Get the running sums
+		lock = self._lockSums()
+		try:
+			acc = self._loadSums()
+		finally:
+			lock.release()
+		if len(acc.sums) == 0:
+			return None
 
-		# Merge and return histograms
-		return intermediateCollectionMerge( histos.values() )
+		# Return the merged histograms
+		return acc.collection()
 
 	def stockAllAgentData(self):
 		"""
 		Summarize all the results from all workers to 'stock'
 		"""
 
-		# Fetch histogram buffer from store
-		buf = Config.STORE.get("job-%s:histo" % self.id)
-		if not buf:
-			return 0
+		# Lock the sums while the agent data are moved
+		lock = self._lockSums()
+		try:
 
-		# Unpickle
-		agentHistograms = pickle.loads(buf)
+			# Fetch the running sums and the agents with data
+			acc = self._loadSums()
+			agentIds = Config.STORE.hkeys("job-%s:agents" % self.id)
+			if not agentIds:
+				return 0
 
-		# Check if everything is already stocked
-		if (len(agentHistograms) == 1) and ('stock' in agentHistograms):
-			return
+			# Check if everything is already stocked
+			if (len(agentIds) == 1) and ('stock' in agentIds):
+				return
 
-		# Combine ALL histograms to 'stock'
-		stock = intermediateCollectionMerge( agentHistograms.values() )
-		agentHistograms = { 'stock': stock }
+			# The merged histograms of all agents become the stock
+			# (the running sums remain the same)
+			pipe = Config.STORE.pipeline()
+			pipe.delete("job-%s:agents" % self.id)
+			pipe.hset("job-%s:agents" % self.id, 'stock', acc.collection().pack(encode=False))
+			pipe.execute()
 
-		# Pickle and put back
-		Config.STORE.set("job-%s:histo" % self.id, pickle.dumps(agentHistograms))
+		finally:
+			lock.release()
 
 	def stockAgentData(self, agent):
 		"""
 		Stock the already collected agent data out of the tree
 		"""
 
-		# Fetch histogram buffer from store
-		buf = Config.STORE.get("job-%s:histo" % self.id)
-		if not buf:
-			return 0
+		# Lock the sums while the agent data are moved
+		lock = self._lockSums()
+		try:
 
-		# Get agent id
-		agent_id = agent.uuid
+			# Make sure legacy data are migrated
+			self._loadSums()
 
-		# Unpickle
-		stockUsed = 0
-		agentHistograms = pickle.loads(buf)
-		if agent_id in agentHistograms:
+			# Get agent id
+			agent_id = agent.uuid
 
-			# Get stockpile & combine agent data in there
-			stock = agentHistograms[agent_id]
-			if 'stock' in agentHistograms:
-				stock = intermediateCollectionMerge(
-						[ agentHistograms['stock'], stock ]
-					)
+			# Fetch the agent data, the stockpile and the number of entries
+			pipe = Config.STORE.pipeline()
+			pipe.hget("job-%s:agents" % self.id, agent_id)
+			pipe.hget("job-%s:agents" % self.id, 'stock')
+			pipe.hlen("job-%s:agents" % self.id)
+			(buf, stockBuf, numEntries) = pipe.execute()
+			if not numEntries:
+				return 0
 
-			# Update stockpile
-			agentHistograms['stock'] = stock
-			stockUsed = 1
+			stockUsed = 0
+			if buf:
 
-			# Delete agent record
-			del agentHistograms[agent_id]
+				# Combine agent data in the stockpile
+				stock = IntermediateCollectionSum()
+				stock.add( IntermediateHistogramCollection.fromPack(buf, decode=False) )
+				if stockBuf:
+					stock.add( IntermediateHistogramCollection.fromPack(stockBuf, decode=False) )
+				else:
+					numEntries += 1
 
-		# Pickle and put back
-		Config.STORE.set("job-%s:histo" % self.id, pickle.dumps(agentHistograms))
+				# Update stockpile and delete agent record
+				pipe = Config.STORE.pipeline()
+				pipe.hset("job-%s:agents" % self.id, 'stock', stock.collection().pack(encode=False))
+				pipe.hdel("job-%s:agents" % self.id, agent_id)
+				pipe.execute()
+				numEntries -= 1
+				stockUsed = 1
 
-		# Return number of agents left
-		return len(agentHistograms) - stockUsed
+			# Return number of agents left
+			return numEntries - stockUsed
+
+		finally:
+			lock.release()
 
 	def release(self, reason=JobQueue.COMPLETED):
 		"""
@@ -213,7 +305,7 @@ class Job:
 		"""
 
 		# Delete entries in the STORE
-		Config.STORE.delete("job-%s:histo" % self.id)
+		Config.STORE.delete("job-%s:agents" % self.id, "job-%s:sum" % self.id, "job-%s:histo" % self.id)
 
 		# Mark job as completed & remove acknowledgemenet
 		self.job.status = reason
@@ -265,19 +357,13 @@ class Job:
 		"""
 
 		# Calculate how many events do active workers are processing
-		counters = Agent.select( fn.Sum( Agent.activeJobEvents ).alias('events') ) \
-						.where( Agent.activeJob == self.job.id ) \
-						.get()
-
-		# Handle None cases
-		if counters.events is None:
-			counters.events = 0
+		activeEvents = pool.getJobEvents( self.job.id )
 
 		# Get target events
 		targetEvents = self.lab.getEventCount()
 
 		# Check how many events are left
-		return targetEvents - self.job.events - counters.events
+		return targetEvents - self.job.events - activeEvents
 
 	def getBatchRuntimeConfig(self, agents):
 		"""
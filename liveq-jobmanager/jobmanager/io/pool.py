@@ -0,0 +1,384 @@
+################################################################
+# LiveQ - An interactive volunteering computing batch system
+# Copyright (C) 2013 Ioannis Charalampidis
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+################################################################
+
+"""
+Agent Pool Index
+
+The scheduler decisions are taken on this index instead of querying the
+database: it keeps the agent instances of every group, split in the online,
+the free and the busy ones, the agents that work on every job and the heap
+of the agents that are cooling down after a failure.
+
+The index is rebuilt from the database when the job manager starts and it's
+kept up to date by calling update() every time an agent instance is modified.
+The modified agents are then written back to the database in batches by a
+background thread.
+"""
+
+import time
+import heapq
+import logging
+import threading
+import traceback
+
+from jobmanager.config import Config
+
+from playhouse.shortcuts import case
+from liveq.models import Agent, AgentGroup
+from liveq.events import GlobalEvents
+
+logger = logging.getLogger("agent-pool")
+
+#: Lock that protects the index
+lock = threading.RLock()
+
+#: The agent instances, indexed by their uuid
+agentsByUUID = { }
+
+#: The uuid of the agent groups, indexed by their id
+groupNames = { }
+
+#: The online agents of every group
+groupOnline = { }
+
+#: The online agents of every group that can take a job
+groupFree = { }
+
+#: The online agents of every group, indexed by the job they are working on
+groupJobs = { }
+
+#: The agents working on every job, regardless of their state
+jobAgents = { }
+
+#: The (retry time, uuid) heap of the agents that failed recently
+cooldown = [ ]
+
+#: Where every agent is indexed as (group, online, free, job)
+indexedAs = { }
+
+#: The agents modified since the last write to the database
+dirty = { }
+
+#: The event that triggers a write to the database
+flushEvent = threading.Event()
+
+#: The writer thread
+writerThread = None
+
+def _groupOf(agent):
+	"""
+	Return the uuid of the group the agent belongs to
+	"""
+
+	# Resolve the group name from the ID
+	gid = agent._data.get('group')
+	if not gid in groupNames:
+		groupNames[gid] = AgentGroup.get(AgentGroup.id == gid).uuid
+	return groupNames[gid]
+
+def _unindex(uuid):
+	"""
+	Remove the agent from the index sets
+	"""
+
+	# Check if it's indexed
+	if not uuid in indexedAs:
+		return
+	(group, online, free, job) = indexedAs.pop(uuid)
+
+	# Remove from the job
+	if job:
+		jobAgents[job].discard(uuid)
+		if not jobAgents[job]:
+			del jobAgents[job]
+
+	# Remove from the group
+	if online:
+		groupOnline[group].discard(uuid)
+		groupFree[group].discard(uuid)
+		if job:
+			groupJobs[group][job].discard(uuid)
+			if not groupJobs[group][job]:
+				del groupJobs[group][job]
+
+def _index(agent, now=None):
+	"""
+	(Re-)Index the agent according to its current state
+	"""
+
+	# Forget the old state
+	uuid = agent.uuid
+	_unindex(uuid)
+
+	# Check the state of the agent
+	group = _groupOf(agent)
+	online = (agent.state == 1)
+	job = int(agent.activeJob or 0)
+	free = False
+
+	# Keep the agents working on the job
+	if job:
+		jobAgents.setdefault(job, set()).add(uuid)
+
+	# Index the online agents in the group
+	if online:
+		groupOnline.setdefault(group, set()).add(uuid)
+		groupFree.setdefault(group, set())
+		groupJobs.setdefault(group, { })
+		if job:
+			groupJobs[group].setdefault(job, set()).add(uuid)
+
+		# Idle agents that did not fail too many times can take a job
+		# after they cool down from their last failure
+		elif agent.fail_count < Config.FAIL_LIMIT:
+			retryTime = agent.fail_timestamp + Config.FAIL_DELAY
+			if now is None:
+				now = time.time()
+			if retryTime < now:
+				groupFree[group].add(uuid)
+				free = True
+			else:
+				heapq.heappush(cooldown, (retryTime, uuid))
+
+	# Keep where it's indexed
+	indexedAs[uuid] = (group, online, free, job)
+
+def _refresh():
+	"""
+	Move the agents that cooled down to the free sets
+	"""
+
+	now = time.time()
+	while cooldown and (cooldown[0][0] < now):
+		(retryTime, uuid) = heapq.heappop(cooldown)
+		if uuid in agentsByUUID:
+			_index(agentsByUUID[uuid], now)
+
+##############################################################
+# ------------------------------------------------------------
+#  INTERFACE FUNCTIONS
+# ------------------------------------------------------------
+##############################################################
+
+def rebuild():
+	"""
+	Rebuild the index from the agents in the database
+	"""
+	global cooldown
+
+	with lock:
+
+		# Reset index
+		agentsByUUID.clear()
+		groupNames.clear()
+		groupOnline.clear()
+		groupFree.clear()
+		groupJobs.clear()
+		jobAgents.clear()
+		indexedAs.clear()
+		cooldown = [ ]
+
+		# Fetch groups and agents
+		for (gid, name) in AgentGroup.select( AgentGroup.id, AgentGroup.uuid ).tuples():
+			groupNames[gid] = name
+		now = time.time()
+		for agent in Agent.select():
+			agentsByUUID[agent.uuid] = agent
+			_index(agent, now)
+
+		logger.info("Indexed %i agents in %i groups" % (len(agentsByUUID), len(groupNames)))
+
+def update(agent):
+	"""
+	Update the index after the given agent instance was modified
+	and schedule it for writing to the database
+	"""
+
+	updateMany([ agent ])
+
+def updateMany(agents):
+	"""
+	Update the index after the given agent instances were modified
+	and schedule them for writing to the database
+	"""
+
+	with lock:
+		now = time.time()
+		for agent in agents:
+			agentsByUUID[agent.uuid] = agent
+			_index(agent, now)
+			dirty[agent.uuid] = agent
+
+def getAgent(uuid):
+	"""
+	Return the agent instance with the given uuid or None if it's not indexed
+	"""
+	return agentsByUUID.get(uuid, None)
+
+def getAgents(online=None):
+	"""
+	Return all the agent instances, or only the online (or offline) ones
+	"""
+
+	with lock:
+		if online is None:
+			return agentsByUUID.values()
+		return [ a for a in agentsByUUID.values() if (a.state == 1) == online ]
+
+def measure(group):
+	"""
+	Return the (total, free, individual) metrics of the online agents of
+	the given group: the number of agents, the number of the agents that can
+	take a job and the number of the different jobs they are working on.
+	"""
+
+	with lock:
+		_refresh()
+		return (
+			len(groupOnline.get(group, ())),
+			len(groupFree.get(group, ())),
+			len(groupJobs.get(group, ()))
+			)
+
+def getFree(group, count):
+	"""
+	Return up to count agents of the given group that can take a job
+	"""
+
+	with lock:
+		_refresh()
+		free = sorted(groupFree.get(group, ()))[0:count]
+		return [ agentsByUUID[uuid] for uuid in free ]
+
+def getGroupJobs(group):
+	"""
+	Return a list of (job, agents) for the jobs the online agents of
+	the given group are working on
+	"""
+
+	with lock:
+		jobs = groupJobs.get(group, { })
+		return [ (job, [ agentsByUUID[uuid] for uuid in sorted(jobs[job]) ]) for job in sorted(jobs) ]
+
+def getJobAgents(job, online=True):
+	"""
+	Return the (online) agents working on the given job
+	"""
+
+	with lock:
+		ans = [ agentsByUUID[uuid] for uuid in sorted(jobAgents.get(int(job), ())) ]
+		if online:
+			ans = [ a for a in ans if a.state == 1 ]
+		return ans
+
+def getJobEvents(job):
+	"""
+	Return the number of events the agents working on the given
+	job are processing
+	"""
+
+	with lock:
+		return sum([ agentsByUUID[uuid].activeJobEvents for uuid in jobAgents.get(int(job), ()) ])
+
+def _write(agents):
+	"""
+	Write the given agent instances to the database with a single
+	UPDATE ... CASE statement
+	"""
+
+	# Build a CASE expression for every column
+	values = { }
+	for field in Agent._meta.sorted_fields:
+		if field.name in ('id', 'uuid'):
+			continue
+		cases = [ (a.id, a._data[field.name]) for a in agents if field.name in a._data ]
+		if cases:
+			values[field.name] = case(Agent.id, cases, field)
+
+	# Update all the agents at once
+	Agent.update( **values ).where( Agent.id << [ a.id for a in agents ] ).execute()
+
+def flush():
+	"""
+	Write the modified agents to the database in a single transaction,
+	using one bulk update for every POOL_FLUSH_BATCH agents
+	"""
+	global dirty
+
+	# Take the modified agents
+	with lock:
+		if not dirty:
+			return 0
+		agents = dirty
+		dirty = { }
+
+	# Write them in batches of bulk updates
+	try:
+		batch = agents.values()
+		with Agent._meta.database.transaction():
+			for i in range(0, len(batch), Config.POOL_FLUSH_BATCH):
+				_write( batch[i:i+Config.POOL_FLUSH_BATCH] )
+	except Exception as e:
+		traceback.print_exc()
+		logger.error("Could not write %i agents to the database: %s" % (len(agents), str(e)))
+
+		# Retry on the next flush, unless they were modified again
+		with lock:
+			for (uuid, agent) in agents.items():
+				dirty.setdefault(uuid, agent)
+		return 0
+
+	# Return the number of agents written
+	return len(agents)
+
+def _writerMain():
+	"""
+	Write the modified agents to the database periodically until shutdown
+	"""
+
+	while writerThread:
+		flushEvent.wait( Config.POOL_FLUSH_INTERVAL )
+		flushEvent.clear()
+		flush()
+
+def _onShutdown():
+	"""
+	Stop the writer thread and write the pending changes
+	"""
+	global writerThread
+
+	writerThread = None
+	flushEvent.set()
+	flush()
+
+def start():
+	"""
+	Rebuild the index and start writing the changes to the database
+	"""
+	global writerThread
+
+	# Build the index
+	rebuild()
+
+	# Start the writer
+	if writerThread is None:
+		writerThread = threading.Thread(target=_writerMain)
+		writerThread.daemon = True
+		writerThread.start()
+		GlobalEvents.System.on('shutdown', _onShutdown)
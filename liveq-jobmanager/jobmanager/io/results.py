@@ -22,6 +22,7 @@ import cPickle as pickle
 import logging
 
 from liveq.data.histo.intermediate import IntermediateHistogramCollection
+from liveq.models import JobQueue, Lab
 from jobmanager.config import Config
 
 logger = logging.getLogger("results")
@@ -42,6 +43,31 @@ def dump(job, histograms):
 	with open(dumpPath, "wb") as f:
 		f.write( histograms.pack() )
 
+	# Index the results for the exact matches of the interpolator
+	index(job.job)
+
+def index(job):
+	"""
+	Put the given completed job in the lab-<uuid>:exact hash, that maps the
+	value index of the tunes of a lab to the job with their results
+	"""
+	Config.STORE.hset( "lab-%s:exact" % job.lab.uuid, job.valueIndex, job.id )
+
+def indexCompleted():
+	"""
+	Index the completed jobs with results dumps, the first time the
+	exact match index is used
+	"""
+
+	# Only one job manager does that
+	if not Config.STORE.setnx("results:exact-indexed", 1):
+		return
+
+	# Index the jobs with results
+	for job in JobQueue.select(JobQueue, Lab).join(Lab).where( JobQueue.status == JobQueue.COMPLETED ):
+		if os.path.exists( "%s/job-%s.bin" % (Config.RESULTS_PATH, str(job.id)) ):
+			index(job)
+
 def loadRaw(job_id):
 	"""
 	Load raw payload without decoding to histograms
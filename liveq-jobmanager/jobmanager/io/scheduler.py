@@ -20,17 +20,17 @@
 import sys
 import time
 import json
+import threading
 
 import logging
 import jobmanager.io.agents as agents
 import jobmanager.io.jobs as jobs
+import jobmanager.io.pool as pool
+import jobmanager.io.fairqueue as fairqueue
 
 from jobmanager.config import Config
-from peewee import fn, RawQuery
-
 from liveq.utils.fsm import StoredFSM, state_handler, event_handler
 from liveq.utils.remotelock import RemoteLock
-from liveq.models import Agent, AgentGroup
 from liveq.reporting.lars import LARS
 
 logger = logging.getLogger("scheduler")
@@ -46,11 +46,15 @@ pendingCompletedJobs = [ ]
 #: The last index in the agent group list
 lastGroupIndex = 0
 
+#: The event that wakes up the scheduler loop when there might
+#: be something to place (a job was queued or an agent was freed)
+wakeEvent = threading.Event()
+
 class GroupResources:
 	"""
-	This class is used as a 'smart pointer' to the database groups. Instead of fetching
+	This class is used as a 'smart pointer' to the agent groups. Instead of fetching
 	all the entries and operating over them, this class will fetch and operate only on metrics.
-	individual queries will occur only when needid.
+	The metrics and the agents are taken from the in-memory agent pool index.
 	"""
 
 	def __init__(self, group, semaphore=None):
@@ -58,36 +62,14 @@ class GroupResources:
 		Fetch initial data 
 		"""
 
-		# Calculate the cooldown time after a failure
-		time_retry = time.time() - Config.FAIL_DELAY
-
 		# Keep references
 		self.semaphore = semaphore
+		self.group = group
 
-		# Get group reference
-		self.group = AgentGroup.get(uuid=group)
-		self.gid = self.group.id
-
-		# Count total
-		values = Agent.select( fn.Count("id") ).where( 
-					(Agent.state == 1) & (Agent.group == self.group) 
-				).tuples().execute().next()
-		self.total = values[0]
-
-		# Count free
-		values = Agent.select( fn.Count("id") ).where( 
-					(Agent.state == 1) & (Agent.group == self.group) & (Agent.activeJob == 0) 
-				  & (Agent.fail_timestamp < time_retry) & (Agent.fail_count < Config.FAIL_LIMIT)
-				).tuples().execute().next()
-		self.free = values[0]
+		# Count total, free and individual jobs
+		(self.total, self.free, self.individual) = pool.measure(group)
 		self.used = self.total - self.free
 
-		# Count individual
-		values = Agent.select( fn.Count( fn.Distinct( Agent.activeJob ) ) ).where( 
-					(Agent.state == 1) & (Agent.group == self.group) & (Agent.activeJob != 0) 
-				).tuples().execute().next()
-		self.individual = values[0]
-
 		# Debug metrics
 		logger.info("Metrics %s { total=%i, free=%i, used=%i, individual=%i }" % (group, self.total, self.free, self.used, self.individual))
 
@@ -127,18 +109,7 @@ class GroupResources:
 		"""
 		Return the free agent instances up to count times
 		"""
-
-		# Calculate the cooldown time after a failure
-		time_retry = time.time() - Config.FAIL_DELAY
-
-		# Place query
-		query = Agent.select().where( 
-				(Agent.group == self.group) & (Agent.state == 1) & (Agent.activeJob == 0)
-			  & (Agent.fail_timestamp < time_retry) & (Agent.fail_count < Config.FAIL_LIMIT)
-			).limit(count)
-
-		# Fetch all elements
-		return query[:]
+		return pool.getFree( self.group, count )
 
 	def getDisposable(self, count):
 		"""
@@ -149,22 +120,20 @@ class GroupResources:
 		if self.individual >= self.total:
 			return []
 
-		# Find jobs that occupy more than one agent in the given group
-		values = Agent.select( fn.Count( Agent.id ).alias("njobs"), Agent.activeJob ).where( (Agent.group == self.group) & (Agent.state == 1) ).group_by( Agent.activeJob )
-
 		# Calculate the trimdown to the existing services
 		if self.individual > 0:
 			trimdown = max( int(round( float(self.fairShare) / self.individual )), 1 )
 		else:
 			return [ ]
 
-		# Start trimming until we reach quota
+		# Start trimming the jobs that occupy more than one agent
+		# in the given group until we reach quota
 		ans = []
 		numTrimmed = 0
-		for qualifiedJob in values:
+		for (activeJob, jobAgents) in pool.getGroupJobs( self.group ):
 
 			# Skip nodes with less than 2 available slots
-			if qualifiedJob.njobs < 2:
+			if len(jobAgents) < 2:
 				continue
 
 			# If we need less agents than trimdown, reduce it
@@ -175,17 +144,16 @@ class GroupResources:
 
 			# If we are about to remove all the elements on the job,
 			# keep at least one
-			if trimdown >= qualifiedJob.njobs:
-				trimdown = qualifiedJob.njobs - 1
+			if trimdown >= len(jobAgents):
+				trimdown = len(jobAgents) - 1
 
-			# Fetch the entries for disposable jobs
-			query = Agent.select().where( (Agent.group == self.group) & (Agent.state == 1) & (Agent.activeJob == qualifiedJob.activeJob) ).limit(trimdown)
-			trimAgents = query[:]
+			# Pick the agents to dispose
+			trimAgents = jobAgents[0:trimdown]
 
 			# Since activeJob will be overwritten, use a different
 			# variable name to keep the previous job ID
 			for agent in trimAgents:
-				agent.jobToCancel = agent.activeJob
+				agent.jobToCancel = activeJob
 
 			# Append the agent objects in the answer
 			ans += trimAgents
@@ -224,11 +192,36 @@ def deferJob(job):
 
 	# Remove the last entry
 	logger.info("Defering job %s on queue '%s'" % (job.id, job.group))
-	Config.STORE.rpush( "scheduler:queue:%s" % job.group, job.id )
+	fairqueue.defer( job.group, job.id, job.job.team_id, job.job.user_id )
+
+	# Keep the time the job was first queued
+	Config.STORE.hsetnx( "scheduler:queued", job.id, time.time() )
+
+def reportQueueWait(job):
+	"""
+	Report the time the specified job spent in the queue until it got
+	placed on workers
+	"""
 
-def popQueuedJob():
+	# Get and clear the time the job was queued
+	queued = Config.STORE.hget( "scheduler:queued", job.id )
+	if queued is None:
+		return
+	Config.STORE.hdel( "scheduler:queued", job.id )
+
+	# Report the wait time of the last job and the totals,
+	# which give the average wait time in the group
+	waitTime = max( time.time() - float(queued), 0.0 )
+	logger.info("Job %s waited %.1f seconds in queue '%s'" % (job.id, waitTime, job.group))
+	report = LARS.openGroup("queues", job.group, alias="queue-%s" % job.group)
+	report.set("wait", waitTime)
+	report.add("wait_total", waitTime)
+	report.add("placed", 1)
+
+def popQueuedJob(exclude=[]):
 	"""
-	Pop the next item from the first available queue
+	Pop the next item from the first available queue, skipping the
+	groups in the exclude list
 	"""
 	global lastGroupIndex
 
@@ -258,8 +251,12 @@ def popQueuedJob():
 		gid = (lastGroupIndex + groupOffset) % len(groups)
 		groupOffset += 1
 
+		# Skip excluded groups
+		if groups[gid] in exclude:
+			continue
+
 		# First, pop a job from store
-		job_id = Config.STORE.rpop( "scheduler:queue:%s" % groups[gid] )
+		job_id = fairqueue.pop( groups[gid] )
 
 		# If no jobs are left, continue
 		if not job_id:
@@ -280,6 +277,7 @@ def popQueuedJob():
 		if job.getStatus() == jobs.CANCELLED:
 			# Log
 			logger.warn("Discarding cancelled job %s" % job_id)
+			Config.STORE.hdel( "scheduler:queued", job_id )
 			# Remain on the same group
 			groupOffset -= 1
 			continue
@@ -305,10 +303,10 @@ def handleLoss( agent ):
 		return
 
 	# Get job ID & Remove job from agent
-	job_id = agent._data['activeJob']
+	job_id = agent.activeJob
 	agent.activeJob = 0
 	agent.setRuntime( None )
-	agent.save()
+	pool.update( agent )
 
 	# Return a job instance
 	job = jobs.getJob(job_id)
@@ -334,15 +332,16 @@ def markForJob(agents, job_id, agent_runtimes):
 	Mark the array of agents in the list as being under the given job_id control
 	"""
 
-	# Just loop, update and save
+	# Just loop and update
 	for agent in agents:
 		# Set job ID
 		agent.activeJob = job_id
 		# Set runtime configuration
 		if len(agent_runtimes) > 0:
 			agent.setRuntime( agent_runtimes.pop(0) )
-		# Save
-		agent.save()
+
+	# Update the index at once and write them in bulk
+	pool.updateMany( agents )
 
 	# Return again the agents array
 	return agents
@@ -384,6 +383,54 @@ def process():
 	if job == None:
 		return (None,None,None)
 
+	# Try to place it
+	return placeJob( job )
+
+def processBatch(maxJobs):
+	"""
+	Place up to maxJobs pending jobs from the queues.
+
+	This function returns a list of ( <job instance>, <agent instances to cancel>,
+	<agent instances to launch> ) tuples, one for every job that was placed, in
+	the same format process() returns them.
+
+	The jobs that cannot be placed are put back in queue and their group is not
+	checked again in this batch, since it has no room for any other job either.
+	"""
+
+	# Groups that are full
+	fullGroups = [ ]
+
+	# Place as many jobs as we can
+	placed = [ ]
+	while len(placed) < maxJobs:
+
+		# Pop the next item from the groups that still have room
+		job = popQueuedJob( fullGroups )
+		if job == None:
+			break
+
+		# Try to place it, otherwise skip its group
+		(p_job, a_cancel, a_start) = placeJob( job )
+		if p_job == None:
+			fullGroups.append( job.group )
+			continue
+
+		# Collect
+		placed.append( (p_job, a_cancel, a_start) )
+
+	# Return the placed jobs
+	return placed
+
+def placeJob(job):
+	"""
+	Do the appropriate reservations for starting the given job that was popped
+	from the queue, returning a tuple in the same format as process().
+
+	If the job could not be placed it is put back in the queue and a tuple of
+	three Nones is returned.
+	"""
+
 	# Fetch resource info for the group the job will be started into
 	logger.info("Measuring resoures for group %s" % job.group)
 	res = measureResources( job.group, lock=True )
@@ -437,6 +484,7 @@ def process():
 
 		# Release lock
 		res.release()
+		reportQueueWait( job )
 
 		# Calculate runtime config
 		return (job, [], markForJob(slots, job.id, job.getBatchRuntimeConfig( slots )))
@@ -454,6 +502,7 @@ def process():
 
 			# Activate the already acquired number of slots
 			res.release()
+			reportQueueWait( job )
 			return (job, [], markForJob(slots, job.id, job.getBatchRuntimeConfig( slots )))
 
 		else:
@@ -479,6 +528,7 @@ def process():
 
 	# Release and return resultset
 	res.release()
+	reportQueueWait( job )
 	return (job, d_slots, markForJob(slots, job.id, job.getBatchRuntimeConfig( slots )))
 
 
@@ -488,6 +538,22 @@ def process():
 # ------------------------------------------------------------
 ##############################################################
 
+def wakeup():
+	"""
+	Wake up the scheduler loop, since a job might now be placeable
+	"""
+	wakeEvent.set()
+
+def waitForWork(timeout):
+	"""
+	Block until the scheduler is woken up or until the timeout expires.
+
+	The timeout covers the events we are not notified about, such as jobs
+	queued by other job managers or failed workers becoming usable again.
+	"""
+	wakeEvent.wait(timeout)
+	wakeEvent.clear()
+
 def markOffline( agent_id ):
 	"""
 	Mark the specified agent as Offline
@@ -499,7 +565,7 @@ def markOffline( agent_id ):
 
 	# Mark it as offline
 	agent.state = 0
-	agent.save()
+	pool.update( agent )
 
 	# Handle the loss (and unlink from job)
 	handleLoss( agent )
@@ -515,7 +581,10 @@ def markOnline( agent_id ):
 
 	# Mark it as online
 	agent.state = 1
-	agent.save()
+	pool.update( agent )
+
+	# The agent might be able to take a job
+	wakeup()
 
 def releaseFromJob( agent_id, job ):
 	"""
@@ -534,17 +603,28 @@ def releaseFromJob( agent_id, job ):
 	# Remove the job binding
 	agent.activeJob = 0
 	agent.setRuntime( None )
-	agent.save()
+	pool.update( agent )
+
+	# The agent might be able to take another job
+	wakeup()
 
 def requestJob( job ):
 	"""
 	Request an interest for starting the given job. The job parameter
 	is an instance of the job descriptor.
+
+	This function returns FALSE if the job was not admitted in the queue.
 	"""
 	
-	# Place job on queue
+	# Place job on queue, unless the user or the team
+	# have reached their limits
 	logger.info("Placing job %s on queue '%s'" % (job.id, job.group))
-	Config.STORE.lpush( "scheduler:queue:%s" % job.group, job.id )
+	if not fairqueue.enqueue( job.group, job.id, job.job.team_id, job.job.user_id ):
+		return False
+	Config.STORE.hset( "scheduler:queued", job.id, time.time() )
+
+	# Let the scheduler loop pick it up
+	wakeup()
 	return True
 
 def releaseJob( job ):
@@ -555,7 +635,13 @@ def releaseJob( job ):
 	
 	# Clear the record on the agents that have active jobs
 	logger.info("Releasing job %s" % job.id)
-	numUpdated = Agent.update( activeJob=0 ).where( Agent.activeJob == job.id ).execute()
+	released = pool.getJobAgents( job.id, online=False )
+	for agent in released:
+		agent.activeJob = 0
+	pool.updateMany( released )
+
+	# The agents might be able to take another job
+	wakeup()
 
 def completeOrReschedule( job ):
 	"""
@@ -565,12 +651,12 @@ def completeOrReschedule( job ):
 	global pendingCompletedJobs
 
 	# Check if that was the last agent handling this job
-	values = Agent.select( fn.Count("id").alias("count") ).where( (Agent.state == 1) & (Agent.activeJob == job.id) ).execute().next()
+	count = len(pool.getJobAgents( job.id ))
 
-	logger.info("Complete or reschedule job %s with %i agents?" % (job.id, values.count))
+	logger.info("Complete or reschedule job %s with %i agents?" % (job.id, count))
 
 	# Check if we were left with nothing
-	if values.count == 0:
+	if count == 0:
 
 		# Check if the job is completed
 		if job.isCompleted():
@@ -595,6 +681,7 @@ def completeOrReschedule( job ):
 
 			# Re-place job on queue with highest priority
 			deferJob( job )
+			wakeup()
 
 			# Job is re-scheduled
 			return False
@@ -614,8 +701,13 @@ def abortJob( job ):
 
 	# Fetch agent instances that are working on the given job
 	logger.info("Aborting job %s" % job.id)
-	q = Agent.select().where( (Agent.activeJob == job.id ) & (Agent.state == 1) )
-	agents = q[:]
+	agents = pool.getJobAgents( job.id )
+
+	# If the job is still queued, take it out of the queue so it
+	# stops counting towards the limits of the user and the team
+	if fairqueue.remove( job.group, job.id ):
+		logger.info("Removed job %s from queue '%s'" % (job.id, job.group))
+	Config.STORE.hdel( "scheduler:queued", job.id )
 
 	# Release job
 	releaseJob( job )
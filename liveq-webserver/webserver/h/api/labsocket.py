@@ -33,6 +33,7 @@ from liveq.models import Lab, Observable, TunableToObservable, Agent, JobQueue
 from liveq.data.histo.intermediate import IntermediateHistogramCollection
 from liveq.data.histo.interpolate import InterpolatableCollection
 from liveq.data.histo.utils import rebinToReference
+from liveq.io.shardedchannel import openInterpolatorChannel
 
 from webserver.common.api import compileObservableHistoBuffers, compileTunableHistoBuffers
 
@@ -651,7 +652,7 @@ class LabSocketInterface(APIInterface):
 
 		# Open required bus channels if not already open
 		if not self.ipolChannel:
-			self.ipolChannel = Config.IBUS.openChannel("interpolate")
+			self.ipolChannel = openInterpolatorChannel(Config.IBUS, Config.IPOL_SHARDS)
 		if not self.jobChannel:
 			self.jobChannel = Config.IBUS.openChannel("jobs")
 
@@ -749,11 +750,18 @@ class LabSocketInterface(APIInterface):
 			# Send status
 			self.sendStatus("Processing interpolation")
 
-			# Fetch InterpolatableCollection from data
-			histos = InterpolatableCollection.fromPack( ans['data'] )
+			# Exact matches carry the results of a completed job with the same tune
+			if ans['exact']:
+				histos = IntermediateHistogramCollection.fromPack( ans['data'] )
+				histos = dict([ (k, h.toHistogram()) for (k, h) in histos.iteritems() ])
+
+			else:
+
+				# Fetch InterpolatableCollection from data
+				histos = InterpolatableCollection.fromPack( ans['data'] )
 
-			# Re-generate histogram from coefficients
-			histos.regenHistograms()
+				# Re-generate histogram from coefficients
+				histos.regenHistograms()
 
 			# Pack histograms
 			histoBuffers = []
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+################################################################
+# LiveQ - An interactive volunteering computing batch system
+# Copyright (C) 2013 Ioannis Charalampidis
+# 
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+################################################################
+
+# Regression test of the vectorized Histogram.chi2ToReference and
+# Histogram.chi2ToReferenceStack against the original per-bin loop,
+# using the reference data shipped in the schema directory.
+
+# ----------
+import os
+import sys
+sys.path.append("%s/liveq-common" % os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+# ----------
+
+import glob
+import shutil
+import tarfile
+import tempfile
+import numpy
+
+from liveq.data.histo import Histogram
+
+#: The base directory of the schema data
+SCHEMA_DIR = "%s/schema" % os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+def chi2Loop(histo, refHisto, uncertainty=0.05):
+	"""
+	The original (per-bin loop) implementation of Histogram.chi2ToReference
+	"""
+
+	# If me or refHist is empty, do nothing
+	if (refHisto.bins == 0) or (histo.bins == 0):
+		return 0.0
+
+	# Validate binsize
+	if refHisto.bins != histo.bins:
+		raise ValueError("The specified reference histogram does not have the same bin size!")
+
+	# Prepare vars
+	Chi2 = 0;
+	N = 0;
+
+	# handle bins
+	for i in range(0, histo.bins):
+
+		# Require same bins filled
+		if (histo.y[i] == 0) and (refHisto.y[i] == 0):
+			return -11
+
+		# Skip empty bins
+		if (histo.y[i] == 0) or (refHisto.y[i] == 0):
+			continue
+
+		Theory = histo.y[i]
+		Data = refHisto.y[i]
+
+		if Theory > Data:
+			Sigma_theory = histo.yErrMinus[i]
+			Sigma_data = refHisto.yErrPlus[i]
+		else:
+			Sigma_theory = histo.yErrPlus[i]
+			Sigma_data = refHisto.yErrMinus[i]
+
+		nomin = (Theory - Data) * (Theory - Data)
+		denom = Sigma_data * Sigma_data + Sigma_theory * Sigma_theory + (uncertainty*Theory) * (uncertainty*Theory)
+
+		if denom == 0:
+			raise ValueError("Unexpected division by zero!")
+
+		X = nomin/denom
+
+		Chi2 += X
+		N += 1
+
+	if N == 0:
+		raise ValueError("No bins to compare!")
+
+	return Chi2/N
+
+def chi2OrNaN(f, histo, refHisto):
+	"""
+	Call the given chi2 function, converting exceptions to NaN
+	"""
+	try:
+		return f(histo, refHisto)
+	except ValueError:
+		return numpy.nan
+
+def loadHistograms(tarFilename, baseDir):
+	"""
+	Extract and load all the histograms in the given tarball
+	"""
+	tarfile.open(tarFilename).extractall(baseDir)
+	ans = { }
+	for fn in glob.glob("%s/*.dat" % baseDir):
+		histo = Histogram.fromFLAT(fn)
+		if histo:
+			ans[os.path.basename(fn)] = histo.normalize(copy=False)
+	return ans
+
+def perturb(histo, seed):
+	"""
+	Create a copy of the histogram with random empty bins and zero errors,
+	in order to exercise all the special cases
+	"""
+	rnd = numpy.random.RandomState(seed)
+	h = histo.copy()
+	h.y[ rnd.rand(h.bins) < 0.1 ] = 0.0
+	if rnd.rand() < 0.2:
+		z = rnd.rand(h.bins) < 0.3
+		h.yErrPlus[z] = 0.0
+		h.yErrMinus[z] = 0.0
+	return h
+
+# Load the MC and the experimental reference data
+tmpDir = tempfile.mkdtemp()
+try:
+	mc = loadHistograms("%s/ref-pythia8-default.tar.bz2" % SCHEMA_DIR, "%s/mc" % tmpDir)
+	data = loadHistograms("%s/ref-experiments.tar.bz2" % SCHEMA_DIR, "%s/data" % tmpDir)
+finally:
+	shutil.rmtree(tmpDir)
+
+# Build the comparison pairs
+pairs = [ ]
+for k, h in mc.iteritems():
+	if k in data:
+		pairs.append( (h, data[k]) )
+		pairs.append( (perturb(h, len(pairs)), perturb(data[k], len(pairs)+1)) )
+		pairs.append( (h, perturb(h, len(pairs))) )
+
+# Compare one-by-one
+failed = 0
+expected = [ ]
+for (h, ref) in pairs:
+	a = chi2OrNaN(chi2Loop, h, ref)
+	b = chi2OrNaN(Histogram.chi2ToReference, h, ref)
+	expected.append(a)
+	if not ((numpy.isnan(a) and numpy.isnan(b)) or numpy.allclose(a, b, rtol=1e-10, atol=0)):
+		print "FAIL: %s: loop=%r, vectorized=%r" % (h.name, a, b)
+		failed += 1
+
+# Compare stacked
+stacked = Histogram.chi2ToReferenceStack( [ p[0] for p in pairs ], [ p[1] for p in pairs ] )
+if not numpy.allclose(stacked, expected, rtol=1e-10, atol=0, equal_nan=True):
+	print "FAIL: Stacked chi2 values do not match"
+	failed += 1
+
+# Report
+print "Compared %i histogram pairs (%i errors, %i empty), %i failures" % (
+	len(pairs), numpy.sum(numpy.isnan(expected)), numpy.sum(numpy.array(expected) == -11), failed)
+sys.exit(1 if failed else 0)
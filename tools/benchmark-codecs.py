@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# LiveQ - An interactive volunteering computing batch system
+# Copyright (C) 2013 Ioannis Charalampidis
+# 
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+################################################################
+
+
+# This script benchmarks the histogram compression codecs on real
+# MCPlots job tarballs or on histogram dumps (results/job-*.bin)
+
+# ----------
+import os
+import sys
+sys.path.append("%s/liveq-common" % os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+# ----------
+
+import time
+import tarfile
+
+from liveq.data.histo import compression
+from liveq.data.histo.intermediate import IntermediateHistogramCollection
+
+# Validate arguments
+if len(sys.argv) < 2:
+	print "ERROR: Please specify one or more MCPlots tarballs or histogram dumps!"
+	print "Usage: benchmark-codecs.py [tarball|dump] ..."
+	sys.exit(1)
+
+# Number of times to repeat each measurement
+REPEAT = 5
+
+# Load the raw (uncompressed) buffers of all the collections
+buffers = [ ]
+for fn in sys.argv[1:]:
+	try:
+		if tarfile.is_tarfile(fn):
+			f = tarfile.open(fn)
+			histos = IntermediateHistogramCollection.fromTarfile(f)
+			f.close()
+		else:
+			histos = IntermediateHistogramCollection.fromPackFile(fn)
+	except Exception as e:
+		print "WARNING: Could not load %s: %s" % (fn, str(e))
+		continue
+
+	# Skip empty collections
+	if len(histos) == 0:
+		continue
+	buffers.append( histos.pack(encode=False, compress=False) )
+
+# Make sure we have something to benchmark
+if not buffers:
+	print "ERROR: No histogram collections could be loaded!"
+	sys.exit(2)
+
+# Total size of the raw data
+totalSize = sum([ len(b) for b in buffers ])
+print "Collections: %i, raw size: %.2f MB" % (len(buffers), totalSize / 1048576.0)
+print ""
+print "%-8s %14s %14s %8s" % ("Codec", "Compress MB/s", "Decomp. MB/s", "Ratio")
+
+# Benchmark every available codec
+for cid in sorted(compression.CODECS.keys()):
+	name = compression.CODECS[cid][0]
+
+	# Compress
+	t0 = time.time()
+	for i in range(REPEAT):
+		packed = [ compression.compress(b, cid) for b in buffers ]
+	tCompress = (time.time() - t0) / REPEAT
+
+	# Decompress
+	t0 = time.time()
+	for i in range(REPEAT):
+		for b in packed:
+			compression.decompress(b)
+	tDecompress = (time.time() - t0) / REPEAT
+
+	# Report
+	packedSize = sum([ len(b) for b in packed ])
+	print "%-8s %14.1f %14.1f %8.2f" % (
+			name,
+			totalSize / 1048576.0 / max(tCompress, 1e-9),
+			totalSize / 1048576.0 / max(tDecompress, 1e-9),
+			float(totalSize) / packedSize
+		)
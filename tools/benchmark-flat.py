@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# LiveQ - An interactive volunteering computing batch system
+# Copyright (C) 2013 Ioannis Charalampidis
+# 
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+################################################################
+
+
+# This script benchmarks the FLAT parser and the histogram readers
+# on MCPlots sample dumps (directories with .dat files or job tarballs)
+
+# ----------
+import os
+import sys
+sys.path.append("%s/liveq-common" % os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+# ----------
+
+import glob
+import time
+import tarfile
+import StringIO
+
+from liveq.utils.FLAT import parseFLATBuffer
+from liveq.data.histo import Histogram
+from liveq.data.histo.intermediate import IntermediateHistogram
+
+# Validate arguments
+if len(sys.argv) < 2:
+	print "ERROR: Please specify one or more MCPlots dump directories, .dat files or tarballs!"
+	print "Usage: benchmark-flat.py [directory|file|tarball] ..."
+	sys.exit(1)
+
+# Number of times to repeat each measurement
+REPEAT = 5
+
+# Load the contents of all the FLAT files in memory
+buffers = [ ]
+for fn in sys.argv[1:]:
+	if os.path.isdir(fn):
+		for f in glob.glob("%s/*.dat" % fn):
+			with open(f, 'r') as fd:
+				buffers.append( fd.read() )
+	elif tarfile.is_tarfile(fn):
+		f = tarfile.open(fn)
+		for name in f.getnames():
+			if name.endswith(".dat"):
+				buffers.append( f.extractfile(name).read() )
+		f.close()
+	else:
+		with open(fn, 'r') as fd:
+			buffers.append( fd.read() )
+
+# Make sure we have something to benchmark
+if not buffers:
+	print "ERROR: No FLAT files could be loaded!"
+	sys.exit(2)
+
+# Total size of the data
+totalSize = sum([ len(b) for b in buffers ])
+print "Files: %i, size: %.2f MB" % (len(buffers), totalSize / 1048576.0)
+print ""
+print "%-24s %12s %12s" % ("Reader", "Files/s", "MB/s")
+
+def benchmark(title, fn):
+	"""
+	Run the given function on all buffers and report the throughput
+	"""
+	t0 = time.time()
+	for i in range(REPEAT):
+		for b in buffers:
+			fn(b)
+	t = max((time.time() - t0) / REPEAT, 1e-9)
+	print "%-24s %12.1f %12.2f" % (title, len(buffers) / t, totalSize / 1048576.0 / t)
+
+def readHistogram(b):
+	"""
+	Read a histogram, ignoring files with no HISTOGRAM section
+	"""
+	try:
+		Histogram.fromFLAT( StringIO.StringIO(b) )
+	except Exception:
+		pass
+
+def readIntermediateHistogram(b):
+	"""
+	Read an intermediate histogram, ignoring files with no HISTOSTATS section
+	"""
+	try:
+		IntermediateHistogram.fromFLAT( StringIO.StringIO(b) )
+	except Exception:
+		pass
+
+# Run benchmarks
+benchmark("parseFLATBuffer", parseFLATBuffer)
+benchmark("Histogram", readHistogram)
+benchmark("IntermediateHistogram", readIntermediateHistogram)
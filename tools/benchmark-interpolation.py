@@ -0,0 +1,329 @@
+#!/usr/bin/env python
+# LiveQ - An interactive volunteering computing batch system
+# Copyright (C) 2013 Ioannis Charalampidis
+# 
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+################################################################
+
+
+# This script benchmarks the interpolator against an in-memory store, using
+# a synthetic set of histograms or a recorded set of interpolatable collections.
+# It measures the append throughput, the interpolator build time, the per-call
+# evaluation latency and the accuracy against held-out exact runs, and it can
+# write the results as JSON for tracking regressions.
+#
+# The cached look-up is measured while moving the tune across its neighborhood
+# bin, like a slider does, together with the number of interpolators built
+# for the tunes of the same bin.
+#
+# Usage: benchmark-interpolation.py [options]
+#
+#  -o <file>       Write the results as JSON to the given file
+#  -d <dir>        Use the recorded collections (*.ipol) in the given directory
+#  -w <dir>        Write the synthetic collections to the given directory
+#  -n <list>       Comma-separated numbers of samples to store (50,100,200)
+#  -f <list>       Comma-separated RBF kernels (linear,cubic,multiquadric)
+#  -m <list>       Comma-separated maxSamples values (20,50,100)
+#  -k <num>        Number of held-out exact runs (20)
+#  -r <num>        Evaluations per held-out run for latency (5)
+#  -t <num>        Tune steps across the bin for the cached look-up (20)
+#  -s <num>        Random seed (1)
+
+# ----------
+import os
+import sys
+basePath = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append("%s/liveq-common" % basePath)
+sys.path.append("%s/liveq-interpolator" % basePath)
+# ----------
+
+import glob
+import json
+import time
+import getopt
+import platform
+import StringIO
+import numpy as np
+
+from liveq.classes.store.memory import MemoryStore
+from liveq.config.tuneaddressing import TuneAddressingConfig
+from liveq.data.tune import Tune
+from liveq.data.histo import Histogram
+from liveq.data.histo.interpolate import InterpolatableCollection
+
+from interpolator.config import Config
+from interpolator.data.store import HistogramStore, ModelCache, SampleIndex
+
+#: The lab ID used for the synthetic data
+LAB_ID = "benchmark"
+
+#: The tunable parameters of the synthetic data
+TUNE_KEYS = [ 'a', 'b', 'c' ]
+
+#: The neighborhood bin width of the synthetic tunable parameters
+TUNE_BIN = 0.25
+
+#: Number of histograms and bins of the synthetic data
+NUM_HISTOS = 10
+NUM_BINS = 20
+
+#: The polynomial fit degree used for the synthetic data
+FIT_DEGREE = 6
+
+def synthHistograms(tune):
+	"""
+	Return a list of smooth, normalized histograms that depend on the tune
+	"""
+	x = (np.arange(NUM_BINS) + 0.5) / NUM_BINS
+	ans = [ ]
+	for i in range(0, NUM_HISTOS):
+		y = np.abs(
+				np.sin( x * np.pi ) * (
+					np.sin( tune['a'] * 1.3 + i ) +
+					np.cos( tune['b'] * 2.1 + x * (i+1) ) +
+					np.sin( tune['c'] * 0.7 * x + 0.4 * i )
+				)
+			) + 0.1
+		histo = Histogram(
+				name="/BENCHMARK/h%02i" % i,
+				bins=NUM_BINS,
+				y=y,
+				yErrPlus=y * 0.05,
+				yErrMinus=y * 0.05,
+				x=x,
+				xErrPlus=np.repeat(0.5 / NUM_BINS, NUM_BINS),
+				xErrMinus=np.repeat(0.5 / NUM_BINS, NUM_BINS),
+			)
+		ans.append( histo.normalize() )
+	return ans
+
+def synthCollections(num, rnd):
+	"""
+	Return the given number of synthetic interpolatable collections
+	"""
+	ans = [ ]
+	for i in range(0, num):
+		tune = Tune(dict(zip( TUNE_KEYS, rnd.rand(len(TUNE_KEYS)) )), labid=LAB_ID)
+		ic = InterpolatableCollection(tune=tune)
+		for h in synthHistograms(tune):
+			ic.append(h)
+		ic.regenFits( fitDegree=dict([ (h, FIT_DEGREE) for h in ic.keys() ]) )
+		ans.append(ic)
+	return ans
+
+def loadCollections(path):
+	"""
+	Load the recorded collections from the given directory
+	"""
+	ans = [ ]
+	for fn in sorted(glob.glob("%s/*.ipol" % path)):
+		with open(fn, 'r') as f:
+			ic = InterpolatableCollection.fromPack( f.read() )
+		ic.regenHistograms()
+		ans.append(ic)
+	return ans
+
+def percentiles(values):
+	"""
+	Return the p50/p99 of the given timings, in milliseconds
+	"""
+	if not values:
+		return { 'p50': None, 'p99': None }
+	return {
+		'p50': float(np.percentile(values, 50)) * 1000.0,
+		'p99': float(np.percentile(values, 99)) * 1000.0
+	}
+
+def resetStore():
+	"""
+	Start with an empty store and no cached state
+	"""
+	Config.STORE = MemoryStore()
+	ModelCache.clear()
+	SampleIndex.INDICES.clear()
+	HistogramStore.CHECKED_LEGACY.clear()
+
+def appendAll(collections):
+	"""
+	Append all the collections in the store and return the time it took
+	"""
+
+	# Silence the debug output of the store
+	stdout = sys.stdout
+	sys.stdout = StringIO.StringIO()
+	try:
+		t0 = time.time()
+		for ic in collections:
+			HistogramStore.append(ic)
+		return time.time() - t0
+	finally:
+		sys.stdout = stdout
+
+def binSteps(tune, steps):
+	"""
+	Return the given number of tunes that move diagonally across the
+	neighborhood bin of the given tune
+	"""
+	addressing = tune.getAddressing()
+	center = addressing.binCenter(tune.getValues())
+	ans = [ ]
+	for f in np.linspace(-0.49, 0.49, steps):
+		values = center + addressing.valueBins * f
+		ans.append( Tune(dict(zip( sorted(tune.keys()), values )), labid=tune.labid) )
+	return ans
+
+def benchmark(training, heldOut, function, maxSamples, repeat, steps):
+	"""
+	Benchmark the interpolation of the held-out runs
+	"""
+
+	tBuild = [ ]
+	tLookup = [ ]
+	models = [ ]
+	tEval = [ ]
+	chi2 = [ ]
+	samples = [ ]
+	for ref in heldOut:
+		values = ref.tune.getValues()
+
+		# Build an interpolator from scratch
+		ModelCache.clear()
+		t0 = time.time()
+		ipol = HistogramStore.getInterpolator(ref.tune, function=function, maxSamples=maxSamples)
+		tBuild.append( time.time() - t0 )
+		if ipol is None:
+			continue
+		samples.append( ipol.N )
+
+		# Get the cached interpolator while moving the tune in its bin
+		for tune in binSteps(ref.tune, steps):
+			t0 = time.time()
+			HistogramStore.getInterpolator(tune, function=function, maxSamples=maxSamples)
+			tLookup.append( time.time() - t0 )
+		models.append( len(ModelCache.CACHE) )
+
+		# Evaluate
+		for i in range(0, repeat):
+			t0 = time.time()
+			ans = ipol(*values)
+			tEval.append( time.time() - t0 )
+
+		# Compare to the exact run
+		ans.regenHistograms()
+		names = sorted(ref.keys())
+		scores = Histogram.chi2ToReferenceStack( [ ans[n] for n in names ], [ ref[n] for n in names ] )
+		chi2.append( float(np.nanmean(scores)) )
+
+	# Return results
+	return {
+		'function': function,
+		'maxsamples': maxSamples,
+		'samples': float(np.mean(samples)) if samples else 0,
+		'build_ms': percentiles(tBuild),
+		'lookup_ms': percentiles(tLookup),
+		'models_per_bin': float(np.mean(models)) if models else 0,
+		'eval_ms': percentiles(tEval),
+		'chi2_mean': float(np.mean(chi2)) if chi2 else None,
+		'chi2_p99': float(np.percentile(chi2, 99)) if chi2 else None
+	}
+
+# Parse arguments
+try:
+	(opts, args) = getopt.getopt(sys.argv[1:], "o:d:w:n:f:m:k:r:s:t:")
+except getopt.GetoptError as e:
+	print "ERROR: %s" % str(e)
+	sys.exit(1)
+opts = dict(opts)
+outFile = opts.get('-o', None)
+sampleCounts = [ int(x) for x in opts.get('-n', "50,100,200").split(",") ]
+functions = opts.get('-f', "linear,cubic,multiquadric").split(",")
+maxSamplesList = [ int(x) for x in opts.get('-m', "20,50,100").split(",") ]
+numHeldOut = int(opts.get('-k', 20))
+repeat = int(opts.get('-r', 5))
+steps = int(opts.get('-t', 20))
+seed = int(opts.get('-s', 1))
+rnd = np.random.RandomState(seed)
+
+# Load or create the data
+if '-d' in opts:
+	collections = loadCollections(opts['-d'])
+	if not collections:
+		print "ERROR: No recorded collections found in %s!" % opts['-d']
+		sys.exit(2)
+	rnd.shuffle(collections)
+	Tune.LAB_TUNE_KEYS[collections[0].tune.labid] = sorted(collections[0].tune.keys())
+else:
+	Tune.LAB_TUNE_KEYS[LAB_ID] = sorted(TUNE_KEYS)
+	for k in TUNE_KEYS:
+		TuneAddressingConfig.TUNE_CONFIG[k] = { 'round': TUNE_BIN, 'decimals': 0, 'alias': k }
+	collections = synthCollections(max(sampleCounts) + numHeldOut, rnd)
+
+# Write the synthetic data if asked to
+if '-w' in opts:
+	if not os.path.isdir(opts['-w']):
+		os.makedirs(opts['-w'])
+	for i in range(0, len(collections)):
+		with open("%s/%05i.ipol" % (opts['-w'], i), 'w') as f:
+			f.write( collections[i].pack() )
+
+# Split held-out runs
+heldOut = collections[0:numHeldOut]
+training = collections[numHeldOut:]
+
+# Run benchmarks
+results = [ ]
+print "%7s %-12s %6s %9s %9s %9s %9s %9s %9s %6s %10s" % (
+		"Samples", "Function", "MaxS", "Append/s", "Build p50", "Build p99", "Eval p50", "Eval p99", "Lookup", "Models", "Chi2"
+	)
+for numSamples in sampleCounts:
+
+	# Fill store
+	resetStore()
+	tAppend = appendAll(training[0:numSamples])
+	appendRate = min(numSamples, len(training)) / max(tAppend, 1e-9)
+
+	# Benchmark every combination
+	for function in functions:
+		for maxSamples in maxSamplesList:
+			res = benchmark(training[0:numSamples], heldOut, function, maxSamples, repeat, steps)
+			res['stored'] = min(numSamples, len(training))
+			res['append_per_sec'] = appendRate
+			results.append(res)
+
+			# Report
+			print "%7i %-12s %6i %9.1f %9.2f %9.2f %9.3f %9.3f %9.3f %6.1f %10.4f" % (
+					res['stored'], function, maxSamples, appendRate,
+					res['build_ms']['p50'], res['build_ms']['p99'],
+					res['eval_ms']['p50'], res['eval_ms']['p99'],
+					res['lookup_ms']['p50'], res['models_per_bin'],
+					res['chi2_mean'] if res['chi2_mean'] is not None else float('nan')
+				)
+
+# Write machine-readable results
+if outFile:
+	with open(outFile, 'w') as f:
+		json.dump({
+			'timestamp': time.time(),
+			'python': platform.python_version(),
+			'numpy': np.__version__,
+			'seed': seed,
+			'heldout': len(heldOut),
+			'repeat': repeat,
+			'steps': steps,
+			'data': opts.get('-d', 'synthetic'),
+			'results': results
+		}, f, indent=2)
+	print ""
+	print "Results written to %s" % outFile
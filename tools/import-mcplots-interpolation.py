@@ -41,6 +41,8 @@ from liveq import handleSIGINT, exit
 from liveq.events import GlobalEvents
 from liveq.exceptions import ConfigException
 from liveq.component import Component
+from liveq.io.bus import BinaryPayload
+from liveq.io.shardedchannel import openInterpolatorChannel
 
 from liveq.data.histo import Histogram
 from liveq.data.histo.intermediate import IntermediateHistogramCollection
@@ -311,7 +313,9 @@ class TarImport(Component):
 
 		# Send the resulting data to the interpolation database
 		self.ipolChannel.send("results", {
-				'data': res.pack()
+				'lab': self.lab.uuid,
+				'parameters': tuneParam,
+				'data': BinaryPayload(res.pack(encode=False))
 			}, waitReply=True)
 
 	def run(self):
@@ -320,7 +324,7 @@ class TarImport(Component):
 		"""
 
 		# Open the interpolator channel were we are dumping the final results
-		self.ipolChannel = Config.IBUS.openChannel("interpolate")
+		self.ipolChannel = openInterpolatorChannel(Config.IBUS, Config.IPOL_SHARDS)
 
 		# Run component
 		time.sleep(1)
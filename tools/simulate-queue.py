@@ -0,0 +1,296 @@
+#!/usr/bin/env python
+# LiveQ - An interactive volunteering computing batch system
+# Copyright (C) 2013 Ioannis Charalampidis
+# 
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+################################################################
+
+# This script replays a trace of job submissions against the job queue of
+# the job manager and reports the distribution of the time the jobs of every
+# user and team waited in the queue, in order to compare the queueing policies
+# and tune the weights, the aging and the admission limits of the fair queue.
+#
+# The trace contains one JSON object per line, with the submission time (in
+# seconds), the team and user IDs, the agent group and the job duration:
+#
+#  {"time": 0, "team": 1, "user": 12, "group": "global", "duration": 600}
+#
+# Every job runs on a single agent of its group for its duration.
+#
+# Usage: simulate-queue.py [options]
+#
+#  -t <file>       Replay the trace in the given file
+#  -x <file>       Write the synthetic trace to the given file
+#  -o <file>       Write the results as JSON to the given file
+#  -p <list>       Comma-separated queueing policies (fifo,wfq)
+#  -a <num>        Number of agents in every group (20)
+#  -n <num>        Number of synthetic jobs (500)
+#  -u <num>        Number of synthetic users, in teams of 3 (10)
+#  -f <frac>       Fraction of the synthetic jobs submitted by one user at once (0.5)
+#  -d <sec>        Mean duration of the synthetic jobs (600)
+#  -W <list>       Queue weights (ex. team:1=2,user:12=0.5)
+#  -A <sec>        Queue aging, 0 to disable (300)
+#  -L <num>        Maximum queued jobs per user, 0 for no limit (0)
+#  -T <num>        Maximum queued jobs per team, 0 for no limit (0)
+#  -s <num>        Random seed (1)
+
+# ----------
+import os
+import sys
+basePath = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append("%s/liveq-common" % basePath)
+sys.path.append("%s/liveq-jobmanager" % basePath)
+# ----------
+
+import json
+import time
+import heapq
+import getopt
+import random
+import numpy as np
+
+from liveq.classes.store.memory import MemoryStore
+
+from jobmanager.config import Config
+import jobmanager.io.fairqueue as fairqueue
+
+def synthTrace(numJobs, numUsers, floodFraction, meanDuration, rnd):
+	"""
+	Create a trace where one user submits a burst of jobs at once, while
+	the rest of the users submit their jobs at a steady rate
+	"""
+
+	# The flooding user
+	numFlood = int(numJobs * floodFraction)
+	trace = [ { 'time': 0.0, 'team': 1, 'user': 1, 'group': 'global', 'duration': rnd.expovariate(1.0 / meanDuration) } for i in range(numFlood) ]
+
+	# The rest of the users, submitting during the time it
+	# takes to run the burst on 20 agents
+	span = max(numJobs * meanDuration / 20.0, 1.0)
+	for i in range(numJobs - numFlood):
+		user = rnd.randint(2, max(numUsers, 2))
+		trace.append({
+				'time': rnd.uniform(0, span),
+				'team': 1 + (user - 1) / 3,
+				'user': user,
+				'group': 'global',
+				'duration': rnd.expovariate(1.0 / meanDuration)
+			})
+
+	# Return in time order
+	trace.sort(key=lambda x: x['time'])
+	return trace
+
+def loadTrace(filename):
+	"""
+	Load the trace from the given file
+	"""
+	trace = [ ]
+	with open(filename, 'r') as f:
+		for line in f:
+			if line.strip():
+				trace.append( json.loads(line) )
+	trace.sort(key=lambda x: x['time'])
+	return trace
+
+def percentiles(values):
+	"""
+	Return the distribution of the given wait times (in seconds)
+	"""
+	if not values:
+		return { 'jobs': 0 }
+	return {
+		'jobs': len(values),
+		'mean': float(np.mean(values)),
+		'p50': float(np.percentile(values, 50)),
+		'p90': float(np.percentile(values, 90)),
+		'p99': float(np.percentile(values, 99)),
+		'max': float(np.max(values))
+	}
+
+class FIFOQueue:
+	"""
+	The original queue of the job manager: one list per group
+	"""
+
+	def __init__(self):
+		self.queues = { }
+
+	def enqueue(self, group, jid, team, user, now):
+		self.queues.setdefault(group, [ ]).append(jid)
+		return True
+
+	def pop(self, group):
+		queue = self.queues.get(group, [ ])
+		if not queue:
+			return None
+		return queue.pop(0)
+
+class FairQueue:
+	"""
+	The weighted fair queue of the job manager, on an in-memory store
+	"""
+
+	def __init__(self):
+		Config.STORE = MemoryStore()
+		fairqueue.migratedGroups.clear()
+
+	def enqueue(self, group, jid, team, user, now):
+		return fairqueue.enqueue(group, jid, team, user, now)
+
+	def pop(self, group):
+		return fairqueue.pop(group)
+
+def simulate(trace, queue, numAgents):
+	"""
+	Replay the trace on the given queue, returning the wait time of every
+	job as a (team, user, wait) tuple and the number of rejected jobs
+	"""
+
+	# The (time, order, event, job index) heap
+	events = [ (job['time'], i, 'submit', i) for (i, job) in enumerate(trace) ]
+	heapq.heapify(events)
+	order = len(trace)
+
+	# Free agents per group
+	free = dict([ (job['group'], numAgents) for job in trace ])
+
+	waits = [ ]
+	rejected = 0
+	while events:
+		(now, _, event, i) = heapq.heappop(events)
+		job = trace[i]
+		group = job['group']
+
+		# Submit or complete
+		if event == 'submit':
+			if not queue.enqueue(group, str(i), job['team'], job['user'], now):
+				rejected += 1
+				continue
+		else:
+			free[group] += 1
+
+		# Start as many jobs as the free agents
+		while free[group] > 0:
+			jid = queue.pop(group)
+			if jid is None:
+				break
+			started = trace[int(jid)]
+			waits.append( (started['team'], started['user'], now - started['time']) )
+			free[group] -= 1
+			order += 1
+			heapq.heappush(events, (now + started['duration'], order, 'complete', int(jid)))
+
+	# Return waits
+	return (waits, rejected)
+
+def report(waits):
+	"""
+	Return the wait time distributions, overall and per team and user
+	"""
+	teams = { }
+	users = { }
+	for (team, user, wait) in waits:
+		teams.setdefault(str(team), [ ]).append(wait)
+		users.setdefault(str(user), [ ]).append(wait)
+	return {
+		'all': percentiles([ w for (t, u, w) in waits ]),
+		'teams': dict([ (k, percentiles(v)) for (k, v) in teams.items() ]),
+		'users': dict([ (k, percentiles(v)) for (k, v) in users.items() ])
+	}
+
+# Parse arguments
+try:
+	(opts, args) = getopt.getopt(sys.argv[1:], "t:x:o:p:a:n:u:f:d:W:A:L:T:s:")
+except getopt.GetoptError as e:
+	print "ERROR: %s" % str(e)
+	sys.exit(1)
+opts = dict(opts)
+outFile = opts.get('-o', None)
+policies = opts.get('-p', "fifo,wfq").split(",")
+numAgents = int(opts.get('-a', 20))
+seed = int(opts.get('-s', 1))
+rnd = random.Random(seed)
+
+# Configure the fair queue
+Config.QUEUE_AGING = float(opts.get('-A', 300))
+Config.QUEUE_USER_LIMIT = int(opts.get('-L', 0))
+Config.QUEUE_TEAM_LIMIT = int(opts.get('-T', 0))
+Config.QUEUE_WEIGHTS = { }
+for entry in opts.get('-W', "").split(","):
+	if entry.strip():
+		(key, weight) = entry.split("=")
+		Config.QUEUE_WEIGHTS[key.strip()] = float(weight)
+
+# Load or create the trace
+if '-t' in opts:
+	trace = loadTrace(opts['-t'])
+	if not trace:
+		print "ERROR: The trace %s is empty!" % opts['-t']
+		sys.exit(2)
+else:
+	trace = synthTrace(int(opts.get('-n', 500)), int(opts.get('-u', 10)), float(opts.get('-f', 0.5)), float(opts.get('-d', 600)), rnd)
+
+# Write the synthetic trace if asked to
+if '-x' in opts:
+	with open(opts['-x'], 'w') as f:
+		for job in trace:
+			f.write( json.dumps(job) + "\n" )
+
+# Run simulations
+results = { }
+print "%-6s %-10s %6s %9s %9s %9s %9s %9s" % ( "Policy", "User", "Jobs", "Mean", "p50", "p90", "p99", "Max" )
+for policy in policies:
+	if policy == "fifo":
+		queue = FIFOQueue()
+	elif policy == "wfq":
+		queue = FairQueue()
+	else:
+		print "ERROR: Unknown policy %s" % policy
+		sys.exit(1)
+
+	# Simulate
+	(waits, rejected) = simulate(trace, queue, numAgents)
+	res = report(waits)
+	res['rejected'] = rejected
+	results[policy] = res
+
+	# Report the users and the overall distribution
+	for (name, dist) in sorted(res['users'].items(), key=lambda x: int(x[0]) if x[0].isdigit() else x[0]) + [ ("all", res['all']) ]:
+		if dist['jobs'] == 0:
+			continue
+		print "%-6s %-10s %6i %9.1f %9.1f %9.1f %9.1f %9.1f" % (
+				policy, name, dist['jobs'], dist['mean'], dist['p50'], dist['p90'], dist['p99'], dist['max']
+			)
+	if rejected:
+		print "%-6s %i jobs were rejected" % (policy, rejected)
+
+# Write machine-readable results
+if outFile:
+	with open(outFile, 'w') as f:
+		json.dump({
+			'timestamp': time.time(),
+			'seed': seed,
+			'agents': numAgents,
+			'trace': opts.get('-t', 'synthetic'),
+			'jobs': len(trace),
+			'weights': Config.QUEUE_WEIGHTS,
+			'aging': Config.QUEUE_AGING,
+			'user_limit': Config.QUEUE_USER_LIMIT,
+			'team_limit': Config.QUEUE_TEAM_LIMIT,
+			'results': results
+		}, f, indent=2)
+	print ""
+	print "Results written to %s" % outFile